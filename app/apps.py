@@ -1,6 +1,34 @@
+import os
+import sys
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def is_server_process():
+    """Whether this process serves requests, rather than running another manage.py command
+
+    Under runserver only the autoreloader's child serves; WSGI/ASGI servers
+    such as gunicorn import the app without manage.py.
+    """
+    if os.path.basename(sys.argv[0]) != 'manage.py':
+        return True
+    return sys.argv[1:2] == ['runserver'] and os.environ.get('RUN_MAIN') == 'true'
 
 
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        if settings.MONGODB_QUERY_ACCOUNTING:
+            from app.utils.query_log import install_query_listener
+            install_query_listener()
+        if settings.PROFILING_CONTINUOUS:
+            from app.utils.profiling import start_continuous_profiling
+            start_continuous_profiling()
+        if settings.MONGODB_ENSURE_SCHEMA_ON_STARTUP:
+            from app.utils.schema import ensure_schema_in_background
+            ensure_schema_in_background()
+        if settings.WARMUP_ON_STARTUP and is_server_process():
+            from app.utils.health import start_warm_up
+            start_warm_up()
@@ -0,0 +1,186 @@
+from django.core.management.base import BaseCommand, CommandError
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import json
+import platform
+import random
+import subprocess
+import time
+from django.test import Client, override_settings
+from app.management.commands.generate_data import generate_events, generate_quotes
+from app.utils.benchmark import disposable_store, fake_upstreams, summarize_latencies
+
+# (name, path) of every page and API endpoint measured; {event_id} is filled in after seeding
+ENDPOINTS = [
+    ('index', '/'),
+    ('calendar_view', '/calendar-events/'),
+    ('calendar_grid', '/calendar/grid/'),
+    ('priority_agenda', '/events/agenda/?priority=high&days=30'),
+    ('search_events', '/events/search/?q=meeting'),
+    ('event_changes', '/events/changes/?since=0'),
+    ('get_event', '/event/{event_id}/'),
+    ('location_by_coords', '/get-location-by-coords/?lat=13.08&lon=80.27'),
+    ('export_ics', '/events/export.ics'),
+]
+
+class Command(BaseCommand):
+    help = 'Measures latency percentiles and throughput of the dashboard views and APIs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--storage',
+            choices=['sqlite', 'mongodb'],
+            default='sqlite',
+            help='Seed a temporary SQLite store (in process) or a throwaway MongoDB database'
+        )
+        parser.add_argument(
+            '--sizes',
+            default='100,1000,10000',
+            help='Comma-separated numbers of events to benchmark with'
+        )
+        parser.add_argument('--requests', type=int, default=50, help='Requests per endpoint and size')
+        parser.add_argument('--concurrency', type=int, default=1, help='Requests in flight at once')
+        parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per endpoint first')
+        parser.add_argument('--latency', type=float, default=0.02, help='Fake upstream latency in seconds')
+        parser.add_argument('--jitter', type=float, default=0.01, help='Extra random upstream latency in seconds')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of upstream calls that fail')
+        parser.add_argument(
+            '--only',
+            action='append',
+            choices=[name for name, _ in ENDPOINTS],
+            help='Benchmark only this endpoint (may be repeated)'
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Seed for the generated data')
+        parser.add_argument('--output', help='Write the results to this JSON file (a baseline)')
+        parser.add_argument('--compare', help='Compare against a baseline JSON file written earlier')
+        parser.add_argument(
+            '--max-regression',
+            type=float,
+            default=None,
+            help='Fail if any p95 is this many percent slower than the baseline'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers')
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read baseline {options['compare']}: {e}")
+
+        endpoints = [(name, path) for name, path in ENDPOINTS if not options['only'] or name in options['only']]
+        results = {}
+        upstream = dict(latency=options['latency'], jitter=options['jitter'], error_rate=options['error_rate'])
+        try:
+            with fake_upstreams(seed=options['seed'], **upstream), \
+                    override_settings(ALLOWED_HOSTS=['*']):
+                for size in sizes:
+                    with disposable_store(options['storage']) as store:
+                        self.stdout.write(f'\n{size} events ({options["storage"]})')
+                        event_id = self.seed(store, size, options['seed'])
+                        results[str(size)] = self.run_size(endpoints, event_id, options)
+        except CommandError:
+            raise
+        except Exception as e:
+            raise CommandError(f'Benchmark failed: {e}')
+
+        report = {
+            'meta': {
+                'commit': self.git_commit(),
+                'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'storage': options['storage'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'upstream': upstream,
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(report, output_file, indent=2, sort_keys=True)
+            self.stdout.write(f"\nResults written to {options['output']}")
+
+        if baseline is not None:
+            regressions = self.compare(baseline, report, options['max_regression'])
+            if regressions:
+                raise CommandError(f'{len(regressions)} endpoint(s) regressed: {", ".join(regressions)}')
+
+    def seed(self, store, size, seed):
+        rng = random.Random(seed)
+        events = generate_events(rng, size, datetime.date.today(), 180, 180)
+        for start in range(0, len(events), 1000):
+            store.apply_batch([{'op': 'create', 'data': event} for event in events[start:start + 1000]])
+        store.save_quotes(generate_quotes(rng, 50))
+        store.save_preferences({'location': 'Chennai', 'news_category': 'general'})
+        first = next(iter(store.iter_events(batch_size=1)), None)
+        return first['_id'] if first else '0' * 24
+
+    def run_size(self, endpoints, event_id, options):
+        results = {}
+        for name, path in endpoints:
+            path = path.format(event_id=event_id)
+            client = Client()
+
+            def request(_):
+                started = time.perf_counter()
+                response = client.get(path)
+                if getattr(response, 'streaming', False):
+                    # Streaming responses do their work while being consumed
+                    for _chunk in response.streaming_content:
+                        pass
+                return time.perf_counter() - started, response.status_code
+
+            for i in range(options['warmup']):
+                request(i)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                timings = list(pool.map(request, range(options['requests'])))
+            wall = time.perf_counter() - started
+
+            errors = sum(1 for _, status in timings if status >= 500)
+            summary = summarize_latencies([seconds for seconds, _ in timings], wall, errors)
+            results[name] = summary
+            self.stdout.write(
+                f"  {name:<20} p50 {summary['p50_ms']:8.2f} ms  p95 {summary['p95_ms']:8.2f} ms  "
+                f"p99 {summary['p99_ms']:8.2f} ms  {summary['throughput_rps']:8.1f} req/s"
+                + (f'  ({errors} errors)' if errors else '')
+            )
+        return results
+
+    def compare(self, baseline, report, max_regression):
+        """Print p50/p95 changes against a baseline; returns the endpoints over the limit"""
+        self.stdout.write(f"\nCompared with baseline from commit {baseline['meta'].get('commit') or 'unknown'}")
+        regressions = []
+        for size, endpoints in report['results'].items():
+            for name, current in endpoints.items():
+                previous = baseline['results'].get(size, {}).get(name)
+                if not previous:
+                    continue
+                changes = []
+                for metric in ('p50_ms', 'p95_ms'):
+                    before, after = previous[metric], current[metric]
+                    change = (after - before) / before * 100 if before else 0.0
+                    changes.append(f'{metric[:3]} {before:.2f} -> {after:.2f} ms ({change:+.0f}%)')
+                    if metric == 'p95_ms' and max_regression is not None and change > max_regression:
+                        regressions.append(f'{name}@{size}')
+                line = f"  {size:>7} {name:<20} " + '  '.join(changes)
+                self.stdout.write(self.style.ERROR(line) if f'{name}@{size}' in regressions else line)
+        return regressions
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
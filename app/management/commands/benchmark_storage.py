@@ -0,0 +1,96 @@
+from django.core.management.base import BaseCommand, CommandError
+import datetime
+import random
+import time
+from app.utils.benchmark import disposable_store
+
+WORDS = ['team', 'standup', 'dentist', 'planning', 'review', 'lunch', 'gym', 'call',
+         'project', 'doctor', 'school', 'dinner', 'report', 'meeting', 'trip', 'budget']
+LOCATIONS = ['Office', 'Home', 'Room 4', 'Downtown', 'Cafe', '']
+
+class Command(BaseCommand):
+    help = 'Compares the MongoDB and SQLite storage backends on the calendar workload'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            choices=['sqlite', 'mongodb', 'both'],
+            default='both',
+            help='Which backend to benchmark'
+        )
+        parser.add_argument(
+            '--events',
+            type=int,
+            default=5000,
+            help='Number of synthetic events to write'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Times each read query is repeated'
+        )
+
+    def handle(self, *args, **options):
+        backends = ['sqlite', 'mongodb'] if options['backend'] == 'both' else [options['backend']]
+        events = self.make_events(options['events'])
+
+        for name in backends:
+            self.stdout.write(f"\n{name} ({len(events)} events)")
+            try:
+                with disposable_store(name) as store:
+                    self.run_workload(store, events, options['repeat'])
+            except Exception as e:
+                if options['backend'] != 'both':
+                    raise CommandError(f'{name} benchmark failed: {e}')
+                self.stdout.write(self.style.ERROR(f'  skipped: {str(e)}'))
+
+    def make_events(self, count):
+        rng = random.Random(42)
+        today = datetime.date.today()
+        events = []
+        for _ in range(count):
+            all_day = rng.random() < 0.2
+            events.append({
+                'title': ' '.join(rng.sample(WORDS, 2)).capitalize(),
+                'description': ' '.join(rng.choices(WORDS, k=8)),
+                'start_date': (today + datetime.timedelta(days=rng.randint(-180, 180))).isoformat(),
+                'start_time': None if all_day else f'{rng.randint(7, 20):02d}:{rng.choice([0, 30]):02d}',
+                'all_day': all_day,
+                'location': rng.choice(LOCATIONS),
+                'priority': rng.choice(['high', 'medium', 'low']),
+                'reminder': rng.random() < 0.3,
+            })
+        return events
+
+    def time_it(self, label, fn, repeat=1):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = fn()
+        elapsed = (time.perf_counter() - started) / repeat
+        self.stdout.write(f"  {label:<28} {elapsed * 1000:9.2f} ms")
+        return result
+
+    def run_workload(self, store, events, repeat):
+        today = datetime.date.today()
+        month_start = today.replace(day=1)
+
+        def write_all():
+            for start in range(0, len(events), 500):
+                store.apply_batch([{'op': 'create', 'data': dict(e)} for e in events[start:start + 500]])
+        self.time_it('bulk insert', write_all)
+
+        ids = [e['_id'] for e in store.list_events()[:repeat]]
+        version = store.get_change_version()
+        for event_id in ids:
+            store.update_event(event_id, {'priority': 'high'})
+
+        self.time_it('list all events', store.list_events)
+        self.time_it(f'get {len(ids)} events by id', lambda: [store.get_event(i) for i in ids])
+        self.time_it('agenda (high, 30 days)',
+                     lambda: store.events_by_priority('high', today, today + datetime.timedelta(days=30)), repeat)
+        self.time_it('month grid summaries',
+                     lambda: store.day_summaries(month_start, month_start + datetime.timedelta(days=41)), repeat)
+        self.time_it('search "planning"', lambda: store.search_events('planning'), repeat)
+        self.time_it('changes since version', lambda: store.get_changes(version), repeat)
+        self.time_it('upcoming reminders', lambda: list(store.iter_upcoming_reminders(today)), repeat)
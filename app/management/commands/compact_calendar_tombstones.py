@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import datetime
+from app.utils.storage import get_storage
+
+class Command(BaseCommand):
+    help = 'Removes tombstones of deleted calendar events older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.CALENDAR_TOMBSTONE_RETENTION_DAYS,
+            help='Keep tombstones deleted within this many days'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=options['days'])
+        self.stdout.write(f"Compacting tombstones deleted before {cutoff.isoformat()}...")
+        
+        try:
+            removed = get_storage().compact_tombstones(cutoff)
+            self.stdout.write(self.style.SUCCESS(f'Removed {removed} tombstones'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Failed to compact tombstones: {str(e)}'))
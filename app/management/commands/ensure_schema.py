@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import PyMongoError
+from app.utils.schema import ensure_schema
+
+class Command(BaseCommand):
+    help = 'Creates missing MongoDB collections, validators and indexes, and reports drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would change'
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Exit with an error if anything is missing or has drifted (for CI and deploy checks)'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run'] or options['check']
+        try:
+            report = ensure_schema(dry_run=dry_run)
+        except PyMongoError as e:
+            raise CommandError(f'Could not ensure schema: {e}')
+
+        problems = 0
+        for entry in report:
+            for action in entry['actions']:
+                prefix = 'would ' if dry_run else ''
+                self.stdout.write(f"  {entry['collection']}: {prefix}{action}")
+            for name in entry['changed']:
+                self.stdout.write(self.style.WARNING(
+                    f"  {entry['collection']}: index {name} differs from its declaration "
+                    f"(drop it to have it rebuilt)"
+                ))
+            for name in entry['extra']:
+                self.stdout.write(self.style.WARNING(f"  {entry['collection']}: index {name} is not declared"))
+            problems += len(entry['actions']) + len(entry['changed']) + len(entry['extra'])
+
+        if options['check'] and problems:
+            raise CommandError(f'Schema has {problems} difference(s) from its declaration')
+        if not problems:
+            self.stdout.write(self.style.SUCCESS('Schema is up to date'))
+        elif not dry_run:
+            self.stdout.write(self.style.SUCCESS('Schema ensured'))
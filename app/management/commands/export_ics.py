@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+import sys
+from app.utils.ics import iter_ics_calendar
+from app.utils.storage import get_storage
+
+class Command(BaseCommand):
+    help = 'Exports all calendar events as an .ics file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help='Output file (default: standard output)'
+        )
+
+    def handle(self, *args, **options):
+        output = sys.stdout if options['path'] == '-' else open(options['path'], 'w', newline='')
+        
+        try:
+            # Events are streamed from a cursor straight into the file
+            for chunk in iter_ics_calendar(get_storage().iter_events()):
+                output.write(chunk)
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'Failed to export events: {str(e)}'))
+        finally:
+            if output is not sys.stdout:
+                output.close()
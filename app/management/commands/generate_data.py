@@ -0,0 +1,229 @@
+from django.core.management.base import BaseCommand, CommandError
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import datetime
+import random
+import time
+
+TITLES = {
+    'work': ['Team Meeting', 'Standup', 'Project Review', 'Client Call', '1:1', 'Sprint Planning',
+             'Budget Review', 'Interview', 'Design Sync', 'Quarterly Report'],
+    'health': ['Doctor Appointment', 'Dentist', 'Gym Session', 'Yoga Class', 'Physiotherapy', 'Morning Run'],
+    'family': ['School Pickup', 'Parent Teacher Meeting', 'Family Dinner', 'Soccer Practice', 'Piano Lesson'],
+    'social': ['Lunch with Sam', 'Book Club', 'Birthday Party', 'Movie Night', 'Coffee with Alex'],
+    'chores': ['Grocery Shopping', 'Car Service', 'Pay Bills', 'Laundry', 'Plumber Visit'],
+}
+ALL_DAY_TITLES = ['Birthday: Mom', 'Birthday: Dad', 'Project Deadline', 'Public Holiday',
+                  'Vacation', 'Conference', 'Anniversary', 'Moving Day']
+# Roughly Zipf-distributed: a few places account for most events
+LOCATIONS = ['', 'Office', 'Home', 'Conference Room A', 'City Hospital', 'Fitness Center',
+             'School', 'Downtown Cafe', 'Community Hall', 'Airport']
+LOCATION_WEIGHTS = [30, 20, 15, 10, 5, 5, 5, 4, 3, 3]
+DESCRIPTION_WORDS = ['agenda', 'bring', 'notes', 'follow', 'up', 'on', 'the', 'plan', 'call', 'before',
+                     'confirm', 'time', 'with', 'team', 'review', 'documents', 'remember', 'tickets']
+PRIORITIES = ['high', 'medium', 'low']
+PRIORITY_WEIGHTS = [15, 60, 25]
+# (days between occurrences, share of recurring series)
+RECURRENCES = [(7, 60), (1, 15), (14, 10), (30, 15)]
+
+QUOTE_SUBJECTS = ['The future', 'Success', 'Happiness', 'Courage', 'Knowledge', 'Patience', 'Every day']
+QUOTE_VERBS = ['belongs to', 'is built by', 'comes to', 'grows with', 'starts with', 'rewards']
+QUOTE_OBJECTS = ['those who prepare', 'small steps', 'the curious', 'honest work', 'a single idea',
+                 'the patient', 'people who listen']
+AUTHORS = ['Eleanor Roosevelt', 'Steve Jobs', 'Maya Angelou', 'Albert Einstein', 'Confucius',
+           'Marie Curie', 'Seneca', 'Lao Tzu', 'Unknown']
+NEWS_CATEGORIES = ['general', 'business', 'technology', 'science', 'health', 'sports', 'entertainment']
+CITIES = ['New York', 'London', 'Chennai', 'Tokyo', 'Berlin', 'Sydney', 'Toronto', 'Nairobi']
+
+def _event_time(rng):
+    # Most appointments fall in working hours, on the half hour
+    hour = min(22, max(6, int(rng.gauss(13, 3))))
+    return datetime.time(hour, rng.choice([0, 0, 15, 30, 30, 45]))
+
+def generate_events(rng, count, today, days_past, days_ahead):
+    """Return `count` event dicts with a realistic mix of one-off and recurring events"""
+    events = []
+    while len(events) < count:
+        # Near-term dates are denser than distant ones, and more are upcoming than past
+        if rng.random() < 0.65:
+            offset = min(days_ahead, int(rng.expovariate(1 / max(1, days_ahead / 4))))
+        else:
+            offset = -min(days_past, int(rng.expovariate(1 / max(1, days_past / 4))))
+        start_date = today + datetime.timedelta(days=offset)
+
+        if rng.random() < 0.12:
+            events.append({
+                'title': rng.choice(ALL_DAY_TITLES),
+                'description': '',
+                'start_date': start_date.isoformat(),
+                'start_time': None,
+                'all_day': True,
+                'location': '',
+                'priority': rng.choices(PRIORITIES, [40, 50, 10])[0],
+                'reminder': rng.random() < 0.6,
+            })
+            continue
+
+        category = rng.choice(list(TITLES))
+        start_time = _event_time(rng)
+        duration = datetime.timedelta(minutes=rng.choice([15, 30, 30, 60, 60, 90, 120]))
+        end = datetime.datetime.combine(start_date, start_time) + duration
+        template = {
+            'title': rng.choice(TITLES[category]),
+            'description': ' '.join(rng.choices(DESCRIPTION_WORDS, k=rng.randint(0, 12))),
+            'start_time': start_time.isoformat(),
+            'end_time': end.time().isoformat(),
+            'all_day': False,
+            'location': rng.choices(LOCATIONS, LOCATION_WEIGHTS)[0],
+            'priority': rng.choices(PRIORITIES, PRIORITY_WEIGHTS)[0],
+            'reminder': rng.random() < 0.3,
+        }
+
+        if rng.random() >= 0.25:
+            events.append(dict(template, start_date=start_date.isoformat(), end_date=start_date.isoformat()))
+            continue
+
+        # A recurring series: one event per occurrence, each carrying the series it belongs to
+        interval = rng.choices(*zip(*RECURRENCES))[0]
+        occurrences = min(rng.randint(4, 26), count - len(events))
+        series = f'{rng.getrandbits(64):016x}'
+        for index in range(occurrences):
+            day = start_date + datetime.timedelta(days=interval * index)
+            events.append(dict(
+                template,
+                start_date=day.isoformat(),
+                end_date=day.isoformat(),
+                recurrence={'series': series, 'interval_days': interval,
+                            'occurrences': occurrences, 'index': index},
+            ))
+    return events
+
+def generate_quotes(rng, count):
+    return [{
+        'text': f'{rng.choice(QUOTE_SUBJECTS)} {rng.choice(QUOTE_VERBS)} {rng.choice(QUOTE_OBJECTS)}.',
+        'author': rng.choice(AUTHORS),
+    } for _ in range(count)]
+
+def generate_preferences(rng):
+    return {
+        'location': rng.choice(CITIES),
+        'news_category': rng.choice(NEWS_CATEGORIES),
+    }
+
+def _init_worker():
+    # Forked workers must not share the parent's database connections
+    import django
+    django.setup()
+    from django.db import connections
+    from app.utils.storage import reset_storage
+    connections.close_all()
+    reset_storage()
+
+def _write_chunk(kind, target, seed, chunk, count, today, days_past, days_ahead):
+    """Generate and insert one chunk; runs in a worker process
+
+    Every chunk has its own seed, so the data set depends only on the base
+    seed and the chunk size, never on the number of workers.
+    """
+    rng = random.Random(f'{seed}:{kind}:{chunk}')
+    if kind == 'events':
+        rows = generate_events(rng, count, today, days_past, days_ahead)
+    elif kind == 'quotes':
+        rows = generate_quotes(rng, count)
+    else:
+        rows = [generate_preferences(rng) for _ in range(count)]
+
+    if target == 'django':
+        from app.models import CalendarEvent, Quote, UserPreference
+        model = {'events': CalendarEvent, 'quotes': Quote, 'preferences': UserPreference}[kind]
+        # The models have no column for the recurrence metadata
+        fields = {field.name for field in model._meta.concrete_fields}
+        model.objects.bulk_create(
+            [model(**{name: value for name, value in row.items() if name in fields}) for row in rows],
+            batch_size=500
+        )
+    else:
+        from app.utils.storage import get_storage
+        storage = get_storage()
+        if kind == 'events':
+            outcome = storage.apply_batch([{'op': 'create', 'data': row} for row in rows])
+            failed = [r for r in outcome['results'] if r['status'] != 'created']
+            if failed:
+                raise RuntimeError(f'{len(failed)} events failed to insert: {failed[0].get("error")}')
+        elif kind == 'quotes':
+            storage.save_quotes(rows)
+        else:
+            # Storage backends keep a single preferences document (see handle())
+            storage.save_preferences(rows[0])
+    return len(rows)
+
+class Command(BaseCommand):
+    help = 'Generates synthetic events, quotes and preferences for scale testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=1000, help='Number of events to generate')
+        parser.add_argument('--quotes', type=int, default=100, help='Number of quotes to generate')
+        parser.add_argument(
+            '--preferences',
+            type=int,
+            default=1,
+            help='Number of preference records to generate (more than 1 needs --target django)'
+        )
+        parser.add_argument(
+            '--target',
+            choices=['storage', 'django'],
+            default='storage',
+            help='Write to the configured event storage backend or to the Django models'
+        )
+        parser.add_argument('--workers', type=int, default=4, help='Worker processes')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows generated and inserted per chunk')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data')
+        parser.add_argument(
+            '--anchor-date',
+            type=datetime.date.fromisoformat,
+            default=None,
+            help='Day the generated dates are spread around (YYYY-MM-DD, default today)'
+        )
+        parser.add_argument('--days-past', type=int, default=365, help='How far back events may start')
+        parser.add_argument('--days-ahead', type=int, default=365, help='How far ahead events may start')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be at least 1')
+        if options['preferences'] > 1 and options['target'] != 'django':
+            raise CommandError('The storage backends keep one preferences document; use --target django')
+
+        # Pass the same anchor date to reproduce a data set on another day
+        today = options['anchor_date'] or datetime.date.today()
+        batch_size = options['batch_size']
+        tasks = []
+        for kind in ('events', 'quotes', 'preferences'):
+            total = options[kind]
+            for chunk, start in enumerate(range(0, total, batch_size)):
+                tasks.append((kind, options['target'], options['seed'], chunk, min(batch_size, total - start),
+                              today, options['days_past'], options['days_ahead']))
+
+        self.stdout.write(
+            f"Generating {options['events']} events, {options['quotes']} quotes and "
+            f"{options['preferences']} preferences "
+            f"with {options['workers']} workers (seed {options['seed']})..."
+        )
+        from django.db import connections
+        connections.close_all()
+
+        started = time.monotonic()
+        written = 0
+        total_rows = options['events'] + options['quotes'] + options['preferences']
+        try:
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+                futures = [pool.submit(_write_chunk, *task) for task in tasks]
+                for future in as_completed(futures):
+                    written += future.result()
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(f'  {written}/{total_rows} rows ({written / elapsed:,.0f} rows/s)')
+        except Exception as e:
+            raise CommandError(f'Generation failed after {written} rows: {e}')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {written} rows in {elapsed:.1f}s ({written / elapsed:,.0f} rows/s)'
+        ))
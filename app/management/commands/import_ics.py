@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+import time
+from app.utils.ics import iter_ics_batches
+from app.utils.storage import get_storage
+
+class Command(BaseCommand):
+    help = 'Imports calendar events from an .ics file, upserting them by UID'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the .ics file')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of events written per bulk upsert'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Importing events from {options['path']}...")
+        started = time.monotonic()
+        inserted = updated = 0
+        
+        try:
+            # The file is read line by line, so memory use does not grow with its size
+            with open(options['path'], 'rb') as ics_file:
+                for batch in iter_ics_batches(ics_file, options['batch_size']):
+                    counts = get_storage().upsert_events_by_uid(batch)
+                    inserted += counts['inserted']
+                    updated += counts['updated']
+                    self.stdout.write(f"  {inserted + updated} events written")
+        except OSError as e:
+            raise CommandError(f'Could not read {options["path"]}: {e}')
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Failed to import events: {str(e)}'))
+            return
+        
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {inserted} new and {updated} existing events in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import collections
+import os
+import subprocess
+import sys
+
+# Heavy optional integrations that views must import lazily
+LAZY_MODULES = ('googleapiclient', 'google.oauth2')
+
+# What a worker does before serving its first request
+BOOT_SCRIPT = """
+import resource, sys
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+get_wsgi_application()
+get_resolver().url_patterns
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+print(' '.join(sorted(sys.modules)))
+"""
+
+class Command(BaseCommand):
+    help = 'Reports the import time and memory of starting a worker (python -X importtime)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Number of packages and modules to list'
+        )
+        parser.add_argument(
+            '--max-ms',
+            type=float,
+            help='Fail if importing everything takes longer than this'
+        )
+        parser.add_argument(
+            '--max-rss-mb',
+            type=float,
+            help='Fail if the booted worker uses more memory than this'
+        )
+        parser.add_argument(
+            '--forbid',
+            action='append',
+            default=[],
+            help=f"Fail if this module is imported at startup (always checked: {', '.join(LAZY_MODULES)})"
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'project.settings'))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise CommandError(f'Worker failed to start:\n{result.stderr[-2000:]}')
+
+        rss_line, modules_line = result.stdout.strip().splitlines()[-2:]
+        rss_mb = int(rss_line) / 1024  # ru_maxrss is in KiB on Linux
+        modules = set(modules_line.split())
+        imports = self.parse_importtime(result.stderr)
+        total_ms = sum(cumulative for depth, name, _, cumulative in imports if depth == 0) / 1000
+
+        self.stdout.write(f'Worker start: {total_ms:.1f} ms of imports, '
+                          f'{len(modules)} modules, {rss_mb:.1f} MB max RSS')
+
+        by_package = collections.Counter()
+        for _, name, self_us, _ in imports:
+            by_package[name.split('.')[0]] += self_us
+        self.stdout.write('\nSlowest packages (own import time):')
+        for package, self_us in by_package.most_common(options['top']):
+            self.stdout.write(f'  {self_us / 1000:8.1f} ms  {package}')
+
+        self.stdout.write('\nSlowest imports (including what they import):')
+        for _, name, _, cumulative in sorted(imports, key=lambda entry: -entry[3])[:options['top']]:
+            self.stdout.write(f'  {cumulative / 1000:8.1f} ms  {name}')
+
+        problems = []
+        for forbidden in (*LAZY_MODULES, *options['forbid']):
+            if forbidden in modules:
+                problems.append(f'{forbidden} is imported at startup')
+        if options['max_ms'] is not None and total_ms > options['max_ms']:
+            problems.append(f'imports took {total_ms:.1f} ms, budget {options["max_ms"]} ms')
+        if options['max_rss_mb'] is not None and rss_mb > options['max_rss_mb']:
+            problems.append(f'max RSS {rss_mb:.1f} MB, budget {options["max_rss_mb"]} MB')
+        if problems:
+            raise CommandError('Startup budget exceeded: ' + '; '.join(problems))
+        self.stdout.write(self.style.SUCCESS('\nWithin budget'))
+
+    def parse_importtime(self, stderr):
+        """(depth, module, self µs, cumulative µs) for each `import time:` line"""
+        imports = []
+        for line in stderr.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            fields = line[len('import time:'):].split('|')
+            if len(fields) != 3 or not fields[0].strip().isdigit():
+                continue  # The header line
+            name = fields[2].rstrip()
+            stripped = name.lstrip()
+            imports.append(((len(name) - len(stripped)) // 2, stripped,
+                            int(fields[0]), int(fields[1])))
+        return imports
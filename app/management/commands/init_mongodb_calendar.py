@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
+from bson import ObjectId
 from datetime import date, time, timedelta
-from app.utils.mongodb import get_mongodb_db
+from app.utils.mongodb import apply_calendar_event_batch, get_mongodb_db
 
 class Command(BaseCommand):
     help = 'Initializes MongoDB with sample calendar events'
@@ -12,9 +13,6 @@ class Command(BaseCommand):
             # Connect to MongoDB
             db = get_mongodb_db()
             
-            # Clear existing calendar events
-            db.app_calendarevent.drop()
-            
             # Create sample calendar events
             today = date.today()
             events = [
@@ -61,10 +59,23 @@ class Command(BaseCommand):
                 }
             ]
             
-            # Insert events into MongoDB
-            if events:
-                db.app_calendarevent.insert_many(events)
-                self.stdout.write(f"Inserted {len(events)} calendar events")
+            # Replace the existing events through the batch writer, so every
+            # change gets a version and deletions leave tombstones for sync
+            existing = db.app_calendarevent.distinct('_id')
+            operations = [
+                {'op': 'delete', 'id': str(event_id)}
+                for event_id in existing if isinstance(event_id, ObjectId)
+            ]
+            # Hand-seeded documents may have other ids, which the batch writer cannot address
+            skipped = [event_id for event_id in existing if not isinstance(event_id, ObjectId)]
+            if skipped:
+                self.stdout.write(self.style.WARNING(
+                    f"Left {len(skipped)} events whose _id is not an ObjectId: "
+                    f"{', '.join(map(repr, skipped[:10]))}{' ...' if len(skipped) > 10 else ''}"
+                ))
+            operations += [{'op': 'create', 'data': event} for event in events]
+            apply_calendar_event_batch(operations)
+            self.stdout.write(f"Inserted {len(events)} calendar events")
             
             self.stdout.write(self.style.SUCCESS('Successfully initialized MongoDB with sample calendar events'))
             
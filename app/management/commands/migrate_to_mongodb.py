@@ -1,56 +1,159 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from app.models import Quote, UserPreference, CalendarEvent
-import json
-import os
-import pymongo
-from django.conf import settings
+import datetime
+import time
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+from app.utils.events import normalize_event_dates
+from app.utils.mongodb import EVENT_VERSION_COUNTER, _next_event_version, get_mongodb_db
+from app.utils.schema import COLLECTIONS, validator_options
+
+# Progress of interrupted migrations, one document per target collection
+CHECKPOINT_COLLECTION = 'app_migration_checkpoints'
+
+def _object_id(pk):
+    """Derive a stable ObjectId from a SQL primary key
+
+    Re-copying a chunk after a crash then hits duplicate keys instead of
+    creating a second copy of the same rows.
+    """
+    return ObjectId(f'{pk:024x}')
+
+def _plain_documents(db, rows):
+    return [dict(row, _id=_object_id(row['id'])) for row in rows]
+
+def _event_documents(db, rows):
+    # One counter round trip per chunk; each event gets its own change version
+    highest = _next_event_version(db, len(rows))
+    now = datetime.datetime.now(datetime.timezone.utc)
+    documents = []
+    for offset, row in enumerate(rows):
+        document = normalize_event_dates(dict(row, _id=_object_id(row['id'])))
+        document['version'] = highest - len(rows) + offset + 1
+        document['updated_at'] = now
+        documents.append(document)
+    return documents
+
+# (key, model, target collection, row converter)
+MIGRATIONS = [
+    ('quotes', Quote, 'app_quote', _plain_documents),
+    ('preferences', UserPreference, 'app_userpreference', _plain_documents),
+    ('events', CalendarEvent, 'app_calendarevent', _event_documents),
+]
 
 class Command(BaseCommand):
-    help = 'Migrates data from SQLite to MongoDB'
+    help = 'Migrates data from SQLite to MongoDB in resumable chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Rows read and inserted per batch'
+        )
+        parser.add_argument(
+            '--only',
+            choices=[key for key, *_ in MIGRATIONS],
+            action='append',
+            help='Migrate only this data set (may be repeated)'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Discard saved checkpoints and copy everything again'
+        )
 
     def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
         self.stdout.write('Starting migration to MongoDB...')
-        
-        # Export data from SQLite models
-        quotes = list(Quote.objects.all().values())
-        preferences = list(UserPreference.objects.all().values())
-        events = list(CalendarEvent.objects.all().values())
-        
-        self.stdout.write(f'Found {len(quotes)} quotes, {len(preferences)} preferences, and {len(events)} events')
-        
-        # Connect to MongoDB
-        client = pymongo.MongoClient(
-            settings.DATABASES['default']['CLIENT']['host'],
-            username=settings.DATABASES['default']['CLIENT'].get('username', None),
-            password=settings.DATABASES['default']['CLIENT'].get('password', None),
-            authSource=settings.DATABASES['default']['CLIENT'].get('authSource', 'admin')
-        )
-        
-        # Create database and collections
-        db = client[settings.DATABASES['default']['NAME']]
-        
-        # Clear existing collections
-        db.app_quote.drop()
-        db.app_userpreference.drop()
-        db.app_calendarevent.drop()
-        
-        # Convert date and time objects to strings for JSON serialization
-        for event in events:
-            if event.get('start_date'):
-                event['start_date'] = event['start_date'].isoformat()
-            if event.get('end_date'):
-                event['end_date'] = event['end_date'].isoformat()
-            if event.get('start_time'):
-                event['start_time'] = event['start_time'].isoformat()
-            if event.get('end_time'):
-                event['end_time'] = event['end_time'].isoformat()
-        
-        # Insert data into MongoDB
-        if quotes:
-            db.app_quote.insert_many(quotes)
-        if preferences:
-            db.app_userpreference.insert_many(preferences)
-        if events:
-            db.app_calendarevent.insert_many(events)
-        
-        self.stdout.write(self.style.SUCCESS('Successfully migrated data to MongoDB'))
\ No newline at end of file
+        try:
+            db = get_mongodb_db()
+            for key, model, target, convert in MIGRATIONS:
+                if options['only'] and key not in options['only']:
+                    continue
+                self.migrate(db, model, target, convert, options['chunk_size'], options['restart'])
+        except PyMongoError as e:
+            raise CommandError(f'Migration interrupted: {e}. Run the command again to resume.')
+
+        self.stdout.write(self.style.SUCCESS('Successfully migrated data to MongoDB'))
+
+    def migrate(self, db, model, target, convert, chunk_size, restart):
+        """Copy one table into a staging collection, then swap it in
+
+        The live collection keeps serving reads until the final rename, and
+        the checkpoint records the last primary key copied so an interrupted
+        run continues where it stopped.
+        """
+        staging = f'{target}__staging'
+        indexes, validator = COLLECTIONS[target]
+        checkpoints = db[CHECKPOINT_COLLECTION]
+        checkpoint = None if restart else checkpoints.find_one({'_id': target})
+        if checkpoint is not None and not db.list_collection_names(filter={'name': staging}):
+            # The rows it counts were in the staging collection
+            self.stdout.write(f'Staging collection for {target} is gone; starting over')
+            checkpoint = None
+
+        if checkpoint is None:
+            db[staging].drop()
+            # The staging collection replaces the live one, so it needs the same validator
+            db.create_collection(staging, **(validator_options(validator) if validator else {}))
+            checkpoint = {'_id': target, 'last_pk': 0, 'copied': 0}
+            checkpoints.replace_one({'_id': target}, checkpoint, upsert=True)
+        else:
+            self.stdout.write(
+                f"Resuming {target} after id {checkpoint['last_pk']} "
+                f"({checkpoint['copied']} rows already copied)"
+            )
+
+        last_pk, copied = checkpoint['last_pk'], checkpoint['copied']
+        total = model.objects.count()
+        queryset = model.objects.order_by('pk').values()
+        started = time.monotonic()
+        copied_this_run = 0
+
+        while True:
+            # Keyset pagination: each chunk is an index seek, however deep we are
+            rows = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+            if not rows:
+                break
+
+            try:
+                db[staging].insert_many(convert(db, rows), ordered=False)
+            except BulkWriteError as e:
+                # Rows left behind by a run that stopped before its checkpoint
+                if any(error['code'] != 11000 for error in e.details['writeErrors']):
+                    raise
+
+            last_pk = rows[-1]['id']
+            copied += len(rows)
+            copied_this_run += len(rows)
+            checkpoints.update_one({'_id': target}, {'$set': {'last_pk': last_pk, 'copied': copied}})
+
+            elapsed = time.monotonic() - started
+            rate = copied_this_run / elapsed if elapsed else 0
+            eta = (total - copied) / rate if rate else 0
+            self.stdout.write(
+                f'  {target}: {copied}/{total} rows ({rate:,.0f} rows/s, about {eta:.0f}s left)'
+            )
+
+        if indexes:
+            # Building indexes once after the bulk load is cheaper than maintaining them per insert
+            db[staging].create_indexes(indexes)
+
+        # Atomic swap: readers see either the old collection or the complete new one
+        db[staging].rename(target, dropTarget=True)
+        checkpoints.delete_one({'_id': target})
+
+        if target == 'app_calendarevent':
+            # Old versions and tombstones no longer describe the collection; make sync clients reset
+            counter = db.app_counters.find_one({'_id': EVENT_VERSION_COUNTER}) or {}
+            db.app_counters.update_one(
+                {'_id': EVENT_VERSION_COUNTER},
+                {'$max': {'floor': counter.get('seq', 0)}},
+                upsert=True
+            )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'Migrated {copied} rows into {target} ({copied_this_run} this run, {elapsed:.1f}s)')
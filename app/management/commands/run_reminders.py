@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from app.utils.reminders import ReminderDaemon
+
+class Command(BaseCommand):
+    help = 'Runs the reminder daemon, delivering due event reminders to the configured sinks'
+
+    def handle(self, *args, **options):
+        daemon = ReminderDaemon()
+        self.stdout.write('Starting reminder daemon (Ctrl+C to stop)...')
+        
+        try:
+            daemon.run()
+        except KeyboardInterrupt:
+            daemon.stop()
+            self.stdout.write(self.style.SUCCESS('Reminder daemon stopped'))
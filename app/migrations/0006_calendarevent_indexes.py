@@ -0,0 +1,21 @@
+# Generated manually
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_remove_userpreference_temperature_unit'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(fields=['start_date', 'start_time'], name='event_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(fields=['priority', 'start_date', 'start_time'], name='event_priority_start_idx'),
+        ),
+    ]
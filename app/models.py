@@ -28,5 +28,13 @@ class CalendarEvent(models.Model):
     priority = models.CharField(max_length=20, default='medium')
     reminder = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            # Date range reads (agenda, dashboard)
+            models.Index(fields=['start_date', 'start_time'], name='event_start_idx'),
+            # Priority-filtered agenda: seek on priority, then scan the date range in order
+            models.Index(fields=['priority', 'start_date', 'start_time'], name='event_priority_start_idx'),
+        ]
+    
     def __str__(self):
         return self.title
@@ -1,3 +1,1716 @@
-from django.test import TestCase
+import collections
+import contextlib
+import datetime
+import io
+import json
+import logging
+import pstats
+import random
+import threading
+import time
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import pymongo
+import requests
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+from pymongo import monitoring
+from requests.adapters import HTTPAdapter
+from django.apps import apps
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.utils.module_loading import import_string
+
+from app.management.commands import generate_data, migrate_to_mongodb
+from app.models import CalendarEvent
+from app.utils import events, health, metrics, mongodb, query_log, quota, schema, search, singleflight, snapshot, upstream
+from app.utils.cache import clear_caches
+from app.utils.cache import TTLCache, decode_value
+from app.utils.ics import iter_ics_calendar, iter_ics_events
+from app.utils.benchmark import disposable_store, fake_upstreams
+from app.utils.profiling import StackSampler, format_collapsed
+from app.utils.query_log import MONITORING_COMMANDS
+from app.utils.reminders import QueueSink, ReminderDaemon, ReminderScheduler
+from app.utils.log import BackgroundStreamHandler, JsonFormatter, SamplingFilter
+from app.utils.sqlite_store import SQLiteEventStore
+from app.utils.storage import MongoEventStore, get_coordination_store
+from app.utils.timing import get_span_histograms, reset_span_histograms
+from app.views import dashboard
+
+
+def mongodb_available():
+    """Whether a MongoDB server answers at MONGODB_URI
+
+    CI jobs that provide a server set MONGODB_TESTS_REQUIRED=True, so a server
+    that fails to answer fails those tests instead of skipping them.
+    """
+    if os.environ.get('MONGODB_TESTS_REQUIRED') == 'True':
+        return True
+    try:
+        client = pymongo.MongoClient(settings.MONGODB_URI, serverSelectionTimeoutMS=500)
+        client.admin.command('ping')
+        return True
+    except pymongo.errors.PyMongoError:
+        return False
+
+
+# Round-trip budgets
+#
+#     with call_budget(storage=1, http=0):
+#         client.get('/calendar/grid/')
+#
+# Three kinds of calls are recorded:
+# - `mongo`: MongoDB commands, through pymongo command monitoring. The
+#   listener is registered when this module is imported, before the tests
+#   create their clients, and never in a serving process.
+# - `http`: outbound requests made with the `requests` library.
+# - `storage`: method calls on the configured event storage backend and
+#   coordination store. This is the backend-neutral count that also works
+#   with the SQLite store.
+#
+# When a budget is exceeded, AssertionError lists every offending call.
+
+class CallRecorder:
+    """Calls made while recording, as human-readable strings per kind"""
+
+    def __init__(self):
+        self.mongo = []
+        self.http = []
+        self.storage = []
+
+    def counts(self):
+        return {'mongo': len(self.mongo), 'http': len(self.http), 'storage': len(self.storage)}
+
+
+_active = []
+_active_lock = threading.Lock()
+
+
+class _CommandListener(monitoring.CommandListener):
+    def started(self, event):
+        if event.command_name in MONITORING_COMMANDS or not _active:
+            return
+        target = event.command.get(event.command_name)
+        call = f'{event.command_name} {event.database_name}.{target}' if isinstance(target, str) \
+            else f'{event.command_name} {event.database_name}'
+        with _active_lock:
+            for recorder in _active:
+                recorder.mongo.append(call)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+monitoring.register(_CommandListener())
+
+
+class _RecordingStore:
+    """Proxy that records every method called on a storage backend"""
+
+    def __init__(self, store, recorder):
+        self._store = store
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        attribute = getattr(self._store, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            arguments = ', '.join([repr(arg) for arg in args] + [f'{k}={v!r}' for k, v in kwargs.items()])
+            self._recorder.storage.append(f'{name}({arguments[:120]})')
+            return attribute(*args, **kwargs)
+        return call
+
+
+@contextlib.contextmanager
+def record_calls():
+    """Record MongoDB commands, HTTP requests and storage calls made in the block"""
+    from app.utils import storage
+
+    recorder = CallRecorder()
+    original_send = HTTPAdapter.send
+
+    def send(adapter, request, *args, **kwargs):
+        recorder.http.append(f'{request.method} {request.url}')
+        return original_send(adapter, request, *args, **kwargs)
+
+    previous_store = storage.get_storage()
+    previous_coordination = storage.get_coordination_store()
+    with _active_lock:
+        _active.append(recorder)
+    storage._storage = _RecordingStore(previous_store, recorder)
+    storage._coordination = _RecordingStore(previous_coordination, recorder)
+    try:
+        with mock.patch.object(HTTPAdapter, 'send', send):
+            yield recorder
+    finally:
+        storage._storage = previous_store
+        storage._coordination = previous_coordination
+        with _active_lock:
+            _active.remove(recorder)
+
+
+@contextlib.contextmanager
+def call_budget(mongo=None, http=None, storage=None):
+    """Fail with AssertionError if the block exceeds any of the given call counts
+
+    A budget of None is not checked.
+    """
+    with record_calls() as recorder:
+        yield recorder
+
+    problems = []
+    for kind, limit in (('mongo', mongo), ('http', http), ('storage', storage)):
+        calls = getattr(recorder, kind)
+        if limit is not None and len(calls) > limit:
+            listing = '\n'.join(f'    {call}' for call in calls)
+            problems.append(f'{len(calls)} {kind} calls, budget {limit}:\n{listing}')
+    if problems:
+        raise AssertionError('Call budget exceeded\n  ' + '\n  '.join(problems))
+
+
+class EventStoreConformanceMixin:
+    """Behaviour every storage backend must share
+
+    Subclasses provide make_store() returning an empty store.
+    """
+
+    def setUp(self):
+        self.store = self.make_store()
+        self.coordination = import_string(self.store.coordination_backend)(*self.coordination_args())
+        self.today = datetime.date.today()
+
+    def coordination_args(self):
+        return ()
+
+    def event(self, title, days=0, **fields):
+        data = {
+            'title': title,
+            'description': '',
+            'start_date': (self.today + datetime.timedelta(days=days)).isoformat(),
+            'all_day': False,
+            'location': '',
+            'priority': 'medium',
+            'reminder': False,
+        }
+        data.update(fields)
+        return data
+
+    def test_save_get_update_delete(self):
+        event_id = self.store.save_event(self.event('Dentist', start_time='09:30'))
+        self.assertTrue(event_id)
+
+        event = self.store.get_event(event_id)
+        self.assertEqual(event['title'], 'Dentist')
+        self.assertEqual(event['start_time'], '09:30')
+
+        self.assertTrue(self.store.update_event(event_id, {'title': 'Dentist (moved)'}))
+        self.assertEqual(self.store.get_event(event_id)['title'], 'Dentist (moved)')
+        self.assertEqual(len(self.store.list_events()), 1)
+
+        self.assertTrue(self.store.delete_event(event_id))
+        self.assertIsNone(self.store.get_event(event_id))
+        self.assertFalse(self.store.delete_event(event_id))
+
+    def test_malformed_ids_are_missing_events(self):
+        for event_id in ('nope', '', '0' * 23, None):
+            self.assertIsNone(self.store.get_event(event_id))
+            self.assertFalse(self.store.update_event(event_id, {'title': 'x'}))
+            self.assertFalse(self.store.delete_event(event_id))
+
+    def test_dates_are_stored_as_iso_strings(self):
+        event_id = self.store.save_event(self.event('Gym', start_date=self.today, start_time=datetime.time(18, 0)))
+        event = self.store.get_event(event_id)
+        self.assertEqual(event['start_date'], self.today.isoformat())
+        self.assertEqual(event['start_time'], '18:00:00')
+
+    def test_changes_since_version(self):
+        first = self.store.save_event(self.event('First'))
+        second = self.store.save_event(self.event('Second'))
+
+        first_sync = self.store.get_changes(0)
+        self.assertTrue(first_sync['reset'])
+        self.assertEqual({e['_id'] for e in first_sync['events']}, {first, second})
+
+        self.store.update_event(first, {'title': 'First (edited)'})
+        self.store.delete_event(second)
+
+        delta = self.store.get_changes(first_sync['version'])
+        self.assertFalse(delta['reset'])
+        self.assertEqual([e['title'] for e in delta['events']], ['First (edited)'])
+        self.assertEqual(delta['deleted'], [second])
+        self.assertGreater(delta['version'], first_sync['version'])
+
+        self.assertEqual(self.store.get_changes(delta['version'])['events'], [])
+
+    def test_changes_are_paginated(self):
+        self.store.save_event(self.event('Before'))
+        since = self.store.get_change_version()
+        for i in range(5):
+            self.store.save_event(self.event(f'Event {i}'))
+
+        page = self.store.get_changes(since, limit=2)
+        self.assertEqual([e['title'] for e in page['events']], ['Event 0', 'Event 1'])
+        self.assertTrue(page['has_more'])
+
+        rest = self.store.get_changes(page['version'], limit=10)
+        self.assertEqual(len(rest['events']), 3)
+        self.assertFalse(rest['has_more'])
+
+    def test_snapshots_are_paged_by_id(self):
+        ids = {self.store.save_event(self.event(f'Event {i}')) for i in range(5)}
+
+        page = self.store.get_changes(0, limit=2)
+        self.assertTrue(page['reset'])
+        self.assertTrue(page['has_more'])
+        version, seen = page['version'], [e['_id'] for e in page['events']]
+
+        # Changes made while paging arrive as deltas after the last page
+        added = self.store.save_event(self.event('Added'))
+        while page['has_more']:
+            page = self.store.get_changes(version, limit=2, after=page['after'])
+            self.assertTrue(page['reset'])
+            self.assertEqual(page['version'], version)
+            seen += [e['_id'] for e in page['events']]
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertLessEqual(ids, set(seen))
+
+        delta = self.store.get_changes(version)
+        self.assertIn(added, [e['_id'] for e in delta['events']])
+
+    def test_seeded_change_version_takes_delta_path(self):
+        self.assertEqual(self.store.seed_change_version(), 1)
+        self.assertFalse(self.store.get_changes(1)['reset'])
+        self.store.save_event(self.event('After'))
+        self.assertEqual(self.store.seed_change_version(), 2)
+
+    def test_compacted_tombstones_force_reset(self):
+        event_id = self.store.save_event(self.event('Old'))
+        version = self.store.get_change_version()
+        self.store.delete_event(event_id)
+
+        later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)
+        self.assertEqual(self.store.compact_tombstones(later), 1)
+        self.assertTrue(self.store.get_changes(version)['reset'])
+
+    def test_batch_best_effort_reports_each_item(self):
+        kept = self.store.save_event(self.event('Kept'))
+        missing = '0' * 24
+
+        outcome = self.store.apply_batch([
+            {'op': 'create', 'data': self.event('New')},
+            {'op': 'update', 'id': kept, 'data': {'priority': 'high'}},
+            {'op': 'delete', 'id': missing},
+        ])
+        self.assertTrue(outcome['applied'])
+        self.assertEqual(
+            [result['status'] for result in outcome['results']],
+            ['created', 'updated', 'not_found']
+        )
+        self.assertEqual(self.store.get_event(kept)['priority'], 'high')
+        self.assertEqual(len(self.store.list_events()), 2)
+
+    def test_atomic_batch_writes_nothing_on_failure(self):
+        outcome = self.store.apply_batch([
+            {'op': 'create', 'data': self.event('New')},
+            {'op': 'delete', 'id': '0' * 24},
+        ], atomic=True)
+        self.assertFalse(outcome['applied'])
+        self.assertEqual(self.store.list_events(), [])
+
+    def test_upsert_by_uid(self):
+        counts = self.store.upsert_events_by_uid([self.event('Imported', uid='abc@example.com')])
+        self.assertEqual(counts, {'inserted': 1, 'updated': 0})
+
+        counts = self.store.upsert_events_by_uid([self.event('Imported (v2)', uid='abc@example.com')])
+        self.assertEqual(counts, {'inserted': 0, 'updated': 1})
+        self.assertEqual([e['title'] for e in self.store.iter_events()], ['Imported (v2)'])
+
+    def test_events_by_priority_sorted_by_start(self):
+        self.store.save_event(self.event('Afternoon', priority='high', start_time='15:00'))
+        self.store.save_event(self.event('All day', priority='high', all_day=True))
+        self.store.save_event(self.event('Morning', priority='high', start_time='08:00'))
+        self.store.save_event(self.event('Other', priority='low', start_time='07:00'))
+        self.store.save_event(self.event('Far away', days=90, priority='high'))
+
+        found = self.store.events_by_priority('high', self.today, self.today + datetime.timedelta(days=30))
+        self.assertEqual([e['title'] for e in found], ['All day', 'Morning', 'Afternoon'])
+
+    def test_events_between(self):
+        self.store.save_event(self.event('Afternoon', start_time='15:00'))
+        self.store.save_event(self.event('All day', all_day=True))
+        self.store.save_event(self.event('Morning', start_time='09:00'))
+        self.store.save_event(self.event('Yesterday', days=-1, start_time='09:00'))
+        self.store.save_event(self.event('Far away', days=90))
+
+        found = self.store.events_between(self.today, self.today + datetime.timedelta(days=30))
+        self.assertEqual([e['title'] for e in found], ['All day', 'Morning', 'Afternoon'])
+
+    def test_day_summaries(self):
+        self.store.save_event(self.event('Low', priority='low', start_time='08:00'))
+        self.store.save_event(self.event('High', priority='high', start_time='17:00'))
+        self.store.save_event(self.event('Tomorrow', days=1, start_time='09:00'))
+        self.store.save_event(self.event('All day', days=1, all_day=True))
+
+        summaries = self.store.day_summaries(self.today, self.today + datetime.timedelta(days=6))
+        self.assertEqual(summaries[self.today.isoformat()]['count'], 2)
+        self.assertEqual(summaries[self.today.isoformat()]['top']['title'], 'High')
+        tomorrow = summaries[(self.today + datetime.timedelta(days=1)).isoformat()]
+        self.assertEqual(tomorrow['count'], 2)
+        self.assertEqual(tomorrow['top'], {'id': tomorrow['top']['id'], 'title': 'All day', 'start_time': None,
+                                           'all_day': True, 'priority': 'medium'})
+
+    def test_upcoming_reminders(self):
+        self.store.save_event(self.event('Remind me', days=2, reminder=True))
+        self.store.save_event(self.event('No reminder', days=2))
+        self.store.save_event(self.event('Past', days=-10, reminder=True))
+
+        reminders = list(self.store.iter_upcoming_reminders(self.today))
+        self.assertEqual([e['title'] for e in reminders], ['Remind me'])
+
+    def test_search_ranks_title_matches_first(self):
+        self.store.save_event(self.event('Lunch', description='planning meeting afterwards'))
+        self.store.save_event(self.event('Planning meeting'))
+        self.store.save_event(self.event('Gym'))
+
+        found = self.store.search_events('planning')
+        self.assertEqual(found['total'], 2)
+        self.assertEqual(found['results'][0]['title'], 'Planning meeting')
+        self.assertEqual(self.store.search_events('planning', skip=1, limit=1)['results'][0]['title'], 'Lunch')
+
+    def test_quotes(self):
+        self.assertIsNone(self.store.get_random_quote())
+        self.store.save_quotes([
+            {'text': 'Stay hungry, stay foolish.', 'author': 'Stewart Brand'},
+            {'text': 'Be yourself.', 'author': 'Oscar Wilde'},
+        ])
+        self.assertEqual(len(self.store.get_quotes()), 2)
+        self.assertIn(self.store.get_random_quote()['author'], ('Stewart Brand', 'Oscar Wilde'))
+
+    def test_preferences_are_merged(self):
+        self.assertIsNone(self.store.get_preferences())
+        self.store.save_preferences({'location': 'New York', 'news_category': 'general'})
+        self.store.save_preferences({'location': 'Chennai'})
+
+        preferences = self.store.get_preferences()
+        self.assertEqual(preferences['location'], 'Chennai')
+        self.assertEqual(preferences['news_category'], 'general')
+
+    def test_ping(self):
+        self.assertIsNone(self.store.ping())
+
+    def test_flight_claim_and_result(self):
+        self.assertEqual(self.coordination.begin_flight('weather:Chennai', 'worker-1', 30)['owner'], 'worker-1')
+        held = self.coordination.begin_flight('weather:Chennai', 'worker-2', 30)
+        self.assertEqual((held['owner'], held['done']), ('worker-1', False))
+
+        self.coordination.finish_flight('weather:Chennai', 'worker-1', {'temp': 31}, keep_seconds=30)
+        flight = self.coordination.get_flight('weather:Chennai')
+        self.assertEqual((flight['done'], flight['value']), (True, {'temp': 31}))
+
+    def test_expired_flight_is_taken_over(self):
+        self.coordination.begin_flight('news:Chennai', 'worker-1', 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.coordination.get_flight('news:Chennai'))
+        self.assertEqual(self.coordination.begin_flight('news:Chennai', 'worker-2', 30)['owner'], 'worker-2')
+
+        # Releasing without a result lets the next caller claim it
+        self.coordination.finish_flight('news:Chennai', 'worker-2')
+        self.assertIsNone(self.coordination.get_flight('news:Chennai'))
+
+    def test_token_bucket(self):
+        # A new bucket starts full; the floor keeps the last tokens back
+        self.assertTrue(self.coordination.take_tokens('quota:newsapi', 2, 0, 5, floor=2))
+        self.assertTrue(self.coordination.take_tokens('quota:newsapi', 1, 0, 5, floor=2))
+        self.assertFalse(self.coordination.take_tokens('quota:newsapi', 1, 0, 5, floor=2))
+        self.assertTrue(self.coordination.take_tokens('quota:newsapi', 2, 0, 5))
+        self.assertFalse(self.coordination.take_tokens('quota:newsapi', 1, 0, 5))
+
+        # Refills at `rate` tokens per second
+        self.coordination.set_tokens('quota:openweather', 0)
+        self.assertFalse(self.coordination.take_tokens('quota:openweather', 1, 10, 5))
+        time.sleep(0.2)
+        self.assertTrue(self.coordination.take_tokens('quota:openweather', 1, 10, 5))
+
+    def test_cache_entries(self):
+        self.assertIsNone(self.coordination.cache_get('weather:Chennai'))
+        self.coordination.cache_set('weather:Chennai', b'\x00compressed', 30)
+        data, expires_at = self.coordination.cache_get('weather:Chennai')
+        self.assertEqual(data, b'\x00compressed')
+        self.assertAlmostEqual(expires_at, time.time() + 30, delta=2)
+
+        self.coordination.cache_set('news:Chennai', b'headlines', 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.coordination.cache_get('news:Chennai'))
+
+        self.coordination.cache_delete('weather:Chennai')
+        self.assertIsNone(self.coordination.cache_get('weather:Chennai'))
+
+
+class SQLiteEventStoreTests(EventStoreConformanceMixin, SimpleTestCase):
+
+    def make_store(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        store = SQLiteEventStore(os.path.join(self.directory, 'events.sqlite3'))
+        self.addCleanup(store.close)
+        return store
+
+    def coordination_args(self):
+        return (self.store.path,)
+
+
+class MongoEventStoreMixin(EventStoreConformanceMixin):
+    """Conformance tests for MongoEventStore, plus MongoDB-only behaviour"""
+
+    def make_store(self):
+        # Run against a throwaway database
+        previous = os.environ.get('MONGODB_NAME')
+        os.environ['MONGODB_NAME'] = 'vsm_conformance_test'
+        mongodb.get_mongodb_db().client.drop_database('vsm_conformance_test')
+        mongodb._ensured_indexes.clear()
+
+        def restore():
+            mongodb.get_mongodb_db().client.drop_database('vsm_conformance_test')
+            if previous is None:
+                os.environ.pop('MONGODB_NAME', None)
+            else:
+                os.environ['MONGODB_NAME'] = previous
+        self.addCleanup(restore)
+
+        # Changes must be visible to the cursor immediately in tests
+        self.settings_override = self.settings(CALENDAR_SYNC_SETTLE_SECONDS=0)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        return MongoEventStore()
+
+    def test_unsettled_changes_hold_back_the_cursor(self):
+        since = self.store.seed_change_version()
+        event_id = self.store.save_event(self.event('Fresh'))
+
+        with self.settings(CALENDAR_SYNC_SETTLE_SECONDS=60):
+            # Sent now, and again on the next poll in case an earlier version
+            # is still committing
+            delta = self.store.get_changes(since)
+            self.assertEqual([e['_id'] for e in delta['events']], [event_id])
+            self.assertEqual(delta['version'], since)
+            self.assertEqual(self.store.get_changes(0)['version'], since)
+
+            later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=61)
+            with mock.patch.object(mongodb, '_utcnow', return_value=later):
+                self.assertEqual(self.store.get_changes(since)['version'], since + 1)
+
+
+@unittest.skipUnless(mongodb_available(), 'MongoDB server not available')
+class MongoEventStoreTests(MongoEventStoreMixin, SimpleTestCase):
+    pass
+
+
+@unittest.skipUnless(mongomock, 'mongomock not installed')
+class MongomockEventStoreTests(MongoEventStoreMixin, SimpleTestCase):
+    """The same tests against mongomock, so they run without a server
+
+    mongomock ignores partial indexes, so index creation is skipped here;
+    SchemaTests covers the index definitions. Tests using operations it lacks
+    are skipped and only run against a real server.
+    """
+
+    unsupported = {
+        'test_atomic_batch_writes_nothing_on_failure': 'mongomock has no sessions',
+        'test_batch_best_effort_reports_each_item': 'mongomock bulk_write predates pymongo 4.19',
+        'test_upsert_by_uid': 'mongomock bulk_write predates pymongo 4.19',
+        'test_day_summaries': 'mongomock cannot $min over documents',
+        'test_search_ranks_title_matches_first': 'mongomock has no $text',
+    }
+
+    def setUp(self):
+        reason = self.unsupported.get(self._testMethodName)
+        if reason:
+            self.skipTest(reason)
+        patches = [
+            mock.patch.object(mongodb, '_shared_client', return_value=mongomock.MongoClient()),
+            mock.patch.object(mongodb, '_ensure_indexes'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        super().setUp()
+
+
+class StoreTestCase(SimpleTestCase):
+    """Runs each test against an empty disposable store
+
+    Set `backend` to pick the storage backend, and `use_fake_upstreams` to also
+    point the upstream APIs at local fakes (available as self.upstreams).
+    """
+    backend = 'sqlite'
+    use_fake_upstreams = False
+
+    def setUp(self):
+        self.store = self.enterContext(disposable_store(self.backend))
+        self.coordination = get_coordination_store()
+        if self.use_fake_upstreams:
+            self.upstreams = self.enterContext(fake_upstreams())
+
+
+class DashboardTests(StoreTestCase):
+    """Dashboard pages rendered against fake upstream APIs and a temporary store"""
+
+    def setUp(self):
+        super().setUp()
+        self.store.save_preferences({'location': 'Chennai', 'news_category': 'general'})
+        self.store.save_event({
+            'title': 'Dentist',
+            'start_date': datetime.date.today().isoformat(),
+            'start_time': '09:30',
+            'all_day': False,
+            'priority': 'high',
+        })
+
+    def test_index_uses_upstream_data(self):
+        with fake_upstreams() as upstreams:
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['weather']['location'], 'Chennai')
+        self.assertEqual(response.context['news'][0]['source'], 'Fake Wire')
+        self.assertEqual([e.title for e in response.context['calendar']['events']], ['Dentist'])
+        self.assertIn('/data/2.5/weather', upstreams['openweather'].requests)
+
+    def test_index_falls_back_when_upstreams_fail(self):
+        with fake_upstreams(error_rate=1.0):
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('error', response.context['weather'])
+        self.assertEqual(response.context['news'][0]['source'], 'System Message')
+
+    def test_location_by_coords(self):
+        with fake_upstreams():
+            response = self.client.get('/get-location-by-coords/', {'lat': '13.08', 'lon': '80.27'})
+        self.assertEqual(response.json(), {'location': 'Chennai'})
+
+    def test_location_by_coords_validates_and_rounds(self):
+        with fake_upstreams() as upstreams:
+            for lat, lon in (('north', '80.27'), ('13.08', 'nan'), ('91', '80.27'), ('13.08', '-180.5')):
+                response = self.client.get('/get-location-by-coords/', {'lat': lat, 'lon': lon})
+                self.assertEqual(response.status_code, 400, (lat, lon))
+            self.assertEqual(upstreams['geocoding'].requests, [])
+
+            # Positions a few hundred metres apart share one lookup
+            for lat, lon in (('13.0812', '80.2712'), ('13.0849', '80.2749')):
+                response = self.client.get('/get-location-by-coords/', {'lat': lat, 'lon': lon})
+                self.assertEqual(response.json(), {'location': 'Chennai'})
+            self.assertEqual(len(upstreams['geocoding'].requests), 1)
+
+
+class ReminderTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.sink = QueueSink()
+        self.now = datetime.datetime.now()
+
+    def reminder(self, title, minutes, **fields):
+        """An event with a reminder, starting `minutes` from now"""
+        start = self.now + datetime.timedelta(minutes=minutes)
+        event = {'title': title, 'start_date': start.date().isoformat(),
+                 'start_time': start.time().isoformat(timespec='seconds'), 'all_day': False, 'reminder': True}
+        event.update(fields)
+        return event
+
+    def delivered(self):
+        titles = []
+        while not self.sink.queue.empty():
+            titles.append(self.sink.queue.get_nowait()['title'])
+        return titles
+
+    @override_settings(REMINDER_LEAD_MINUTES=15, REMINDER_GRACE_MINUTES=10)
+    def test_scheduler_delivers_due_reminders_once(self):
+        clock = [time.time()]
+        scheduler = ReminderScheduler([self.sink], clock=lambda: clock[0])
+        scheduler.schedule({'_id': 'a', **self.reminder('Standup', 20)})  # due in 5 minutes
+        scheduler.schedule({'_id': 'b', **self.reminder('Dentist', 10)})  # due 5 minutes ago
+        scheduler.schedule({'_id': 'c', **self.reminder('Old', -60)})  # outside the grace window
+        scheduler.schedule({'_id': 'd', **self.reminder('Quiet', 10, reminder=False)})
+        self.assertEqual(len(scheduler), 2)
+
+        self.assertEqual(scheduler.deliver_due(), 1)
+        self.assertEqual(self.delivered(), ['Dentist'])
+        self.assertAlmostEqual(scheduler.seconds_until_next(), 300, delta=2)
+
+        # Moving an event replaces its reminder; cancelling drops it
+        scheduler.schedule({'_id': 'a', **self.reminder('Standup (moved)', 30)})
+        clock[0] += 20 * 60
+        scheduler.deliver_due()
+        self.assertEqual(self.delivered(), ['Standup (moved)'])
+        scheduler.schedule({'_id': 'e', **self.reminder('Cancelled', 40)})
+        scheduler.cancel('e')
+        self.assertIsNone(scheduler.seconds_until_next())
+
+    @override_settings(REMINDER_LEAD_MINUTES=15, REMINDER_GRACE_MINUTES=10, CALENDAR_SYNC_SETTLE_SECONDS=0)
+    def test_daemon_follows_feed_without_snapshots(self):
+        daemon = ReminderDaemon(ReminderScheduler([self.sink]))
+        daemon.load()
+        self.assertGreater(daemon.version, 0)
+
+        event_id = self.store.save_event(self.reminder('Dentist', 10))
+        with mock.patch.object(self.store, 'get_changes', wraps=self.store.get_changes) as get_changes:
+            daemon.sync()
+            daemon.sync()
+        self.assertFalse(any(call.args[0] == 0 for call in get_changes.call_args_list))
+        daemon.scheduler.deliver_due()
+        self.assertEqual(self.delivered(), ['Dentist'])
+
+        # A reset (compacted tombstones) keeps track of what was already sent
+        with mock.patch.object(self.store, 'get_changes', return_value={
+                'reset': True, 'version': daemon.version, 'events': [self.store.get_event(event_id)],
+                'deleted': [], 'has_more': False}):
+            daemon.sync()
+        daemon.scheduler.deliver_due()
+        self.assertEqual(self.delivered(), [])
+
+
+class ChangeFeedTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.today = datetime.date.today().isoformat()
+
+    def test_rejects_bad_parameters(self):
+        for params in ({'since': 'x'}, {'since': -1}, {'limit': 0}, {'after': 'not-an-id'}):
+            response = self.client.get('/events/changes/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_snapshot_pages_then_deltas(self):
+        for i in range(3):
+            self.store.save_event({'title': f'Event {i}', 'start_date': self.today})
+
+        page = self.client.get('/events/changes/', {'limit': 2}).json()
+        titles = [e['title'] for e in page['events']]
+        self.assertTrue(page['has_more'])
+        page = self.client.get('/events/changes/', {
+            'since': page['version'], 'limit': 2, 'after': page['after']}).json()
+        titles += [e['title'] for e in page['events']]
+        self.assertFalse(page['has_more'])
+        self.assertEqual(sorted(titles), ['Event 0', 'Event 1', 'Event 2'])
+
+        delta = self.client.get('/events/changes/', {'since': page['version']}).json()
+        self.assertFalse(delta['reset'])
+        self.assertEqual(delta['events'], [])
+
+    def test_compaction_forces_reset_for_old_cursors(self):
+        event_id = self.store.save_event({'title': 'Gone', 'start_date': self.today})
+        since = self.store.get_change_version()
+        self.store.delete_event(event_id)
+
+        call_command('compact_calendar_tombstones', '--days=-1', stdout=io.StringIO())
+        changes = self.client.get('/events/changes/', {'since': since}).json()
+        self.assertTrue(changes['reset'])
+        self.assertEqual(changes['events'], [])
+        # Clients that synced after the compaction still get deltas
+        current = self.client.get('/events/changes/', {'since': changes['version']}).json()
+        self.assertFalse(current['reset'])
+
+    @override_settings(CALENDAR_SYNC_PAGE_SIZE=2)
+    def test_inverted_index_follows_the_change_feed(self):
+        backend = search.InvertedIndexSearchBackend()
+        for i in range(3):
+            self.store.save_event({'title': f'Standup {i}', 'start_date': self.today})
+        self.assertEqual(backend.search('standup')['total'], 3)
+
+        # Writes go straight to the store, as another worker's would
+        moved = self.store.save_event({'title': 'Lunch', 'start_date': self.today})
+        self.store.update_event(moved, {'title': 'Standup lunch'})
+        gone = backend.search('standup 0')['results'][0]['id']
+        self.store.delete_event(gone)
+
+        found = backend.search('standup')
+        self.assertEqual(found['total'], 3)
+        self.assertNotIn(gone, [e['id'] for e in found['results']])
+        self.assertEqual(backend.search('lunch')['results'][0]['title'], 'Standup lunch')
+
+
+@override_settings(TIME_ZONE='Asia/Kolkata')
+class ICSTests(StoreTestCase):
+
+    def parse(self, *properties):
+        lines = ['BEGIN:VCALENDAR', 'BEGIN:VEVENT', 'UID:a@example.com', *properties,
+                 'END:VEVENT', 'END:VCALENDAR']
+        return list(iter_ics_events(line + '\r\n' for line in lines))
+
+    def test_times_are_converted_to_the_app_zone(self):
+        utc, = self.parse('DTSTART:20240301T220000Z', 'DTEND:20240301T230000Z')
+        self.assertEqual((utc['start_date'], utc['start_time']), ('2024-03-02', '03:30:00'))
+        self.assertEqual((utc['end_date'], utc['end_time']), (None, '04:30:00'))
+
+        berlin, = self.parse('DTSTART;TZID=Europe/Berlin:20240301T090000')
+        self.assertEqual((berlin['start_date'], berlin['start_time']), ('2024-03-01', '13:30:00'))
+
+        floating, = self.parse('DTSTART:20240301T090000', 'DTEND;TZID=Custom/Zone:20240301T100000')
+        self.assertEqual((floating['start_time'], floating['end_time']), ('09:00:00', '10:00:00'))
+
+    def test_all_day_and_folded_lines(self):
+        event, = self.parse('DTSTART;VALUE=DATE:20240301', 'DTEND;VALUE=DATE:20240303',
+                            'SUMMARY:Long\\, escaped', ' title', 'BEGIN:VALARM', 'END:VALARM')
+        self.assertTrue(event['all_day'])
+        self.assertEqual(event['end_date'], '2024-03-02')
+        self.assertEqual(event['title'], 'Long, escapedtitle')
+        self.assertTrue(event['reminder'])
+        self.assertEqual(self.parse('SUMMARY:No start'), [])
+
+    def test_export_round_trip(self):
+        event_id = self.store.save_event({
+            'title': 'Late call; with, punctuation', 'description': 'Line one\nLine two',
+            'start_date': '2024-03-02', 'start_time': '03:30:00', 'end_time': '04:30:00',
+            'all_day': False, 'location': 'Chennai', 'priority': 'high', 'reminder': True,
+        })
+        exported = ''.join(iter_ics_calendar(self.store.iter_events()))
+        self.assertIn('DTSTART:20240301T220000Z', exported)
+        self.assertIn(f'UID:{event_id}@', exported)
+
+        imported = list(iter_ics_events(io.StringIO(exported)))
+        self.assertEqual(self.store.upsert_events_by_uid(imported), {'inserted': 0, 'updated': 1})
+        event = self.store.get_event(event_id)
+        for field, value in (('title', 'Late call; with, punctuation'), ('description', 'Line one\nLine two'),
+                             ('start_date', '2024-03-02'), ('start_time', '03:30:00'),
+                             ('end_time', '04:30:00'), ('priority', 'high'), ('reminder', True)):
+            self.assertEqual(event[field], value, field)
+
+
+class EventTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.today = datetime.date.today()
+        self.enterContext(mock.patch.dict(events._cache, clear=True))
+
+    def doc(self, version=1, **fields):
+        return {'_id': 'a' * 24, 'version': version, 'title': 'Dentist',
+                'start_date': self.today.isoformat(), **fields}
+
+    def test_parses_dates_and_labels(self):
+        event = events.Event.from_document(self.doc(start_time='09:30', end_time='10:00'))
+        self.assertEqual(event.start_time, datetime.time(9, 30))
+        self.assertEqual((event.date, event.time_range), ('Today', '09:30 AM - 10:00 AM'))
+
+        all_day = events.Event.from_document(self.doc(
+            start_date=(self.today + datetime.timedelta(days=1)).isoformat(), start_time='09:30', all_day=True))
+        self.assertEqual((all_day.date, all_day.time, all_day.start_time), ('Tomorrow', 'All day', None))
+        self.assertLess(all_day.sort_key, events.Event.from_document(self.doc(
+            start_date=all_day.start_date.isoformat(), start_time='08:00')).sort_key)
+
+        with self.assertRaises(ValueError):
+            events.Event.from_document(self.doc(start_date='soon'))
+
+    def test_cache_is_keyed_by_id_and_version(self):
+        first = events.event_from_document(self.doc())
+        self.assertIs(events.event_from_document(self.doc()), first)
+        changed = events.event_from_document(self.doc(version=2, title='Moved'))
+        self.assertEqual(changed.title, 'Moved')
+        # Unversioned documents can change under the same key
+        self.assertEqual(events.event_from_document(self.doc(version=None, title='Seeded')).title, 'Seeded')
+        self.assertEqual(events.event_from_document(self.doc(version=None, title='Reseeded')).title, 'Reseeded')
+
+    @override_settings(EVENT_CACHE_SIZE=2)
+    def test_cache_evicts_least_recently_used(self):
+        first = events.event_from_document(self.doc(version=1))
+        events.event_from_document(self.doc(version=2))
+        events.event_from_document(self.doc(version=1))
+        events.event_from_document(self.doc(version=3))
+        self.assertEqual(list(events._cache), [('a' * 24, 1), ('a' * 24, 3)])
+        self.assertIs(events.event_from_document(self.doc(version=1)), first)
+
+    def test_agenda_reports_storage_outage(self):
+        self.store.save_event({'title': 'Dentist', 'start_date': self.today.isoformat(), 'priority': 'high'})
+        self.assertEqual(self.client.get('/events/agenda/').json()['events'][0]['title'], 'Dentist')
+
+        with mock.patch.object(self.store, 'events_by_priority', side_effect=OSError('disk gone')), \
+                self.assertLogs('app.views.events', 'ERROR'):
+            self.assertEqual(self.client.get('/events/agenda/').status_code, 503)
+
+    @override_settings(CALENDAR_FIRST_WEEKDAY=6)
+    def test_calendar_grid_rejects_out_of_range_dates(self):
+        for params in ({'view': 'week', 'date': '0001-01-01'}, {'view': 'week', 'date': '9999-12-31'},
+                       {'view': 'month', 'year': 9999, 'month': 12}, {'view': 'week', 'date': 'soon'}):
+            self.assertEqual(self.client.get('/calendar/grid/', params).status_code, 400, params)
+
+    def test_get_event_returns_stored_strings(self):
+        event_id = self.store.save_event({'title': 'Dentist', 'start_date': self.today.isoformat(),
+                                          'start_time': '09:30'})
+        self.assertEqual(self.client.get(f'/event/{event_id}/').json()['start_time'], '09:30')
+
+        event_id = self.store.save_event({'title': 'Someday', 'start_date': 'soon'})
+        response = self.client.get(f'/event/{event_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['start_date'], 'soon')
+
+
+class BatchViewTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.today = datetime.date.today().isoformat()
+        self.event_id = self.store.save_event({'title': 'Dentist', 'start_date': self.today})
+
+    def post(self, payload):
+        return self.client.post('/events/batch/', payload, content_type='application/json')
+
+    def test_rejects_invalid_payloads_before_writing(self):
+        self.assertEqual(self.client.post('/events/batch/', 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post({'operations': []}).status_code, 400)
+        self.assertEqual(self.post({'operations': [{'op': 'delete', 'id': self.event_id}], 'atomic': 'yes'}).status_code, 400)
+
+        response = self.post({'operations': [
+            {'op': 'create', 'data': {'title': 'Gym', 'start_date': self.today}},
+            {'op': 'create', 'data': {'title': 'No date'}},
+            {'op': 'update', 'id': 'bad', 'data': {'title': 'x'}},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'1', '2'})
+        self.assertEqual(len(self.store.list_events()), 1)
+
+    def test_malformed_ids_are_not_found(self):
+        self.assertEqual(self.client.post('/event/nope/delete/').status_code, 404)
+        self.assertEqual(self.client.get('/event/nope/').status_code, 404)
+
+    def test_rejects_duplicate_ids(self):
+        response = self.post({'operations': [
+            {'op': 'update', 'id': self.event_id, 'data': {'title': 'Moved'}},
+            {'op': 'delete', 'id': self.event_id},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['errors']), ['1'])
+        self.assertEqual(self.store.get_event(self.event_id)['title'], 'Dentist')
+
+    def test_best_effort_reports_missing_events(self):
+        response = self.post({'atomic': False, 'operations': [
+            {'op': 'update', 'id': self.event_id, 'data': {'title': 'Moved'}},
+            {'op': 'delete', 'id': '0' * 24},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.json()['results']], ['updated', 'not_found'])
+        self.assertEqual(self.store.get_event(self.event_id)['title'], 'Moved')
+
+    def test_atomic_batch_is_all_or_nothing(self):
+        response = self.post({'atomic': True, 'operations': [
+            {'op': 'create', 'data': {'title': 'Gym', 'start_date': self.today}},
+            {'op': 'delete', 'id': self.event_id},
+            {'op': 'update', 'id': '0' * 24, 'data': {'title': 'Missing'}},
+        ]})
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(response.json()['applied'])
+        self.assertEqual([e['title'] for e in self.store.list_events()], ['Dentist'])
+
+        response = self.post({'atomic': True, 'operations': [
+            {'op': 'create', 'data': {'title': 'Gym', 'start_date': self.today}},
+            {'op': 'delete', 'id': self.event_id},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e['title'] for e in self.store.list_events()], ['Gym'])
+
+
+class CallBudgetMixin:
+    """Round-trip budgets per view; each request is made once unmeasured to warm caches"""
+    use_fake_upstreams = True
+
+    def setUp(self):
+        super().setUp()
+        self.store.save_preferences({'location': 'Chennai', 'news_category': 'general'})
+        self.store.save_quotes([{'text': 'Stay hungry, stay foolish.', 'author': 'Stewart Brand'}])
+        self.event_id = self.store.save_event({
+            'title': 'Dentist',
+            'start_date': datetime.date.today().isoformat(),
+            'start_time': '09:30',
+            'all_day': False,
+            'priority': 'high',
+        })
+
+    def warm_get(self, path, **budget):
+        self.client.get(path)
+        with call_budget(**budget):
+            response = self.client.get(path)
+        self.assertLess(response.status_code, 500)
+        return response
+
+
+class SQLiteCallBudgetTests(CallBudgetMixin, StoreTestCase):
+
+    def test_index(self):
+        # Preferences, quote, weather and news come from the widget caches
+        self.warm_get('/', storage=1, http=0)
+
+    def test_calendar_view(self):
+        self.warm_get('/calendar-events/', storage=1, http=0)
+
+    def test_calendar_grid(self):
+        self.warm_get('/calendar/grid/', storage=1, http=0)
+
+    def test_priority_agenda(self):
+        self.warm_get('/events/agenda/?priority=high', storage=1, http=0)
+
+    def test_event_changes(self):
+        self.warm_get('/events/changes/?since=0', storage=1, http=0)
+
+    def test_get_event(self):
+        self.warm_get(f'/event/{self.event_id}/', storage=1, http=0)
+
+    def test_location_by_coords(self):
+        self.warm_get('/get-location-by-coords/?lat=13.08&lon=80.27', storage=0, http=0)
+
+    def test_exceeded_budget_lists_offending_calls(self):
+        with self.assertRaises(AssertionError) as raised:
+            with call_budget(storage=0):
+                self.client.get('/calendar/grid/')
+        self.assertIn('1 storage calls, budget 0', str(raised.exception))
+        self.assertIn('day_summaries(', str(raised.exception))
+
+
+@unittest.skipUnless(mongodb_available(), 'MongoDB server not available')
+class MongoCallBudgetTests(CallBudgetMixin, StoreTestCase):
+    backend = 'mongodb'
+
+    def test_index(self):
+        self.warm_get('/', mongo=1, http=0)
+
+    def test_calendar_grid(self):
+        self.warm_get('/calendar/grid/', mongo=1, http=0)
+
+    def test_priority_agenda(self):
+        self.warm_get('/events/agenda/?priority=high', mongo=1, http=0)
+
+
+class ServerTimingTests(StoreTestCase):
+    use_fake_upstreams = True
+
+    def setUp(self):
+        super().setUp()
+        self.store.save_preferences({'location': 'Chennai'})
+        reset_span_histograms()
+
+    def test_spans_reported_per_widget(self):
+        with self.settings(REQUEST_TIMING_ENABLED=True):
+            response = Client().get('/')
+        names = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        for name in ('weather', 'news', 'quote', 'calendar', 'render', 'total'):
+            self.assertIn(name, names)
+
+        histograms = get_span_histograms()
+        self.assertEqual(histograms['weather']['count'], 1)
+        self.assertEqual(histograms['view.index']['count'], 1)
+
+    def test_disabled_by_default(self):
+        with self.settings(REQUEST_TIMING_ENABLED=False):
+            response = Client().get('/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(get_span_histograms(), {})
+
+
+class MetricsTests(StoreTestCase):
+    use_fake_upstreams = True
+
+    def setUp(self):
+        super().setUp()
+        self.store.save_preferences({'location': 'Chennai'})
+
+    def test_dashboard_request_is_exported(self):
+        client = Client()
+        client.get('/')
+        text = client.get('/metrics').content.decode()
+        self.assertIn('# TYPE vsm_view_duration_seconds histogram', text)
+        self.assertIn('vsm_view_duration_seconds_bucket{view="index",le="+Inf"}', text)
+        self.assertIn('vsm_upstream_requests_total{api="openweather.weather",status="200"}', text)
+        self.assertIn('vsm_span_duration_seconds_count{span="weather"}', text)
+        # The scrape itself is in flight while rendering
+        self.assertIn('vsm_http_requests_in_flight 1', text)
+
+    def test_values_merged_across_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        label = f'merge-test-{os.getpid()}'
+        metrics.UPSTREAM_REQUESTS.inc(label, '200', amount=2)
+        # A worker that has since exited: its counters stay, its gauges do not
+        exited = 2 ** 22 + 1
+        with open(os.path.join(directory, f'{exited}.json'), 'w') as snapshot_file:
+            snapshot_file.write(
+                '{"pid": %d, "values": [["vsm_upstream_requests_total", ["%s", "200"], 3],'
+                ' ["vsm_http_requests_in_flight", [], 5]]}' % (exited, label))
+
+        with self.settings(METRICS_MULTIPROC_DIR=directory):
+            merged = metrics.collect()
+        self.assertEqual(merged[('vsm_upstream_requests_total', (label, '200'))], 5)
+        self.assertEqual(merged.get(('vsm_http_requests_in_flight', ()), 0), 0)
+
+    def test_exited_workers_are_archived(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        label = f'archive-test-{os.getpid()}'
+
+        def write(filename, pid, started, count):
+            with open(os.path.join(directory, filename), 'w') as snapshot_file:
+                json.dump({'pid': pid, 'started': started,
+                           'values': [['vsm_upstream_requests_total', [label, '200'], count]]}, snapshot_file)
+
+        # An exited worker, and an earlier process that had this test's pid
+        write('4194305-a.json', 2 ** 22 + 1, 1.0, 3)
+        write(f'{os.getpid()}-old.json', os.getpid(), 0.0, 4)
+        with self.settings(METRICS_MULTIPROC_DIR=directory):
+            first = metrics.collect()
+            self.assertCountEqual([name for name in os.listdir(directory) if name.endswith('.json')],
+                                  [metrics.ARCHIVE_FILE, f'{os.getpid()}-{metrics._token}.json'])
+            # A later exited worker is added to the archive; nothing is counted twice
+            write('4194307-b.json', 2 ** 22 + 3, 2.0, 1)
+            second = metrics.collect()
+        key = ('vsm_upstream_requests_total', (label, '200'))
+        self.assertEqual(first[key], 7)
+        self.assertEqual(second[key], 8)
+
+
+class QueryLogTests(SimpleTestCase):
+
+    def command_events(self, command_name, command, micros, request_id=1):
+        common = {'command_name': command_name, 'database_name': 'vsm_db',
+                  'request_id': request_id, 'connection_id': ('localhost', 27017)}
+        return (SimpleNamespace(command=command, **common),
+                SimpleNamespace(duration_micros=micros, **common))
+
+    def test_shape_hides_values(self):
+        description = query_log.describe_command('find', 'vsm_db', {
+            'find': 'app_calendarevent',
+            'filter': {'start_date': {'$gte': '2026-01-01'}, 'title': {'$in': ['a', 'b']},
+                       '$or': [{'priority': 'high'}, {'reminder': True}]},
+            'sort': {'start_date': 1},
+        })
+        self.assertEqual(description, (
+            'find vsm_db.app_calendarevent filter={"start_date": {"$gte": "?"}, '
+            '"title": {"$in": ["?"]}, "$or": [{"priority": "?"}, {"reminder": "?"}]} '
+            'sort={"start_date": 1}'))
+        self.assertEqual(
+            query_log.describe_command('delete', 'vsm_db', {
+                'delete': 'app_quote', 'deletes': [{'q': {'_id': 1}, 'limit': 1}] * 3}),
+            'delete vsm_db.app_quote q={"_id": "?"} (3 statements)')
+
+    def test_commands_attributed_to_request_and_slow_ones_logged(self):
+        listener = query_log._QueryListener()
+        stats = query_log.QueryStats()
+        token = query_log._current.set(stats)
+        try:
+            with self.settings(MONGODB_SLOW_MS=100), \
+                    self.assertLogs('app.utils.query_log', 'WARNING') as logs:
+                for request_id, micros in ((1, 2000), (2, 250000)):
+                    started, finished = self.command_events(
+                        'find', {'find': 'app_calendarevent', 'filter': {'title': 'Dentist'}},
+                        micros, request_id)
+                    listener.started(started)
+                    listener.succeeded(finished)
+                started, finished = self.command_events('ping', {'ping': 1}, 500, 3)
+                listener.started(started)
+                listener.succeeded(finished)
+        finally:
+            query_log._current.reset(token)
+
+        self.assertEqual((stats.ops, stats.slow), (2, 1))
+        self.assertAlmostEqual(stats.seconds, 0.252)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('filter={"title": "?"}', logs.output[0])
+        self.assertNotIn('Dentist', logs.output[0])
+
+    def test_debug_headers(self):
+        with disposable_store('sqlite'), self.settings(DEBUG=True):
+            response = Client().get('/calendar/grid/')
+        self.assertEqual(response['X-MongoDB-Operations'], '0')
+        self.assertIn('X-MongoDB-Time', response)
+
+
+class UpstreamTests(StoreTestCase):
+
+    def test_errors_hide_api_keys(self):
+        url = 'http://127.0.0.1:9/data/2.5/weather?q=Chennai&appid=SECRETKEY'
+        with self.assertRaises(requests.ConnectionError) as raised:
+            upstream.get('openweather.weather', url, timeout=1)
+        self.assertIn('appid=REDACTED', str(raised.exception))
+        self.assertNotIn('SECRETKEY', str(raised.exception))
+        # The chained urllib3 errors repeat the URL, so they are dropped
+        self.assertTrue(raised.exception.__suppress_context__)
+
+
+class LoggingTests(SimpleTestCase):
+
+    def record(self, msg, *args, level=logging.INFO, **extra):
+        record = logging.makeLogRecord({'name': 'app.views', 'msg': msg, 'args': args,
+                                        'levelno': level, 'levelname': logging.getLevelName(level)})
+        record.__dict__.update(extra)
+        return record
+
+    def test_sampling_groups_by_message_template(self):
+        sampler = SamplingFilter(rate=10)
+        passed = [sampler.filter(self.record("Getting weather for %s", city))
+                  for city in ['Chennai', 'Paris'] * 10]
+        self.assertEqual(passed.count(True), 2)
+        self.assertTrue(passed[0])
+        # Errors are never sampled
+        self.assertTrue(all(sampler.filter(self.record("Boom", level=logging.ERROR)) for _ in range(5)))
+
+    def test_json_lines_include_extra_fields(self):
+        line = JsonFormatter().format(self.record("Found %d events", 3, view='index'))
+        entry = json.loads(line)
+        self.assertEqual(entry['message'], 'Found 3 events')
+        self.assertEqual((entry['level'], entry['logger'], entry['view']), ('INFO', 'app.views', 'index'))
+
+    def test_background_handler_writes_off_thread(self):
+        stream = io.StringIO()
+        handler = BackgroundStreamHandler(stream)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        handler.handle(self.record("Updated location to %s", 'Chennai'))
+        handler.close()
+        self.assertEqual(stream.getvalue(), 'INFO Updated location to Chennai\n')
+
+
+class ProfilingTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def profile(self, query, **headers):
+        with self.settings(PROFILING_ENABLED=True, PROFILING_TOKEN='secret',
+                           PROFILING_DIR=self.directory, PROFILING_SAMPLE_INTERVAL_MS=1):
+            return Client().get('/calendar/grid/' + query, headers=headers)
+
+    def test_requires_token_or_staff(self):
+        response = self.profile('?profile=cprofile', x_profile_token='wrong')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Files', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_cprofile_writes_pstats_and_collapsed_stacks(self):
+        response = self.profile('?profile=cprofile', x_profile_token='secret')
+        files = response['X-Profile-Files'].split(', ')
+        self.assertEqual([name.rsplit('.', 1)[1] for name in files], ['collapsed', 'pstats'])
+        self.assertIn('calendar_grid', files[0])
+        stats = pstats.Stats(os.path.join(self.directory, files[1]))
+        self.assertTrue(any(name == 'get_calendar_grid' for _, _, name in stats.stats))
+
+    @override_settings(PROFILING_MAX_FILES=3)
+    def test_keeps_only_the_newest_profiles(self):
+        for i in range(3):
+            path = os.path.join(self.directory, f'old-{i}.collapsed')
+            open(path, 'w').close()
+            os.utime(path, (i, i))
+        open(os.path.join(self.directory, 'notes.txt'), 'w').close()
+
+        files = self.profile('?profile=cprofile', x_profile_token='secret')['X-Profile-Files'].split(', ')
+        self.assertCountEqual(os.listdir(self.directory), files + ['old-2.collapsed', 'notes.txt'])
+
+    def test_report_replaces_response(self):
+        response = self.profile('?profile=cprofile&profile_report=1', x_profile_token='secret')
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertIn('cumulative', response.content.decode())
+
+    def test_sampler_collapses_stacks(self):
+        stop = threading.Event()
+        def busy_wait():
+            while not stop.is_set():
+                pass
+        worker = threading.Thread(target=busy_wait)
+        worker.start()
+        sampler = StackSampler(0.001, thread_ids={worker.ident}).start()
+        time.sleep(0.05)
+        sampler.stop()
+        stop.set()
+        worker.join()
+
+        lines = format_collapsed(sampler.take()).splitlines()
+        stacks = [line.rsplit(' ', 1)[0] for line in lines]
+        self.assertTrue(any(
+            'app.tests:ProfilingTests.test_sampler_collapses_stacks.<locals>.busy_wait' in stack.split(';')
+            for stack in stacks), lines)
+        self.assertTrue(all(stack.startswith('threading:Thread._bootstrap') for stack in stacks))
+
+
+@unittest.skipUnless(mongodb_available(), 'MongoDB server not available')
+class MigrateToMongoDBTests(StoreTestCase, TestCase):
+    """migrate_to_mongodb copying the Django tables into a throwaway database"""
+    backend = 'mongodb'
+
+    def setUp(self):
+        super().setUp()
+        self.db = mongodb.get_mongodb_db()
+        for i in range(5):
+            CalendarEvent.objects.create(title=f'Event {i}', start_date=datetime.date(2024, 3, i + 1),
+                                         start_time=datetime.time(9, 30))
+
+    def migrate(self, *args):
+        output = io.StringIO()
+        call_command('migrate_to_mongodb', '--only=events', '--chunk-size=2', *args, stdout=output)
+        return output.getvalue()
+
+    def interrupt_after_first_chunk(self):
+        chunks = []
+        def convert(db, rows):
+            if chunks:
+                raise pymongo.errors.AutoReconnect('connection lost')
+            chunks.append(rows)
+            return migrate_to_mongodb._event_documents(db, rows)
+        with mock.patch.object(migrate_to_mongodb, 'MIGRATIONS',
+                               [('events', CalendarEvent, 'app_calendarevent', convert)]), \
+                self.assertRaises(CommandError):
+            self.migrate()
+
+    def validator(self, name):
+        return next(self.db.list_collections(filter={'name': name}))['options'].get('validator')
+
+    def test_copies_in_chunks_and_swaps_in(self):
+        self.db.app_calendarevent.insert_one({'title': 'Stale', 'start_date': '2020-01-01'})
+
+        output = self.migrate()
+        self.assertEqual(output.count('app_calendarevent: '), 3)
+        documents = list(self.db.app_calendarevent.find())
+        self.assertEqual(sorted(d['title'] for d in documents), [f'Event {i}' for i in range(5)])
+        self.assertEqual(len({d['version'] for d in documents}), 5)
+        self.assertEqual(documents[0]['start_time'], '09:30:00')
+        self.assertEqual(self.validator('app_calendarevent'), schema.CALENDAR_EVENT_VALIDATOR)
+        self.assertNotIn('app_calendarevent__staging', self.db.list_collection_names())
+        self.assertIsNone(self.db[migrate_to_mongodb.CHECKPOINT_COLLECTION].find_one())
+        # Sync clients holding older versions get a snapshot
+        counter = self.db.app_counters.find_one({'_id': mongodb.EVENT_VERSION_COUNTER})
+        self.assertEqual(counter['floor'], counter['seq'])
+
+    def test_resumes_after_the_checkpoint(self):
+        self.interrupt_after_first_chunk()
+        checkpoint = self.db[migrate_to_mongodb.CHECKPOINT_COLLECTION].find_one()
+        self.assertEqual(checkpoint['copied'], 2)
+
+        output = self.migrate()
+        self.assertIn(f"Resuming app_calendarevent after id {checkpoint['last_pk']}", output)
+        self.assertEqual(output.count('app_calendarevent: '), 2)
+        self.assertEqual(self.db.app_calendarevent.count_documents({}), 5)
+
+    def test_resume_recreates_a_lost_staging_collection(self):
+        self.interrupt_after_first_chunk()
+        self.db.drop_collection('app_calendarevent__staging')
+
+        output = self.migrate()
+        self.assertIn('starting over', output)
+        self.assertIn('Migrated 5 rows', output)
+        self.assertEqual(self.db.app_calendarevent.count_documents({}), 5)
+        self.assertEqual(self.validator('app_calendarevent'), schema.CALENDAR_EVENT_VALIDATOR)
+
+
+@unittest.skipUnless(mongodb_available(), 'MongoDB server not available')
+class InitMongoDBCalendarTests(StoreTestCase):
+    backend = 'mongodb'
+
+    def test_replaces_events_and_reports_foreign_ids(self):
+        old_id = self.store.save_event({'title': 'Old', 'start_date': '2024-01-01'})
+        db = mongodb.get_mongodb_db()
+        db.app_calendarevent.insert_many([
+            {'_id': 'hand-seeded', 'title': 'String id', 'start_date': '2024-01-01'},
+            {'_id': 7, 'title': 'Integer id', 'start_date': '2024-01-01'},
+        ])
+        since = self.store.get_change_version()
+
+        output = io.StringIO()
+        call_command('init_mongodb_calendar', stdout=output)
+        self.assertIn("Left 2 events whose _id is not an ObjectId: 'hand-seeded', 7", output.getvalue())
+        self.assertIn('Successfully initialized', output.getvalue())
+        self.assertIsNone(self.store.get_event(old_id))
+        self.assertEqual(db.app_calendarevent.count_documents({}), 7)
+        # Sync clients learn about the replaced event
+        self.assertEqual(self.store.get_changes(since)['deleted'], [old_id])
+
+
+class GenerateDataTests(StoreTestCase):
+
+    def test_recurring_series_carry_their_recurrence(self):
+        generated = generate_data.generate_events(random.Random(1), 500, datetime.date(2024, 3, 1), 30, 30)
+        self.assertEqual(len(generated), 500)
+        self.assertEqual(generated, generate_data.generate_events(
+            random.Random(1), 500, datetime.date(2024, 3, 1), 30, 30))
+
+        series = collections.defaultdict(list)
+        for event in generated:
+            if 'recurrence' in event:
+                series[event['recurrence']['series']].append(event)
+        self.assertTrue(series)
+        for occurrences in series.values():
+            recurrence = occurrences[0]['recurrence']
+            self.assertEqual([e['recurrence']['index'] for e in occurrences], list(range(len(occurrences))))
+            self.assertEqual(recurrence['occurrences'], len(occurrences))
+            first = datetime.date.fromisoformat(occurrences[0]['start_date'])
+            self.assertEqual(occurrences[-1]['start_date'], (first + datetime.timedelta(
+                days=recurrence['interval_days'] * (len(occurrences) - 1))).isoformat())
+
+    def test_writes_to_the_storage_backend(self):
+        output = io.StringIO()
+        call_command('generate_data', '--events=50', '--quotes=5', '--workers=1', '--batch-size=20',
+                     stdout=output)
+        self.assertIn('Generated 56 rows', output.getvalue())
+        stored = self.store.list_events()
+        self.assertEqual(len(stored), 50)
+        self.assertTrue(any('series' in event.get('recurrence', {}) for event in stored))
+        self.assertEqual(len(self.store.get_quotes()), 5)
+        self.assertIn(self.store.get_preferences()['location'], generate_data.CITIES)
+
+    def test_many_preferences_need_the_django_target(self):
+        with self.assertRaisesMessage(CommandError, 'use --target django'):
+            call_command('generate_data', '--preferences=1000', stdout=io.StringIO())
+
+
+class SchemaTests(SimpleTestCase):
+    """ensure_schema against a fake database that records what it is asked to do"""
+
+    def setUp(self):
+        self.enterContext(mock.patch.object(mongodb, '_ensured_indexes', set()))
+        self.db = mock.MagicMock()
+        self.indexes = {}
+        self.collections = {}
+        self.db.__getitem__.side_effect = lambda name: self.collections.setdefault(name, mock.Mock(
+            list_indexes=lambda: self.indexes.get(name, [])))
+        self.enterContext(mock.patch.object(mongodb, 'get_mongodb_db', return_value=self.db))
+
+    def as_listed(self, index, **changes):
+        """An index the way list_indexes returns it"""
+        document = dict(index.document, v=2, **changes)
+        if 'weights' in document:
+            document.update(key={'_fts': 'text', '_ftsx': 1}, default_language='english')
+        return document
+
+    def report(self, **kwargs):
+        return {entry['collection']: entry for entry in schema.ensure_schema(**kwargs)}
+
+    def test_applies_missing_and_outdated_validators(self):
+        self.db.list_collections.return_value = [
+            {'name': 'app_calendarevent', 'options': schema.validator_options(schema.CALENDAR_EVENT_VALIDATOR)},
+            {'name': 'app_quote', 'options': {'validator': {'$jsonSchema': {}}}},
+        ]
+        report = self.report(dry_run=True)
+        self.assertNotIn('update validator', report['app_calendarevent']['actions'])
+        self.assertIn('update validator', report['app_quote']['actions'])
+        self.assertIn('create collection', report['app_userpreference']['actions'])
+        self.db.command.assert_not_called()
+        self.db.create_collection.assert_not_called()
+
+        self.report()
+        self.db.command.assert_called_once_with(
+            'collMod', 'app_quote', **schema.validator_options(schema.QUOTE_VALIDATOR))
+        self.db.create_collection.assert_any_call(
+            'app_userpreference', **schema.validator_options(schema.USER_PREFERENCE_VALIDATOR))
+        self.db.create_collection.assert_any_call('app_counters')
+
+    @override_settings(MONGODB_VALIDATION_LEVEL='strict')
+    def test_validation_level_change_updates_the_validator(self):
+        self.db.list_collections.return_value = [
+            {'name': 'app_quote', 'options': dict(schema.validator_options(schema.QUOTE_VALIDATOR),
+                                                  validationLevel='moderate')},
+        ]
+        self.assertIn('update validator', self.report(dry_run=True)['app_quote']['actions'])
+
+    def test_reports_index_drift_without_dropping(self):
+        declared = mongodb.CALENDAR_EVENT_INDEXES
+        self.db.list_collections.return_value = [{'name': 'app_calendarevent', 'options': {}}]
+        self.indexes['app_calendarevent'] = [
+            {'key': {'_id': 1}, 'name': '_id_', 'v': 2},
+            # Declared unique, built without it
+            self.as_listed(declared[-2], unique=False),
+            # Same index as declared; the server adds v and text index internals
+            self.as_listed(declared[-1]),
+            {'key': {'title': 1}, 'name': 'title_1', 'v': 2},
+        ] + [self.as_listed(index) for index in declared[1:-2]]
+
+        entry = self.report()['app_calendarevent']
+        self.assertEqual(entry['changed'], ['uid_1'])
+        self.assertEqual(entry['extra'], ['title_1'])
+        self.assertEqual([a for a in entry['actions'] if a.startswith('create index')], ['create index version_1'])
+        (created,), _ = self.collections['app_calendarevent'].create_indexes.call_args
+        self.assertEqual([index.document['name'] for index in created], ['version_1'])
+        self.assertIn('app_calendarevent', mongodb._ensured_indexes)
+
+    def test_check_fails_on_drift(self):
+        self.db.list_collections.return_value = []
+        with self.assertRaisesMessage(CommandError, 'difference(s) from its declaration'):
+            call_command('ensure_schema', '--check', stdout=io.StringIO())
+        self.db.create_collection.assert_not_called()
+
+
+class ImportReportTests(SimpleTestCase):
+
+    def test_worker_start_skips_lazy_integrations(self):
+        output = io.StringIO()
+        call_command('import_report', '--top', '3', stdout=output)
+        self.assertIn('MB max RSS', output.getvalue())
+        self.assertIn('Within budget', output.getvalue())
+
+    def test_budget_enforced(self):
+        with self.assertRaisesMessage(CommandError, 'json is imported at startup'):
+            call_command('import_report', '--forbid', 'json', stdout=io.StringIO())
+
+
+class TTLCacheTests(SimpleTestCase):
+
+    def test_entries_expire(self):
+        cache = TTLCache('test', 'WEATHER_CACHE_SECONDS')
+        with self.settings(WEATHER_CACHE_SECONDS=0.05):
+            cache.set('Chennai', {'temp': 31})
+        self.assertEqual(cache.get('Chennai'), {'temp': 31})
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('Chennai'))
+
+    def test_zero_ttl_disables(self):
+        cache = TTLCache('test', 'WEATHER_CACHE_SECONDS')
+        with self.settings(WEATHER_CACHE_SECONDS=0):
+            cache.set('Chennai', {'temp': 31})
+        self.assertIsNone(cache.get('Chennai'))
+
+    def test_shared_entries_serve_other_workers(self):
+        with disposable_store('sqlite'):
+            cache = TTLCache('test', 'WEATHER_CACHE_SECONDS', shared=True)
+            cache.set('Chennai', {'temp': 31})
+            # Another worker's cache starts empty but finds the shared entry
+            cache.clear()
+            with call_budget(storage=1):
+                self.assertEqual(cache.get('Chennai'), {'temp': 31})
+            with call_budget(storage=0):
+                self.assertEqual(cache.get('Chennai'), {'temp': 31})
+
+            data, _ = get_coordination_store().cache_get('test:Chennai')
+            self.assertEqual(decode_value(data), {'temp': 31})
+            cache.delete('Chennai')
+            self.assertIsNone(get_coordination_store().cache_get('test:Chennai'))
+
+    def test_shared_entries_keep_their_expiry(self):
+        with disposable_store('sqlite'):
+            cache = TTLCache('test', 'WEATHER_CACHE_SECONDS', shared=True)
+            with self.settings(WEATHER_CACHE_SECONDS=0.1):
+                cache.set('Chennai', {'temp': 31})
+            cache.clear()
+            self.assertEqual(cache.get('Chennai'), {'temp': 31})
+            time.sleep(0.11)
+            self.assertIsNone(cache.get('Chennai'))
+
+
+class HealthTests(StoreTestCase):
+    use_fake_upstreams = True
+
+    def setUp(self):
+        super().setUp()
+        health.reset_health()
+        self.addCleanup(health.reset_health)
+
+    def test_healthz(self):
+        with call_budget(storage=0, http=0):
+            response = self.client.get('/healthz')
+        self.assertEqual(response.json(), {'status': 'ok'})
+
+    def test_warm_up_only_in_server_processes(self):
+        for argv, run_main, expected in ((['gunicorn'], None, True),
+                                         (['manage.py', 'runserver'], 'true', True),
+                                         (['manage.py', 'runserver'], None, False),
+                                         (['manage.py', 'migrate'], None, False)):
+            environ = {'RUN_MAIN': run_main} if run_main else {}
+            with mock.patch('sys.argv', argv), mock.patch.dict(os.environ, environ), \
+                    mock.patch('app.utils.health.start_warm_up') as start_warm_up, \
+                    self.settings(WARMUP_ON_STARTUP=True):
+                if not run_main:
+                    os.environ.pop('RUN_MAIN', None)
+                apps.get_app_config('app').ready()
+            self.assertEqual(start_warm_up.called, expected, argv)
+
+    def test_ready_once_warm(self):
+        timings = health.warm_up()
+        self.assertEqual(set(timings), {'storage', 'preferences', 'quote', 'weather', 'news', 'calendar'})
+        self.assertIn('/data/2.5/weather', self.upstreams['openweather'].requests)
+
+        response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['checks']['warmup'], 'done')
+        self.assertTrue(response.json()['checks']['storage']['ok'])
+        # The first request after warm-up is served from the caches
+        with call_budget(storage=1, http=0):
+            self.client.get('/')
+
+    def test_probes_reuse_recent_ping(self):
+        health.warm_up()
+        self.client.get('/readyz')
+        with call_budget(storage=0, http=0):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_ready_until_warm(self):
+        with self.settings(HEALTH_CHECK_MAX_AGE_SECONDS=60):
+            health._warmup_thread = 'running elsewhere'  # Keep the probe from starting one
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['warmup'], 'running')
+
+
+# Data shared with other workers would otherwise mask the outage
+@override_settings(SHARED_CACHE_ENABLED=False, SINGLEFLIGHT_RESULT_SECONDS=0)
+class SnapshotTests(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store.save_preferences({'location': 'Chennai'})
+        self.store.save_quotes([{'text': 'Stay hungry, stay foolish.', 'author': 'Stewart Brand'}])
+        self.store.save_event({'title': 'Dentist', 'start_date': datetime.date.today().isoformat(),
+                               'start_time': '09:30', 'all_day': False})
+        with fake_upstreams():
+            self.client.get('/')
+        clear_caches()
+
+    def test_outage_renders_last_good_data(self):
+        with open(settings.DASHBOARD_SNAPSHOT_PATH) as snapshot_file:
+            self.assertEqual(set(json.load(snapshot_file)), {'weather:Chennai', 'news:Chennai', 'quote', 'calendar'})
+
+        with fake_upstreams(error_rate=1.0) as upstreams, \
+                mock.patch.object(self.store, 'get_random_quote', side_effect=OSError('disk gone')), \
+                mock.patch.object(self.store, 'events_between', side_effect=OSError('disk gone')):
+            response = self.client.get('/')
+            failed_calls = len(upstreams['openweather'].requests)
+            # While failing, the snapshot is served without trying the live path
+            second = self.client.get('/')
+            self.assertEqual(len(upstreams['openweather'].requests), failed_calls)
+
+        for page in (response, second):
+            self.assertEqual(page.context['weather']['location'], 'Chennai')
+            self.assertEqual(page.context['news'][0]['source'], 'Fake Wire')
+            self.assertEqual(page.context['quote']['author'], 'Stewart Brand')
+            self.assertEqual([event.title for event in page.context['calendar']['events']], ['Dentist'])
+            self.assertEqual(set(page.context['stale']), {'weather', 'news', 'quote', 'calendar'})
+        self.assertContains(response, 'Offline · last updated', count=4)
+
+    def test_live_data_is_not_marked_stale(self):
+        with fake_upstreams():
+            response = self.client.get('/')
+        self.assertEqual(response.context['stale'], {})
+        self.assertNotContains(response, 'Offline')
+
+    def test_snapshot_is_kept_per_location(self):
+        self.store.save_preferences({'location': 'Berlin'})
+        dashboard.forget_preferences()
+        with fake_upstreams(error_rate=1.0):
+            response = self.client.get('/')
+        self.assertIn('error', response.context['weather'])
+        self.assertEqual(response.context['news'][0]['source'], 'System Message')
+        self.assertNotIn('weather', response.context['stale'])
+
+    @override_settings(DASHBOARD_LIVE_DEADLINE_SECONDS=0.05, DASHBOARD_SNAPSHOT_MIN_INTERVAL_SECONDS=0)
+    def test_slow_upstream_serves_snapshot_then_records(self):
+        saved_at = snapshot.load('weather:Chennai')[1]
+        with fake_upstreams(latency=0.3):
+            started = time.monotonic()
+            response = self.client.get('/')
+            self.assertLess(time.monotonic() - started, 0.3)
+            self.assertEqual(set(response.context['stale']), {'weather', 'news'})
+
+            # The fetch finishes in the background and refreshes the snapshot
+            deadline = time.monotonic() + 5
+            while snapshot.load('weather:Chennai')[1] == saved_at and time.monotonic() < deadline:
+                time.sleep(0.05)
+        self.assertGreater(snapshot.load('weather:Chennai')[1], saved_at)
+
+
+class SingleFlightTests(StoreTestCase):
+
+    def test_concurrent_callers_share_one_fetch(self):
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return {'temp': 31}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(singleflight.coalesce('weather:Chennai', fetch)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'temp': 31}] * 5)
+
+    def test_waits_for_result_from_another_worker(self):
+        self.coordination.begin_flight('weather:Chennai', 'other-worker', 30)
+        finisher = threading.Timer(0.1, self.coordination.finish_flight,
+                                   ('weather:Chennai', 'other-worker', {'temp': 31}, 30))
+        finisher.start()
+        self.addCleanup(finisher.cancel)
+
+        value = singleflight.coalesce('weather:Chennai', lambda: self.fail('fetched twice'))
+        self.assertEqual(value, {'temp': 31})
+
+    @override_settings(SINGLEFLIGHT_TIMEOUT_SECONDS=0.2)
+    def test_fetches_itself_when_other_worker_stalls(self):
+        self.coordination.begin_flight('news:Chennai', 'stuck-worker', 30)
+        self.assertEqual(singleflight.coalesce('news:Chennai', lambda: ['headline']), ['headline'])
+
+    def test_failed_fetch_releases_the_claim(self):
+        def fetch():
+            raise OSError('upstream down')
+
+        with self.assertRaises(OSError):
+            singleflight.coalesce('geocoding:13.08,80.27', fetch)
+        self.assertIsNone(self.coordination.get_flight('geocoding:13.08,80.27'))
+
+
+@override_settings(UPSTREAM_DAILY_QUOTAS={'newsapi': 100}, UPSTREAM_QUOTA_BURST_FRACTION=0.05,
+                   UPSTREAM_QUOTA_RESERVE_FRACTION=0.4)
+class QuotaTests(StoreTestCase):
+
+    def test_background_refreshes_keep_a_reserve(self):
+        # Five tokens, two of them reserved for background refreshes
+        self.assertEqual([quota.acquire('newsapi.everything') for _ in range(4)], [True, True, True, False])
+        # At the same bucket level a refresh may still spend the reserve
+        with quota.background():
+            self.assertEqual([quota.acquire('newsapi.everything') for _ in range(3)], [True, True, False])
+        self.assertFalse(quota.acquire('newsapi.everything'))
+
+    def test_warm_up_is_a_background_refresh(self):
+        seen = []
+        def acquire(api, cost=1):
+            seen.append(quota._background.get())
+            return True
+        with mock.patch.object(quota, 'acquire', side_effect=acquire), fake_upstreams():
+            health.warm_up()
+        self.assertTrue(seen)
+        self.assertTrue(all(seen))
+
+    def test_unlisted_provider_is_unlimited(self):
+        self.assertTrue(all(quota.acquire('openweather.weather') for _ in range(20)))
+
+    def test_rate_limited_response_pauses_the_provider(self):
+        limited = SimpleNamespace(status_code=429, headers={'Retry-After': '120'})
+        with mock.patch('app.utils.upstream.requests.get', return_value=limited) as get:
+            self.assertEqual(upstream.get('newsapi.everything', 'http://news.invalid/').status_code, 429)
+            with self.assertRaises(upstream.QuotaExceeded):
+                upstream.get('newsapi.top_headlines', 'http://news.invalid/')
+        self.assertEqual(get.call_count, 1)
+
+    def test_spent_budget_serves_last_good_data(self):
+        self.store.save_preferences({'location': 'Chennai'})
+        with override_settings(SHARED_CACHE_ENABLED=False, SINGLEFLIGHT_RESULT_SECONDS=0), fake_upstreams() as upstreams:
+            self.client.get('/')
+            clear_caches()
+            with self.settings(UPSTREAM_QUOTA_ENABLED=True):
+                quota.throttle('newsapi', 3600)
+                news_calls = len(upstreams['newsapi'].requests)
+                response = self.client.get('/')
+            self.assertEqual(len(upstreams['newsapi'].requests), news_calls)
+        self.assertIn('news', response.context['stale'])
+        self.assertEqual(response.context['news'][0]['source'], 'Fake Wire')
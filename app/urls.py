@@ -1,15 +1,25 @@
 from django.urls import path
-from . import views
+from .views import dashboard, events, location, monitoring
 
 urlpatterns = [
-    path('', views.index, name='index'),
-    path('calendar-events/', views.calendar_view, name='calendar'),
+    path('', dashboard.index, name='index'),
+    path('calendar-events/', dashboard.calendar_view, name='calendar'),
+    path('calendar/grid/', events.get_calendar_grid, name='calendar_grid'),
     # Put the save path BEFORE the event ID path to prevent conflicts
-    path('event/save/', views.save_event, name='save_event'),
-    path('event/<str:event_id>/', views.get_event, name='get_event'),
-    path('event/<str:event_id>/delete/', views.delete_event, name='delete_event'),
-    path('update-location/', views.update_location, name='update_location'),
-    path('get-location-by-coords/', views.get_location_by_coords, name='get_location_by_coords'),
+    path('event/save/', events.save_event, name='save_event'),
+    path('events/batch/', events.batch_events, name='batch_events'),
+    path('events/export.ics', events.export_calendar_ics, name='export_calendar_ics'),
+    path('events/import/', events.import_calendar_ics, name='import_calendar_ics'),
+    path('events/agenda/', events.get_priority_agenda, name='priority_agenda'),
+    path('events/search/', events.search_events, name='search_events'),
+    path('events/changes/', events.get_event_changes, name='event_changes'),
+    path('event/<str:event_id>/', events.get_event, name='get_event'),
+    path('event/<str:event_id>/delete/', events.delete_event, name='delete_event'),
+    path('update-location/', location.update_location, name='update_location'),
+    path('get-location-by-coords/', location.get_location_by_coords, name='get_location_by_coords'),
+    path('metrics', monitoring.metrics, name='metrics'),
+    path('healthz', monitoring.healthz, name='healthz'),
+    path('readyz', monitoring.readyz, name='readyz'),
 ]
 
 
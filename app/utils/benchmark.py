@@ -0,0 +1,253 @@
+"""Helpers for benchmarks and tests: fake upstream APIs and throwaway stores
+
+FakeUpstream serves canned OpenWeather, geocoding and NewsAPI responses from
+a local HTTP server with configurable latency and error rate, so dashboard
+views can be exercised without network access or API keys. Point the
+OPENWEATHER_API_BASE, OPENWEATHER_GEO_API_BASE and NEWS_API_BASE settings
+at their `url`.
+"""
+import contextlib
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from app.utils.cache import clear_caches
+from app.utils.snapshot import reset_snapshot
+
+def _weather(query):
+    now = int(time.time())
+    return {
+        'coord': {'lat': 13.08, 'lon': 80.27},
+        'weather': [{'main': 'Clouds', 'description': 'scattered clouds', 'icon': '03d'}],
+        'main': {'temp': 29.4, 'feels_like': 33.1, 'humidity': 70, 'pressure': 1008},
+        'visibility': 6000,
+        'wind': {'speed': 4.6, 'deg': 120},
+        'clouds': {'all': 40},
+        'sys': {'country': 'IN', 'sunrise': now - 6 * 3600, 'sunset': now + 6 * 3600},
+        'name': query.get('q', ['Chennai'])[0],
+    }
+
+def _forecast(query):
+    now = int(time.time())
+    return {'daily': [{
+        'dt': now + day * 86400,
+        'temp': {'max': 32 + day % 3, 'min': 25 - day % 2},
+        'weather': [{'main': 'Rain', 'description': 'light rain', 'icon': '10d'}],
+        'humidity': 75,
+        'wind_speed': 5.2,
+        'wind_deg': 200,
+        'rain': 1.2,
+        'clouds': 60,
+        'pop': 0.4,
+    } for day in range(8)]}
+
+def _reverse_geocode(query):
+    return [{'name': 'Chennai', 'state': 'Tamil Nadu', 'country': 'IN'}]
+
+def _articles(query):
+    articles = [{
+        'title': f'Headline {number}',
+        'source': {'name': 'Fake Wire'},
+        'url': f'https://example.com/news/{number}',
+        'publishedAt': '2026-01-01T08:00:00Z',
+        'description': 'A synthetic article used for benchmarking the dashboard.',
+    } for number in range(20)]
+    return {'status': 'ok', 'totalResults': len(articles), 'articles': articles}
+
+OPENWEATHER_ROUTES = {'/data/2.5/weather': _weather, '/data/2.5/onecall': _forecast}
+GEOCODING_ROUTES = {'/geo/1.0/reverse': _reverse_geocode}
+NEWSAPI_ROUTES = {'/v2/everything': _articles, '/v2/top-headlines': _articles}
+
+class FakeUpstream:
+    """A local HTTP server answering a fixed set of API routes
+
+    Each response is delayed by `latency` seconds (plus up to `jitter`) and
+    fails with HTTP 500 with probability `error_rate`. Use it as a context
+    manager, or call start() and stop().
+    """
+
+    def __init__(self, routes, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        self.routes = routes
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = []  # paths served, in order
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _respond(self, path, query):
+        with self._lock:
+            self.requests.append(path)
+            delay = self.latency + self._random.random() * self.jitter
+            failed = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        handler = self.routes.get(path)
+        if handler is None:
+            return 404, {'message': 'not found'}
+        if failed:
+            return 500, {'message': 'injected failure'}
+        return 200, handler(query)
+
+    def start(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, body = upstream._respond(url.path, parse_qs(url.query))
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+@contextlib.contextmanager
+def fake_upstreams(latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+    """Run fake OpenWeather, geocoding and NewsAPI servers and point the settings at them
+
+    Yields a dict of the three FakeUpstream instances. The widget caches
+    are emptied on entry and exit.
+    """
+    from django.test import override_settings
+
+    upstreams = {
+        'openweather': FakeUpstream(OPENWEATHER_ROUTES, latency, jitter, error_rate, seed),
+        'geocoding': FakeUpstream(GEOCODING_ROUTES, latency, jitter, error_rate, seed + 1),
+        'newsapi': FakeUpstream(NEWSAPI_ROUTES, latency, jitter, error_rate, seed + 2),
+    }
+    with contextlib.ExitStack() as stack:
+        for upstream in upstreams.values():
+            stack.enter_context(upstream)
+        stack.enter_context(override_settings(
+            OPENWEATHER_API_BASE=upstreams['openweather'].url,
+            OPENWEATHER_GEO_API_BASE=upstreams['geocoding'].url,
+            NEWS_API_BASE=upstreams['newsapi'].url,
+            # The fakes have no request quotas to protect
+            UPSTREAM_QUOTA_ENABLED=False,
+        ))
+        # The views only call the APIs when a key is configured
+        stack.enter_context(_environ(OPENWEATHER_API_KEY='fake-key', NEWS_API_KEY='fake-key'))
+        # Widget data cached from other upstreams must not be served
+        clear_caches()
+        stack.callback(clear_caches)
+        yield upstreams
+
+@contextlib.contextmanager
+def _environ(**values):
+    previous = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+@contextlib.contextmanager
+def disposable_store(backend='sqlite'):
+    """Install an empty storage backend for the duration of the block
+
+    'sqlite' uses a temporary database file; 'mongodb' uses a throwaway
+    database on the configured server that is dropped afterwards. The
+    store is installed as the process-wide get_storage() backend and
+    yielded; cached widget data and the dashboard snapshot are replaced
+    by empty ones for the duration of the block.
+    """
+    from django.test import override_settings
+    from app.utils import mongodb
+    from app.utils.storage import get_storage, reset_storage
+
+    with contextlib.ExitStack() as stack:
+        directory = tempfile.mkdtemp()
+        stack.callback(shutil.rmtree, directory, ignore_errors=True)
+        # The dashboard snapshot belongs to the store it was taken from
+        stack.enter_context(override_settings(
+            DASHBOARD_SNAPSHOT_PATH=os.path.join(directory, 'dashboard_snapshot.json'),
+        ))
+        reset_snapshot()
+        stack.callback(reset_snapshot)
+        if backend == 'sqlite':
+            stack.enter_context(override_settings(
+                EVENT_STORAGE_BACKEND='app.utils.sqlite_store.SQLiteEventStore',
+                EVENT_STORAGE_SQLITE_PATH=os.path.join(directory, 'events.sqlite3'),
+            ))
+        elif backend == 'mongodb':
+            def drop():
+                mongodb.get_mongodb_db().client.drop_database('vsm_benchmark')
+                mongodb._ensured_indexes.clear()
+            # Never touch the real database
+            stack.enter_context(_environ(MONGODB_NAME='vsm_benchmark'))
+            drop()
+            stack.callback(drop)
+            stack.enter_context(override_settings(
+                EVENT_STORAGE_BACKEND='app.utils.storage.MongoEventStore',
+                CALENDAR_SYNC_SETTLE_SECONDS=0,
+            ))
+        else:
+            raise ValueError(f'Unknown storage backend {backend!r}')
+
+        reset_storage()
+        stack.callback(reset_storage)
+        clear_caches()
+        stack.callback(clear_caches)
+        store = get_storage()
+        if hasattr(store, 'close'):
+            stack.callback(store.close)
+        yield store
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize_latencies(latencies, wall_seconds, errors=0):
+    """Latency percentiles (ms) and throughput for a list of per-request seconds"""
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        'throughput_rps': round(len(ordered) / wall_seconds, 1) if wall_seconds else 0.0,
+    }
@@ -0,0 +1,134 @@
+"""Small caches with a time-to-live, optionally shared between processes
+
+    _weather_cache = TTLCache('weather', 'WEATHER_CACHE_SECONDS', shared=True)
+
+    weather = _weather_cache.get(location)
+    if weather is None:
+        weather = fetch(location)
+        _weather_cache.set(location, weather)
+
+The TTL is read from the named setting on every write, so tests and
+deployments can change it; a TTL of 0 disables the cache. Lookups are
+counted in the `vsm_cache_requests_total` metric as hits, misses, or stale
+when an expired entry was found.
+
+Every cache keeps entries in this process (L1). A `shared` cache also
+writes them to the coordination store (L2: the app_cache collection on MongoDB,
+a table in the SQLite file), so a value fetched by one worker serves every
+worker until it expires. An L1 miss falls through to L2, counted under
+'<name>.shared', and an L2 hit is kept in L1 for the rest of its lifetime.
+Shared values must be JSON serializable; they are stored as compressed
+compact JSON. With SHARED_CACHE_ENABLED off, or while the backend is
+unavailable, shared caches behave like local ones.
+"""
+import json
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from django.conf import settings
+from app.utils.metrics import record_cache
+from app.utils.storage import get_coordination_store
+
+logger = logging.getLogger(__name__)
+
+_caches = []
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries expire after a configured time"""
+
+    def __init__(self, name, ttl_setting, maxsize=256, shared=False):
+        self.name = name
+        self.ttl_setting = ttl_setting
+        self.maxsize = maxsize
+        self.shared = shared
+        self._entries = OrderedDict()  # key -> (value, expires at)
+        self._lock = threading.Lock()
+        _caches.append(self)
+
+    @property
+    def ttl(self):
+        return getattr(settings, self.ttl_setting)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                result = 'hit'
+            else:
+                result = 'miss' if entry is None else 'stale'
+        record_cache(self.name, result)
+        if result == 'hit':
+            return entry[0]
+        if self._shared_enabled():
+            return self._get_shared(key, default)
+        return default
+
+    def set(self, key, value):
+        ttl = self.ttl
+        if ttl <= 0:
+            return
+        self._set_local(key, value, ttl)
+        if self._shared_enabled():
+            try:
+                get_coordination_store().cache_set(self._shared_key(key), encode_value(value), ttl)
+            except Exception:
+                logger.warning("Could not write %s to the shared cache", self.name, exc_info=True)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._shared_enabled():
+            try:
+                get_coordination_store().cache_delete(self._shared_key(key))
+            except Exception:
+                logger.warning("Could not delete %s from the shared cache", self.name, exc_info=True)
+
+    def clear(self):
+        """Empty this process's entries (shared entries live with the storage backend)"""
+        with self._lock:
+            self._entries.clear()
+
+    def _set_local(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _shared_enabled(self):
+        return self.shared and settings.SHARED_CACHE_ENABLED
+
+    def _shared_key(self, key):
+        return f'{self.name}:{key}'
+
+    def _get_shared(self, key, default):
+        try:
+            entry = get_coordination_store().cache_get(self._shared_key(key))
+        except Exception:
+            logger.warning("Could not read %s from the shared cache", self.name, exc_info=True)
+            entry = None
+        record_cache(f'{self.name}.shared', 'miss' if entry is None else 'hit')
+        if entry is None:
+            return default
+        data, expires_at = entry
+        value = decode_value(data)
+        # Keep it locally only for what is left of its shared lifetime
+        remaining = min(expires_at - time.time(), self.ttl)
+        if remaining > 0:
+            self._set_local(key, value, remaining)
+        return value
+
+def encode_value(value):
+    """Compressed compact JSON, as stored in the shared cache"""
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode())
+
+def decode_value(data):
+    return json.loads(zlib.decompress(data))
+
+def clear_caches():
+    """Empty every TTLCache, e.g. after switching storage backends"""
+    for cache in _caches:
+        cache.clear()
@@ -0,0 +1,232 @@
+"""Compact, parse-once representation of calendar events
+
+An Event is built once from a MongoDB document or a Django CalendarEvent
+and keeps its dates and times as date/time objects. Display labels are
+computed on first use and recomputed only when the day changes. Events
+built from versioned documents are cached by (id, version), so an unchanged
+event is not re-parsed on the next request.
+"""
+import datetime
+import re
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from app.utils.metrics import record_cache
+
+# UIDs we hand out for events that were created without one; the storage
+# backends match them back to the event's own id on import
+UID_DOMAIN = 'virtual-smart-mirror'
+LOCAL_UID_PATTERN = re.compile(r'^([0-9a-f]{24})@' + re.escape(UID_DOMAIN) + '$')
+
+def normalize_event_dates(event_data):
+    """Convert date and time values to ISO format strings in place"""
+    for field in ('start_date', 'end_date', 'start_time', 'end_time'):
+        value = event_data.get(field)
+        # No need to convert if already a string
+        if value and not isinstance(value, str):
+            event_data[field] = value.isoformat()
+    return event_data
+
+def _parse_date(value):
+    if not value:
+        return None
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(value)
+
+def _parse_time(value):
+    if not value:
+        return None
+    if isinstance(value, datetime.time):
+        return value
+    return datetime.time.fromisoformat(value)
+
+class Event:
+    """A calendar event with precomputed dates and lazy display labels"""
+
+    __slots__ = (
+        'id', 'version', 'title', 'description', 'location', 'priority',
+        'reminder', 'all_day', 'start_date', 'start_time', 'end_date', 'end_time',
+        '_labels_for', '_date_label', '_long_date_label',
+    )
+
+    def __init__(self, id, title, start_date, start_time=None, end_date=None,
+                 end_time=None, all_day=False, description='', location='',
+                 priority='medium', reminder=False, version=None):
+        self.id = id
+        self.version = version
+        self.title = title
+        self.description = description or ''
+        self.location = location or ''
+        self.priority = priority or 'medium'
+        self.reminder = bool(reminder)
+        self.all_day = bool(all_day)
+        self.start_date = start_date
+        self.start_time = None if self.all_day else start_time
+        self.end_date = end_date
+        self.end_time = None if self.all_day else end_time
+        self._labels_for = None
+
+    def __repr__(self):
+        return f"<Event {self.id} {self.title!r} on {self.start_date}>"
+
+    @classmethod
+    def from_document(cls, doc):
+        """Build an event from a MongoDB document (raises ValueError on bad dates)"""
+        return cls(
+            id=str(doc['_id']),
+            version=doc.get('version'),
+            title=doc.get('title', ''),
+            description=doc.get('description', ''),
+            location=doc.get('location', ''),
+            priority=doc.get('priority', 'medium'),
+            reminder=doc.get('reminder', False),
+            all_day=doc.get('all_day', False),
+            start_date=_parse_date(doc['start_date']),
+            start_time=_parse_time(doc.get('start_time')),
+            end_date=_parse_date(doc.get('end_date')),
+            end_time=_parse_time(doc.get('end_time')),
+        )
+
+    @classmethod
+    def from_model(cls, instance):
+        """Build an event from a Django CalendarEvent"""
+        return cls(
+            id=instance.id,
+            title=instance.title,
+            description=instance.description,
+            location=instance.location,
+            priority=instance.priority,
+            reminder=instance.reminder,
+            all_day=instance.all_day,
+            start_date=instance.start_date,
+            start_time=instance.start_time,
+            end_date=instance.end_date,
+            end_time=instance.end_time,
+        )
+
+    def _labels(self, today):
+        # Labels depend on the current day, so they are cached per day
+        if self._labels_for != today:
+            if self.start_date == today:
+                self._date_label = self._long_date_label = "Today"
+            elif self.start_date == today + datetime.timedelta(days=1):
+                self._date_label = self._long_date_label = "Tomorrow"
+            else:
+                self._date_label = self.start_date.strftime('%B %d')  # e.g. "January 01"
+                self._long_date_label = self.start_date.strftime('%A, %B %d')  # e.g. "Monday, January 01"
+            self._labels_for = today
+
+    @property
+    def date(self):
+        """Short date label: "Today", "Tomorrow" or e.g. "January 01\""""
+        self._labels(datetime.date.today())
+        return self._date_label
+
+    @property
+    def long_date(self):
+        """Date label with the weekday, e.g. "Monday, January 01\""""
+        self._labels(datetime.date.today())
+        return self._long_date_label
+
+    @property
+    def time(self):
+        """Start time label: "All day", e.g. "09:30 AM", or None"""
+        if self.all_day:
+            return "All day"
+        if self.start_time:
+            return self.start_time.strftime('%I:%M %p')
+        return None
+
+    @property
+    def time_range(self):
+        """Time label including the end time, e.g. "09:30 AM - 10:00 AM\""""
+        label = self.time
+        if self.start_time and self.end_time:
+            label += f" - {self.end_time.strftime('%I:%M %p')}"
+        return label
+
+    @property
+    def days_until(self):
+        return (self.start_date - datetime.date.today()).days
+
+    @property
+    def is_today(self):
+        return self.start_date == datetime.date.today()
+
+    @property
+    def is_past(self):
+        return self.start_date < datetime.date.today()
+
+    @property
+    def sort_date(self):
+        return self.start_date
+
+    @property
+    def sort_key(self):
+        """Order by day, all-day events first, then by start time"""
+        return (self.start_date, self.start_time or datetime.time.min)
+
+    def as_display_dict(self):
+        """Display fields for JSON APIs, matching what the templates show"""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'date': self.date,
+            'time': self.time,
+            'description': self.description,
+            'is_today': self.is_today,
+            'is_past': self.is_past,
+            'location': self.location,
+            'priority': self.priority,
+            'reminder': self.reminder,
+            'days_until': self.days_until,
+            'all_day': self.all_day,
+        }
+
+    def as_document(self):
+        """Stored fields with ISO date and time strings, for editing"""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'start_date': self.start_date.isoformat(),
+            'start_time': self.start_time.isoformat() if self.start_time else None,
+            'end_date': self.end_date.isoformat() if self.end_date else None,
+            'end_time': self.end_time.isoformat() if self.end_time else None,
+            'all_day': self.all_day,
+            'location': self.location,
+            'priority': self.priority,
+            'reminder': self.reminder,
+        }
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def event_from_document(doc):
+    """Return the cached Event for a document, building it on a miss
+
+    The app's write paths give a document a new version on every change, so
+    an (id, version) entry never goes stale. Documents without a version
+    (inserted directly by init_mongodb, or stored before versioning) can
+    change under the same key, so they are parsed every time.
+    """
+    if doc.get('version') is None:
+        return Event.from_document(doc)
+
+    key = (str(doc['_id']), doc['version'])
+    with _cache_lock:
+        event = _cache.get(key)
+        if event is not None:
+            _cache.move_to_end(key)
+    if event is not None:
+        record_cache('event', 'hit')
+        return event
+
+    record_cache('event', 'miss')
+    event = Event.from_document(doc)
+    with _cache_lock:
+        _cache[key] = event
+        if len(_cache) > settings.EVENT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return event
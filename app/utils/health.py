@@ -0,0 +1,111 @@
+"""Liveness, readiness and startup warm-up
+
+/healthz only says the process is serving requests. /readyz says whether
+this instance should get traffic: warm-up has finished and the storage
+backend answered a ping recently. Pings run at most once every
+HEALTH_CHECK_MAX_AGE_SECONDS; probes in between, and probes arriving while
+a ping is in flight, get the previous result. A probe therefore costs a
+lookup, and a result is never older than the max age plus one ping.
+
+Warm-up opens the storage connection pool and fills the dashboard caches
+(preferences, quote, weather, news, parsed events) so the first real request
+does not pay for them. It runs in the background at startup when
+WARMUP_ON_STARTUP is set, or else on the first /readyz probe.
+"""
+import logging
+import threading
+import time
+from django.conf import settings
+from app.utils import quota
+from app.utils.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# (checked at, ok, detail) of the last storage ping
+_last_ping = None
+_ping_lock = threading.Lock()
+
+def storage_status():
+    """Cached result of pinging the storage backend: (checked at, ok, detail)"""
+    global _last_ping
+    previous = _last_ping
+    if previous is not None and time.monotonic() - previous[0] < settings.HEALTH_CHECK_MAX_AGE_SECONDS:
+        return previous
+    # Only one probe pings; the others answer with the previous result
+    if not _ping_lock.acquire(blocking=previous is None):
+        return previous
+    try:
+        started = time.perf_counter()
+        try:
+            get_storage().ping()
+            result = (time.monotonic(), True, f'ping {(time.perf_counter() - started) * 1000:.1f} ms')
+        except Exception as e:
+            result = (time.monotonic(), False, str(e))
+        _last_ping = result
+        return result
+    finally:
+        _ping_lock.release()
+
+def reset_health():
+    """Forget the cached ping and warm-up state"""
+    global _last_ping, _warmup_thread
+    _last_ping = None
+    _warmup_thread = None
+    _warm.clear()
+
+_warm = threading.Event()
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+def warm_up():
+    """Open the storage pool and prime the dashboard caches; returns step timings in ms"""
+    # Imported here so that loading this module does not load the views
+    from app.views import dashboard
+
+    steps = [
+        ('storage', get_storage().ping),
+        ('preferences', dashboard.get_preferences),
+        ('quote', dashboard.get_quote),
+        ('weather', dashboard.get_weather),
+        ('news', dashboard.get_news),
+        ('calendar', dashboard.get_calendar_events),
+    ]
+    timings = {}
+    # Priming is a background refresh, so it may use the reserved API budget
+    with quota.background():
+        for name, step in steps:
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception:
+                logger.exception("Warm-up step %s failed", name)
+            timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    _warm.set()
+    logger.info("Warm-up finished: %s", ', '.join(f'{name} {ms} ms' for name, ms in timings.items()))
+    return timings
+
+def start_warm_up():
+    """Run warm_up() in a background thread, once per process"""
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+            _warmup_thread.start()
+
+def is_warm():
+    return _warm.is_set()
+
+def readiness():
+    """(ready, checks) for /readyz"""
+    if not is_warm():
+        start_warm_up()
+    checked_at, storage_ok, detail = storage_status()
+    checks = {
+        'warmup': 'done' if is_warm() else 'running',
+        'storage': {
+            'ok': storage_ok,
+            'detail': detail,
+            'age_seconds': round(time.monotonic() - checked_at, 1),
+        },
+    }
+    return is_warm() and storage_ok, checks
@@ -0,0 +1,242 @@
+"""Streaming iCalendar (.ics) reading and writing for calendar events
+
+Both directions work on iterators so a calendar of any size is processed
+one event at a time.
+
+Events keep wall-clock times in the app's time zone (TIME_ZONE). Imported
+UTC ('Z') and TZID times are converted to it, floating times are taken as
+they are, and exported times are written in UTC.
+"""
+import datetime
+import itertools
+import re
+import zoneinfo
+from django.utils import timezone
+from app.utils.events import UID_DOMAIN
+
+# iCalendar PRIORITY is 1 (highest) to 9 (lowest), 0 means undefined
+ICS_PRIORITY = {'high': 1, 'medium': 5, 'low': 9}
+
+def _unescape(value):
+    """Undo iCalendar TEXT escaping"""
+    return re.sub(
+        r'\\([\\;,nN])',
+        lambda m: '\n' if m.group(1) in 'nN' else m.group(1),
+        value
+    )
+
+def _escape(value):
+    """Apply iCalendar TEXT escaping"""
+    return (
+        value.replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+def _unfold(lines):
+    """Join folded content lines (continuations start with a space or tab)"""
+    current = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current:
+        yield current
+
+def _parse_content_line(line):
+    """Split 'NAME;PARAM=X:value' into (NAME, {PARAM: X}, value)"""
+    head, _, value = line.partition(':')
+    name, *params = head.split(';')
+    parameters = {}
+    for param in params:
+        key, _, param_value = param.partition('=')
+        parameters[key.upper()] = param_value
+    return name.upper(), parameters, value
+
+def _zone(parameters):
+    """The zone named by a TZID parameter, or None for floating times"""
+    tzid = parameters.get('TZID', '').strip('"')
+    if not tzid:
+        return None
+    try:
+        return zoneinfo.ZoneInfo(tzid)
+    except (ValueError, zoneinfo.ZoneInfoNotFoundError):
+        # Custom VTIMEZONE names are not resolved; keep the wall-clock time
+        return None
+
+def _parse_datetime(value, parameters):
+    """Return (date, time or None) for a DTSTART/DTEND value in the app's zone"""
+    if parameters.get('VALUE') == 'DATE' or len(value) == 8:
+        return datetime.datetime.strptime(value, '%Y%m%d').date(), None
+    parsed = datetime.datetime.strptime(value[:15], '%Y%m%dT%H%M%S')
+    zone = datetime.timezone.utc if value.endswith('Z') else _zone(parameters)
+    if zone is not None:
+        parsed = parsed.replace(tzinfo=zone).astimezone(timezone.get_default_timezone())
+    return parsed.date(), parsed.time()
+
+def _priority_from_ics(value):
+    try:
+        number = int(value)
+    except ValueError:
+        return 'medium'
+    if 1 <= number <= 4:
+        return 'high'
+    if number >= 6:
+        return 'low'
+    return 'medium'
+
+def _event_from_properties(properties, has_alarm):
+    """Build an event dict in our document format from parsed VEVENT properties"""
+    if 'DTSTART' not in properties or 'UID' not in properties:
+        return None
+
+    start_date, start_time = _parse_datetime(*properties['DTSTART'])
+    event = {
+        'uid': properties['UID'][0],
+        'title': _unescape(properties.get('SUMMARY', ('Untitled Event', {}))[0]),
+        'description': _unescape(properties.get('DESCRIPTION', ('', {}))[0]),
+        'location': _unescape(properties.get('LOCATION', ('', {}))[0]),
+        'start_date': start_date.isoformat(),
+        'start_time': start_time.isoformat() if start_time else None,
+        'end_date': None,
+        'end_time': None,
+        'all_day': start_time is None,
+        'priority': _priority_from_ics(properties.get('PRIORITY', ('5', {}))[0]),
+        'reminder': has_alarm,
+    }
+
+    if 'DTEND' in properties:
+        end_date, end_time = _parse_datetime(*properties['DTEND'])
+        if event['all_day']:
+            # DTEND is exclusive for all-day events
+            end_date -= datetime.timedelta(days=1)
+        if end_date != start_date:
+            event['end_date'] = end_date.isoformat()
+        event['end_time'] = end_time.isoformat() if end_time else None
+    return event
+
+def iter_ics_events(lines):
+    """Yield event dicts from an iterable of .ics lines (str or bytes)
+
+    Events without a UID or DTSTART are skipped.
+    """
+    properties = None
+    depth = 0
+    has_alarm = False
+
+    for line in _unfold(lines):
+        name, parameters, value = _parse_content_line(line)
+
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            properties, depth, has_alarm = {}, 0, False
+        elif properties is None:
+            continue
+        elif name == 'BEGIN':
+            # Nested component such as VALARM
+            depth += 1
+            has_alarm = has_alarm or value.upper() == 'VALARM'
+        elif name == 'END' and depth:
+            depth -= 1
+        elif name == 'END' and value.upper() == 'VEVENT':
+            try:
+                event = _event_from_properties(properties, has_alarm)
+            except ValueError:
+                event = None
+            if event:
+                yield event
+            properties = None
+        elif not depth:
+            properties.setdefault(name, (value, parameters))
+
+def iter_ics_batches(lines, batch_size=500):
+    """Yield lists of at most `batch_size` events parsed from .ics lines"""
+    events = iter_ics_events(lines)
+    while True:
+        batch = list(itertools.islice(events, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def _fold(line):
+    """Fold a content line to at most 75 octets per line"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Never split inside a multi-byte UTF-8 sequence
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74  # Continuation lines start with a space
+    return '\r\n '.join(parts) + '\r\n'
+
+def _format_date(value):
+    return datetime.date.fromisoformat(value).strftime('%Y%m%d')
+
+def _format_datetime(date_value, time_value):
+    """UTC form of a wall-clock time in the app's zone"""
+    start = datetime.datetime.combine(
+        datetime.date.fromisoformat(date_value),
+        datetime.time.fromisoformat(time_value),
+        tzinfo=timezone.get_default_timezone()
+    )
+    return start.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+def event_to_ics_lines(event, stamp):
+    """Return the folded VEVENT lines for one event document"""
+    uid = event.get('uid') or f"{event['_id']}@{UID_DOMAIN}"
+    lines = ['BEGIN:VEVENT', f'UID:{uid}', f'DTSTAMP:{stamp}']
+
+    if event.get('all_day') or not event.get('start_time'):
+        lines.append(f"DTSTART;VALUE=DATE:{_format_date(event['start_date'])}")
+        end_date = datetime.date.fromisoformat(event.get('end_date') or event['start_date'])
+        # DTEND is exclusive for all-day events
+        lines.append(f"DTEND;VALUE=DATE:{(end_date + datetime.timedelta(days=1)).strftime('%Y%m%d')}")
+    else:
+        lines.append(f"DTSTART:{_format_datetime(event['start_date'], event['start_time'])}")
+        if event.get('end_time'):
+            end_date = event.get('end_date') or event['start_date']
+            lines.append(f"DTEND:{_format_datetime(end_date, event['end_time'])}")
+
+    lines.append(f"SUMMARY:{_escape(event.get('title') or '')}")
+    if event.get('description'):
+        lines.append(f"DESCRIPTION:{_escape(event['description'])}")
+    if event.get('location'):
+        lines.append(f"LOCATION:{_escape(event['location'])}")
+    lines.append(f"PRIORITY:{ICS_PRIORITY.get(event.get('priority'), 5)}")
+
+    if event.get('reminder'):
+        lines += [
+            'BEGIN:VALARM',
+            'ACTION:DISPLAY',
+            f"DESCRIPTION:{_escape(event.get('title') or 'Reminder')}",
+            'TRIGGER:-PT15M',
+            'END:VALARM',
+        ]
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+def iter_ics_calendar(events):
+    """Yield a complete VCALENDAR as text chunks, one chunk per event"""
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield 'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Virtual Smart Mirror//Calendar//EN\r\n'
+    for event in events:
+        try:
+            yield event_to_ics_lines(event, stamp)
+        except (KeyError, ValueError, TypeError):
+            # Skip documents with missing or malformed dates
+            continue
+    yield 'END:VCALENDAR\r\n'
@@ -0,0 +1,110 @@
+"""Logging building blocks used by the LOGGING setting
+
+- JsonFormatter: one JSON object per line, including any `extra` fields
+- SamplingFilter: lets through 1 in N repeats of the same message at
+  WARNING and below, so per-request chatter cannot flood the log pipeline
+- BackgroundStreamHandler: request threads only put records on a bounded
+  queue; a background thread writes them out. Records are dropped (and
+  counted) rather than blocking when the queue is full.
+
+Messages are formatted lazily: pass arguments (`logger.debug("x=%s", x)`)
+instead of f-strings, so filtered-out records cost no formatting.
+"""
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+# Attributes every LogRecord has; anything else came from `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Pass the first and then every `rate`-th record of each message
+
+    Records are grouped by logger and unformatted message, so
+    `logger.debug("Getting weather for %s", location)` is one group whatever
+    the location. Records above `max_level` always pass. Passed records carry
+    `sample_rate` so aggregators can scale counts back up.
+    """
+
+    def __init__(self, rate=1, max_level='WARNING'):
+        super().__init__()
+        self.rate = int(rate)
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate <= 1 or record.levelno > self.max_level:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+        if seen % self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+class BackgroundStreamHandler(logging.handlers.QueueHandler):
+    """Write records to a stream from a background thread
+
+    The record is formatted in the calling thread (only once it has passed
+    the level and filters) and written by a QueueListener. After a fork the
+    listener is restarted in the child on its first record. logging.shutdown()
+    closes the handler at exit, which drains the queue.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.stream = stream or sys.stderr
+        self.dropped = 0
+        self._listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            # A listener thread inherited from the parent is not running here
+            self.queue = queue.Queue(self.queue.maxsize)
+            self._listener = logging.handlers.QueueListener(self.queue, logging.StreamHandler(self.stream))
+            self._listener.start()
+            self._listener_pid = os.getpid()
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self._listener is not None and self._listener_pid == os.getpid():
+            self._listener.stop()
+            self._listener_pid = None
+        super().close()
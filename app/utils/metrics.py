@@ -0,0 +1,366 @@
+"""Prometheus-format metrics, aggregated across worker processes
+
+Counters, gauges and histograms are kept in memory per process. When
+METRICS_MULTIPROC_DIR is set, every process periodically writes its values
+to `<dir>/<pid>-<token>.json`, where the token is new for every process
+(so a recycled pid never overwrites an older worker's file), and the
+/metrics view merges all files: counters and histograms are summed over
+every process that ever wrote (so they never go backwards when a worker is
+recycled), gauges only over processes still alive. Files of exited
+processes are folded into `archive.json` and removed, so the directory does
+not grow with every restart. Without a directory, /metrics reports this
+process alone.
+
+The directory must be private to one host (pids are only unique per host)
+and should be emptied when the server starts.
+"""
+import bisect
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from app.utils.timing import add_span_observer
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = {}
+_lock = threading.Lock()
+_values = {}  # (metric name, label values) -> float, or [bucket counts..., sum] for histograms
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry[name] = self
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}')
+        return (self.name, tuple(str(value) for value in labels))
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with _lock:
+            _values[key] = _values.get(key, 0) + amount
+        _ensure_flusher()
+
+class Gauge(_Metric):
+    """A value that goes up and down; summed over live processes"""
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with _lock:
+            _values[key] = _values.get(key, 0) + amount
+        _ensure_flusher()
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        with _lock:
+            counts = _values.get(key)
+            if counts is None:
+                # One slot per bucket, one for +Inf, then the sum
+                counts = _values[key] = [0] * (len(self.buckets) + 2)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+        _ensure_flusher()
+
+class timer:
+    """Context manager observing the elapsed seconds into a histogram"""
+
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, *labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+# Application metrics
+
+UPSTREAM_REQUESTS = Counter(
+    'vsm_upstream_requests_total', 'Calls to upstream APIs', ['api', 'status'])
+UPSTREAM_LATENCY = Histogram(
+    'vsm_upstream_request_duration_seconds', 'Upstream API call latency', ['api'])
+CACHE_REQUESTS = Counter(
+    'vsm_cache_requests_total', 'Cache lookups by result (hit, miss or stale)', ['cache', 'result'])
+COALESCED_FETCHES = Counter(
+    'vsm_coalesced_fetches_total', 'Fetches that waited for an identical one in flight', ['fetch', 'scope'])
+MONGODB_LATENCY = Histogram(
+    'vsm_mongodb_operation_duration_seconds', 'Latency of the helpers in app.utils.mongodb', ['helper'])
+MONGODB_COMMAND_LATENCY = Histogram(
+    'vsm_mongodb_command_duration_seconds', 'Latency of MongoDB commands', ['command', 'collection'])
+MONGODB_SLOW_COMMANDS = Counter(
+    'vsm_mongodb_slow_commands_total', 'MongoDB commands slower than MONGODB_SLOW_MS', ['command', 'collection'])
+REQUEST_MONGODB_OPERATIONS = Histogram(
+    'vsm_request_mongodb_operations', 'MongoDB commands per request, by view', ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100))
+REQUEST_MONGODB_SECONDS = Histogram(
+    'vsm_request_mongodb_seconds', 'Time spent in MongoDB per request, by view', ['view'])
+SPAN_LATENCY = Histogram(
+    'vsm_span_duration_seconds', 'Latency of timed dashboard widgets and other spans', ['span'])
+VIEW_LATENCY = Histogram(
+    'vsm_view_duration_seconds', 'Time to handle and render a request, by view', ['view'])
+VIEW_RESPONSES = Counter(
+    'vsm_http_responses_total', 'Responses by view and status code', ['view', 'status'])
+IN_FLIGHT = Gauge(
+    'vsm_http_requests_in_flight', 'Requests being handled right now')
+
+def record_cache(cache, result):
+    """Count a cache lookup: result is 'hit', 'miss' or 'stale'"""
+    if settings.METRICS_ENABLED:
+        CACHE_REQUESTS.inc(cache, result)
+
+def _observe_span(name, seconds):
+    if name.startswith('mongodb.'):
+        MONGODB_LATENCY.observe(seconds, name[len('mongodb.'):])
+    else:
+        SPAN_LATENCY.observe(seconds, name)
+
+# Multi-process support
+
+_flusher_pid = None
+_token = uuid.uuid4().hex  # tells this process apart from earlier ones with its pid
+_started = time.time()
+
+ARCHIVE_FILE = 'archive.json'
+
+def _ensure_flusher():
+    """Start this process's background flush thread once (again after a fork)"""
+    global _flusher_pid
+    if _flusher_pid == os.getpid() or not settings.METRICS_MULTIPROC_DIR:
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(settings.METRICS_FLUSH_SECONDS)
+            try:
+                flush()
+            except OSError:
+                pass
+    threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+def _forget_parent_values():
+    # A forked worker starts from zero; the parent's values are its own
+    global _flusher_pid, _token, _started
+    _values.clear()
+    _flusher_pid = None
+    _token, _started = uuid.uuid4().hex, time.time()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_parent_values)
+
+def _snapshot():
+    with _lock:
+        return [[name, list(labels), value] for (name, labels), value in _values.items()]
+
+def flush():
+    """Write this process's values to the shared directory (atomically)"""
+    directory = settings.METRICS_MULTIPROC_DIR
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _write(os.path.join(directory, f'{os.getpid()}-{_token}.json'),
+           {'pid': os.getpid(), 'started': _started, 'values': _snapshot()})
+
+def _write(path, content):
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(handle, 'w') as output:
+        json.dump(content, output)
+    os.replace(temporary, path)
+
+def _read(path):
+    try:
+        with open(path) as snapshot_file:
+            return json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None  # Being replaced right now; its next flush will be read
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _merge(merged, values, gauges=True):
+    """Add [name, labels, value] entries into {(name, labels): value}"""
+    for name, labels, value in values:
+        metric = _registry.get(name)
+        if metric is None or (metric.kind == 'gauge' and not gauges):
+            continue
+        key = (name, tuple(labels))
+        if metric.kind == 'histogram':
+            current = merged.setdefault(key, [0] * len(value))
+            for index, amount in enumerate(value):
+                current[index] += amount
+        else:
+            merged[key] = merged.get(key, 0) + value
+
+@contextlib.contextmanager
+def _directory_lock(directory):
+    with open(os.path.join(directory, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+def _archive(directory, exited):
+    """Fold the counters and histograms of exited processes into the archive file
+
+    The archive lists the files it already holds, so a file left behind by
+    an interrupted run is never counted twice.
+    """
+    with _directory_lock(directory):
+        archive = _read(os.path.join(directory, ARCHIVE_FILE)) or {'values': [], 'files': []}
+        merged = {}
+        _merge(merged, archive['values'])
+        files = [name for name in archive['files'] if os.path.exists(os.path.join(directory, name))]
+        for filename, snapshot in exited:
+            # Another process may have archived and removed it meanwhile
+            if filename not in files and os.path.exists(os.path.join(directory, filename)):
+                _merge(merged, snapshot['values'], gauges=False)
+                files.append(filename)
+        archive = {'values': [[name, list(labels), value] for (name, labels), value in merged.items()],
+                   'files': files}
+        _write(os.path.join(directory, ARCHIVE_FILE), archive)
+        for filename, _ in exited:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(os.path.join(directory, filename))
+
+def collect():
+    """Merged values from every process: {(name, labels): value}"""
+    directory = settings.METRICS_MULTIPROC_DIR
+    if not directory:
+        merged = {}
+        _merge(merged, _snapshot())
+        return merged
+
+    flush()
+    snapshots = {}
+    for filename in os.listdir(directory):
+        if filename.endswith('.json') and filename != ARCHIVE_FILE:
+            snapshot = _read(os.path.join(directory, filename))
+            if snapshot is not None:
+                snapshots[filename] = snapshot
+
+    # Only the newest process with a given pid can still be running
+    newest = {}
+    for filename, snapshot in snapshots.items():
+        pid = snapshot['pid']
+        if pid not in newest or snapshot.get('started', 0) > snapshots[newest[pid]].get('started', 0):
+            newest[pid] = filename
+    exited = [
+        (filename, snapshot) for filename, snapshot in snapshots.items()
+        if newest[snapshot['pid']] != filename or not _alive(snapshot['pid'])
+    ]
+    if exited:
+        _archive(directory, exited)
+
+    merged = {}
+    archive = _read(os.path.join(directory, ARCHIVE_FILE))
+    if archive is not None:
+        _merge(merged, archive['values'])
+    archived = set(archive['files']) if archive is not None else set()
+    exited_files = {filename for filename, _ in exited}
+    for filename, snapshot in snapshots.items():
+        if filename not in archived and filename not in exited_files:
+            _merge(merged, snapshot['values'])
+    return merged
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    values = collect()
+    by_metric = {}
+    for (name, labels), value in values.items():
+        by_metric.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for labels, value in sorted(by_metric.get(name, [])):
+            if metric.kind != 'histogram':
+                lines.append(f'{name}{_format_labels(metric.labelnames, labels)} {_format_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip([*metric.buckets, float('inf')], value[:-1]):
+                cumulative += count
+                bucket_labels = _format_labels(metric.labelnames, labels, [('le', _format_number(bound))])
+                lines.append(f'{name}_bucket{bucket_labels} {_format_number(cumulative)}')
+            lines.append(f'{name}_sum{_format_labels(metric.labelnames, labels)} {_format_number(value[-1])}')
+            lines.append(f'{name}_count{_format_labels(metric.labelnames, labels)} {_format_number(cumulative)}')
+    return '\n'.join(lines) + '\n'
+
+class MetricsMiddleware:
+    """Count in-flight requests and record latency and status per view"""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        add_span_observer(_observe_span)
+
+    def __call__(self, request):
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            IN_FLIGHT.dec()
+            match = getattr(request, 'resolver_match', None)
+            view = match.url_name if match and match.url_name else 'unresolved'
+            VIEW_LATENCY.observe(time.perf_counter() - started, view)
+            VIEW_RESPONSES.inc(view, status)
@@ -1,7 +1,60 @@
 import os
+import logging
+import threading
 import pymongo
+from pymongo import ReturnDocument, InsertOne, UpdateOne, DeleteOne, ReplaceOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 from bson import ObjectId
 import datetime
+from django.conf import settings
+from app.utils.events import LOCAL_UID_PATTERN, normalize_event_dates
+from app.utils.timing import timed
+
+logger = logging.getLogger(__name__)
+
+# Counter document holding the last issued calendar change version
+EVENT_VERSION_COUNTER = 'calendarevent'
+
+# Indexes needed to read the calendar change feed in version order
+CALENDAR_EVENT_INDEXES = [
+    pymongo.IndexModel([('version', pymongo.ASCENDING)], name='version_1'),
+    # Date range reads (agenda, month grid) seek on the start of the event
+    pymongo.IndexModel(
+        [('start_date', pymongo.ASCENDING), ('start_time', pymongo.ASCENDING)],
+        name='start_date_1_start_time_1'
+    ),
+    # Priority-filtered agenda: equality on priority, then the date range in order
+    pymongo.IndexModel(
+        [('priority', pymongo.ASCENDING), ('start_date', pymongo.ASCENDING), ('start_time', pymongo.ASCENDING)],
+        name='priority_1_start_date_1_start_time_1'
+    ),
+    # Upcoming reminders are loaded without touching events that have none
+    pymongo.IndexModel(
+        [('start_date', pymongo.ASCENDING)],
+        name='reminder_start_date',
+        partialFilterExpression={'reminder': True}
+    ),
+    # Imported events are upserted by their iCalendar UID
+    pymongo.IndexModel(
+        [('uid', pymongo.ASCENDING)],
+        name='uid_1',
+        unique=True,
+        partialFilterExpression={'uid': {'$type': 'string'}}
+    ),
+    # Full-text search, ranked with the same weights as app.utils.search
+    pymongo.IndexModel(
+        [('title', pymongo.TEXT), ('location', pymongo.TEXT), ('description', pymongo.TEXT)],
+        name='event_text',
+        weights={'title': 10, 'location': 5, 'description': 1}
+    ),
+]
+CALENDAR_TOMBSTONE_INDEXES = [
+    pymongo.IndexModel([('version', pymongo.ASCENDING)], name='version_1'),
+    pymongo.IndexModel([('deleted_at', pymongo.ASCENDING)], name='deleted_at_1'),
+]
+
+# Collections whose indexes were already ensured by this process
+_ensured_indexes = set()
 
 def get_mongodb_client():
     """Get a MongoDB client connection"""
@@ -19,6 +72,26 @@ def get_mongodb_client():
     
     return client
 
+# Shared clients keyed by (process id, URI); see _shared_client
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _shared_client(uri):
+    """One MongoClient, and so one connection pool, per URI and process
+
+    MongoClient is not fork-safe, so a forked worker builds its own.
+    """
+    key = (os.getpid(), uri)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = pymongo.MongoClient(
+                    uri, serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS)
+    return client
+
+@timed()
 def get_mongodb_db():
     """Get MongoDB database connection"""
     try:
@@ -26,106 +99,122 @@ def get_mongodb_db():
         uri = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/')
         db_name = os.environ.get('MONGODB_NAME', 'vsm_db')
         
-        # Connect to MongoDB
-        client = pymongo.MongoClient(uri)
-        db = client[db_name]
-        print(f"Connected to MongoDB: {db_name}")
+        # Reuse the process's client instead of connecting on every call
+        db = _shared_client(uri)[db_name]
         return db
     except Exception as e:
-        print(f"Error connecting to MongoDB: {e}")
+        logger.error("Error connecting to MongoDB: %s", e)
         raise
 
+@timed()
+def ping_mongodb():
+    """One round trip to the server; raises PyMongoError if it is unreachable"""
+    get_mongodb_db().command('ping')
+
+@timed()
 def get_calendar_events_from_mongodb():
     """Get calendar events from MongoDB"""
     try:
-        print("Fetching events from MongoDB...")
         db = get_mongodb_db()
         events = list(db.app_calendarevent.find())
-        print(f"Found {len(events)} events in MongoDB")
+        logger.debug("Found %d events in MongoDB", len(events))
         
         # Convert ObjectId to string for JSON serialization
         for event in events:
             event['_id'] = str(event['_id'])
         
         return events
-    except Exception as e:
-        print(f"Error fetching events from MongoDB: {e}")
+    except Exception:
+        logger.exception("Error fetching events from MongoDB")
         return []
 
+def _ensure_indexes(db, collection_name, indexes):
+    """Create the given indexes once per process (create_indexes is idempotent)"""
+    if collection_name in _ensured_indexes:
+        return
+    db[collection_name].create_indexes(indexes)
+    _ensured_indexes.add(collection_name)
+
+def _next_event_version(db, count=1):
+    """Reserve `count` consecutive change versions and return the highest one"""
+    counter = db.app_counters.find_one_and_update(
+        {'_id': EVENT_VERSION_COUNTER},
+        {'$inc': {'seq': count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter['seq']
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+@timed()
 def save_calendar_event_to_mongodb(event_data):
     """Save a calendar event to MongoDB"""
     try:
-        print("Attempting to save event to MongoDB...")
         db = get_mongodb_db()
         
         # Ensure dates are in ISO format
-        if 'start_date' in event_data and event_data['start_date']:
-            # No need to convert if already a string
-            if not isinstance(event_data['start_date'], str):
-                event_data['start_date'] = event_data['start_date'].isoformat()
-                
-        if 'end_date' in event_data and event_data['end_date']:
-            if not isinstance(event_data['end_date'], str):
-                event_data['end_date'] = event_data['end_date'].isoformat()
-                
-        if 'start_time' in event_data and event_data['start_time']:
-            if not isinstance(event_data['start_time'], str):
-                event_data['start_time'] = event_data['start_time'].isoformat()
-                
-        if 'end_time' in event_data and event_data['end_time']:
-            if not isinstance(event_data['end_time'], str):
-                event_data['end_time'] = event_data['end_time'].isoformat()
+        normalize_event_dates(event_data)
+        
+        # Stamp the change version so delta sync clients pick it up
+        event_data['version'] = _next_event_version(db)
+        event_data['updated_at'] = _utcnow()
         
-        print(f"Formatted event data: {event_data}")
         result = db.app_calendarevent.insert_one(event_data)
         inserted_id = str(result.inserted_id)
-        print(f"Event saved with ID: {inserted_id}")
+        logger.debug("Event saved with ID: %s", inserted_id)
         return inserted_id
-    except Exception as e:
-        print(f"Error saving calendar event to MongoDB: {e}")
+    except Exception:
+        logger.exception("Error saving calendar event to MongoDB")
         return None
 
+@timed()
 def update_calendar_event_in_mongodb(event_id, event_data):
     """Update a calendar event in MongoDB"""
     try:
         db = get_mongodb_db()
         # Ensure dates are in ISO format
-        if 'start_date' in event_data and event_data['start_date']:
-            if not isinstance(event_data['start_date'], str):
-                event_data['start_date'] = event_data['start_date'].isoformat()
-                
-        if 'end_date' in event_data and event_data['end_date']:
-            if not isinstance(event_data['end_date'], str):
-                event_data['end_date'] = event_data['end_date'].isoformat()
-                
-        if 'start_time' in event_data and event_data['start_time']:
-            if not isinstance(event_data['start_time'], str):
-                event_data['start_time'] = event_data['start_time'].isoformat()
-                
-        if 'end_time' in event_data and event_data['end_time']:
-            if not isinstance(event_data['end_time'], str):
-                event_data['end_time'] = event_data['end_time'].isoformat()
+        normalize_event_dates(event_data)
         
         # Ensure event_id is a valid ObjectId
         if not ObjectId.is_valid(event_id):
-            print(f"Invalid ObjectId format: {event_id}")
+            logger.warning("Invalid ObjectId format: %r", event_id)
             return False
+        
+        changes = dict(event_data)
+        changes['version'] = _next_event_version(db)
+        changes['updated_at'] = _utcnow()
             
         result = db.app_calendarevent.update_one(
             {"_id": ObjectId(event_id)},
-            {"$set": event_data}
+            {"$set": changes}
         )
-        return result.modified_count > 0
-    except Exception as e:
-        print(f"Error updating calendar event in MongoDB: {e}")
+        # Every update bumps the version, so a match means the event changed
+        return result.matched_count > 0
+    except Exception:
+        logger.exception("Error updating calendar event in MongoDB")
         return False
 
+@timed()
 def delete_calendar_event_from_mongodb(event_id):
-    """Delete a calendar event from MongoDB"""
+    """Delete a calendar event from MongoDB, leaving a tombstone for delta sync"""
     db = get_mongodb_db()
-    result = db.app_calendarevent.delete_one({"_id": ObjectId(event_id)})
-    return result.deleted_count > 0
+    event_id = ObjectId(event_id)
+    if db.app_calendarevent.find_one({'_id': event_id}, {'_id': 1}) is None:
+        return False
+    
+    # Tombstone first: if the delete is lost, clients drop an event that still
+    # exists (its next update brings it back) rather than keeping a deleted one
+    db.app_calendarevent_tombstone.replace_one(
+        {'_id': event_id},
+        {'version': _next_event_version(db), 'deleted_at': _utcnow()},
+        upsert=True
+    )
+    db.app_calendarevent.delete_one({'_id': event_id})
+    return True
 
+@timed()
 def get_calendar_event_by_id(event_id):
     """Get a calendar event by ID from MongoDB"""
     db = get_mongodb_db()
@@ -134,9 +223,679 @@ def get_calendar_event_by_id(event_id):
         event['_id'] = str(event['_id'])
     return event
 
+def _serialize_change(doc):
+    """Make an event or tombstone document JSON serializable"""
+    doc['_id'] = str(doc['_id'])
+    for field in ('updated_at', 'deleted_at'):
+        if isinstance(doc.get(field), datetime.datetime):
+            doc[field] = doc[field].replace(tzinfo=datetime.timezone.utc).isoformat()
+    return doc
+
+def _changed_after(doc, moment):
+    """Whether an event or tombstone was written after `moment` (UTC)"""
+    changed_at = doc.get('updated_at') or doc.get('deleted_at')
+    if not isinstance(changed_at, datetime.datetime):
+        return False
+    # PyMongo returns naive datetimes in UTC
+    return changed_at.replace(tzinfo=datetime.timezone.utc) > moment
+
+def _settled_version(db, floor, settled_before):
+    """Highest version up to which every change has settled
+
+    Walks events and tombstones newest first, so only the changes inside
+    the settle window are read.
+    """
+    newest, unsettled = floor, []
+    for collection in (db.app_calendarevent, db.app_calendarevent_tombstone):
+        changes = collection.find(
+            {'version': {'$gt': floor}}, {'version': 1, 'updated_at': 1, 'deleted_at': 1}
+        ).sort('version', -1)
+        for doc in changes:
+            if not _changed_after(doc, settled_before):
+                newest = max(newest, doc['version'])
+                break
+            unsettled.append(doc['version'])
+    if unsettled:
+        return max(floor, min(unsettled) - 1)
+    return newest
+
+@timed()
+def get_calendar_changes_from_mongodb(since, limit=500, after=None):
+    """Get calendar events and tombstones changed after version `since`
+    
+    Returns a dict with the changed events, the ids of deleted events, the
+    cursor to pass as `since` on the next call and whether more changes are
+    waiting. A `since` of 0 (or one older than the compacted tombstones)
+    returns a snapshot of the live events with `reset` set, so the client
+    replaces its copy. Snapshots are paged by id: while `has_more` is set,
+    pass the returned `version` and `after` to get the next page.
+    """
+    db = get_mongodb_db()
+    _ensure_indexes(db, 'app_calendarevent', CALENDAR_EVENT_INDEXES)
+    _ensure_indexes(db, 'app_calendarevent_tombstone', CALENDAR_TOMBSTONE_INDEXES)
+    
+    counter = db.app_counters.find_one({'_id': EVENT_VERSION_COUNTER}) or {}
+    floor = counter.get('floor', 0)
+    
+    # Writes reserve their version just before they land, so only advance
+    # the cursor past changes older than the settle window; newer ones are
+    # sent again on the next poll (applying a change twice is harmless)
+    settled_before = _utcnow() - datetime.timedelta(seconds=settings.CALENDAR_SYNC_SETTLE_SECONDS)
+    
+    if after is not None or since <= 0 or since < floor:
+        if after is None:
+            # Read the cursor first; writes made while paging are replayed as deltas
+            cursor = _settled_version(db, floor, settled_before)
+            query = {}
+        else:
+            cursor = since
+            query = {'_id': {'$gt': ObjectId(after)}}
+        events = list(db.app_calendarevent.find(query).sort('_id', 1).limit(limit + 1))
+        has_more = len(events) > limit
+        events = events[:limit]
+        return {
+            'reset': True,
+            'version': cursor,
+            'events': [_serialize_change(doc) for doc in events],
+            'deleted': [],
+            'has_more': has_more,
+            'after': str(events[-1]['_id']) if has_more else None,
+        }
+    
+    # Both collections are read by the version index, newest changes last
+    query = {'version': {'$gt': since}}
+    events = list(db.app_calendarevent.find(query).sort('version', 1).limit(limit + 1))
+    tombstones = list(db.app_calendarevent_tombstone.find(query).sort('version', 1).limit(limit + 1))
+    
+    changes = sorted(events + tombstones, key=lambda doc: doc['version'])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    
+    # Advance the cursor through the leading run of settled changes
+    cursor = since
+    for doc in changes:
+        if _changed_after(doc, settled_before):
+            break
+        cursor = doc['version']
+    
+    return {
+        'reset': False,
+        'version': cursor,
+        'events': [_serialize_change(doc) for doc in changes if 'deleted_at' not in doc],
+        'deleted': [str(doc['_id']) for doc in changes if 'deleted_at' in doc],
+        'has_more': has_more,
+    }
+
+@timed()
+def compact_calendar_tombstones(older_than):
+    """Remove tombstones deleted before `older_than` and return how many were removed
+    
+    Clients whose cursor predates the removed tombstones get a full snapshot
+    on their next sync instead of an incomplete delta.
+    """
+    db = get_mongodb_db()
+    _ensure_indexes(db, 'app_calendarevent_tombstone', CALENDAR_TOMBSTONE_INDEXES)
+    query = {'deleted_at': {'$lt': older_than}}
+    
+    newest = db.app_calendarevent_tombstone.find_one(query, sort=[('version', -1)])
+    if not newest:
+        return 0
+    
+    # Raise the floor before deleting so no client can miss a tombstone
+    db.app_counters.update_one(
+        {'_id': EVENT_VERSION_COUNTER},
+        {'$max': {'floor': newest['version']}},
+        upsert=True
+    )
+    query['version'] = {'$lte': newest['version']}
+    result = db.app_calendarevent_tombstone.delete_many(query)
+    return result.deleted_count
+
+def _plan_calendar_event_batch(db, operations, session=None):
+    """Turn validated batch operations into bulk write requests
+    
+    Returns the event requests, the tombstone requests (paired with their
+    operation index), the per-item results and, for each event request, the
+    index of the operation it came from.
+    """
+    ids = [ObjectId(op['id']) for op in operations if op['op'] != 'create']
+    existing = set()
+    if ids:
+        # One round trip tells us which updates and deletes have a target
+        cursor = db.app_calendarevent.find({'_id': {'$in': ids}}, {'_id': 1}, session=session)
+        existing = {doc['_id'] for doc in cursor}
+    
+    # Reserve a contiguous block of versions for the whole batch
+    first_version = _next_event_version(db, len(operations)) - len(operations) + 1
+    now = _utcnow()
+    
+    requests, tombstones, origins = [], [], []
+    results = []
+    for index, op in enumerate(operations):
+        version = first_version + index
+        
+        if op['op'] == 'create':
+            doc = normalize_event_dates(dict(op['data']))
+            doc.update({'_id': ObjectId(), 'version': version, 'updated_at': now})
+            requests.append(InsertOne(doc))
+            origins.append(index)
+            results.append({'id': str(doc['_id']), 'op': 'create', 'status': 'created'})
+            continue
+        
+        event_id = ObjectId(op['id'])
+        if event_id not in existing:
+            results.append({'id': op['id'], 'op': op['op'], 'status': 'not_found'})
+            continue
+        
+        if op['op'] == 'update':
+            changes = normalize_event_dates(dict(op['data']))
+            changes.update({'version': version, 'updated_at': now})
+            requests.append(UpdateOne({'_id': event_id}, {'$set': changes}))
+            results.append({'id': op['id'], 'op': 'update', 'status': 'updated', 'version': version})
+        else:
+            requests.append(DeleteOne({'_id': event_id}))
+            tombstones.append((index, ReplaceOne(
+                {'_id': event_id},
+                {'version': version, 'deleted_at': now},
+                upsert=True
+            )))
+            results.append({'id': op['id'], 'op': 'delete', 'status': 'deleted', 'version': version})
+        origins.append(index)
+    
+    return requests, tombstones, results, origins
+
+def _check_batch_counts(db, operations, results, written):
+    """Correct per-item results when events vanished after the batch was planned
+
+    Bulk writes only report totals, so when fewer events were matched or
+    deleted than planned, look at what is stored now: an update landed if the
+    event carries its version (or a newer one), and a delete is reported as
+    not found when a newer tombstone shows another request deleted it.
+    """
+    pending = {'update': [], 'delete': []}
+    for index, result in enumerate(results):
+        if result['status'] in ('updated', 'deleted'):
+            pending[result['op']].append(index)
+    
+    updates, deletes = pending['update'], pending['delete']
+    if updates and written.get('nMatched', 0) < len(updates):
+        ids = [ObjectId(operations[index]['id']) for index in updates]
+        versions = {
+            doc['_id']: doc.get('version', 0)
+            for doc in db.app_calendarevent.find({'_id': {'$in': ids}}, {'version': 1})
+        }
+        for index, event_id in zip(updates, ids):
+            if versions.get(event_id, 0) < results[index]['version']:
+                results[index]['status'] = 'not_found'
+    if deletes and written.get('nRemoved', 0) < len(deletes):
+        ids = [ObjectId(operations[index]['id']) for index in deletes]
+        versions = {
+            doc['_id']: doc['version']
+            for doc in db.app_calendarevent_tombstone.find({'_id': {'$in': ids}}, {'version': 1})
+        }
+        for index, event_id in zip(deletes, ids):
+            if versions.get(event_id, 0) > results[index]['version']:
+                results[index]['status'] = 'not_found'
+
+def _public_results(results):
+    """Per-item results without the planned versions"""
+    return [{k: v for k, v in result.items() if k != 'version'} for result in results]
+
+@timed()
+def apply_calendar_event_batch(operations, atomic=False):
+    """Apply create/update/delete operations with one unordered bulk write
+    
+    Operations must already be validated. In best-effort mode every item is
+    attempted and failures are reported per item. In atomic mode the batch
+    runs in a transaction and nothing is written unless every item succeeds;
+    this needs a replica set or sharded cluster.
+    
+    Returns a dict with `applied`, the per-item `results` and, when the batch
+    was rejected, an `error` message.
+    """
+    db = get_mongodb_db()
+    
+    if not atomic:
+        requests, tombstones, results, origins = _plan_calendar_event_batch(db, operations)
+        # Tombstones go first, as in delete_calendar_event_from_mongodb
+        if tombstones:
+            db.app_calendarevent_tombstone.bulk_write([t for _, t in tombstones], ordered=False)
+        if requests:
+            try:
+                written = db.app_calendarevent.bulk_write(requests, ordered=False).bulk_api_result
+            except BulkWriteError as e:
+                written = e.details
+                for error in e.details.get('writeErrors', []):
+                    index = origins[error['index']]
+                    results[index]['status'] = 'error'
+                    results[index]['error'] = error.get('errmsg', 'Write failed')
+            _check_batch_counts(db, operations, results, written)
+        
+        # Take back the tombstones of deletes that failed (events that another
+        # request deleted meanwhile keep that request's tombstone)
+        failed = [
+            ObjectId(operations[index]['id'])
+            for index, _ in tombstones if results[index]['status'] == 'error'
+        ]
+        if failed:
+            db.app_calendarevent_tombstone.delete_many({'_id': {'$in': failed}})
+        return {'applied': True, 'results': _public_results(results)}
+    
+    outcome = {}
+    
+    def run_batch(session):
+        requests, tombstones, results, _ = _plan_calendar_event_batch(db, operations, session)
+        outcome['results'] = _public_results(results)
+        if any(result['status'] == 'not_found' for result in results):
+            # Raising aborts the transaction before anything is written
+            raise LookupError('One or more events were not found')
+        if requests:
+            written = db.app_calendarevent.bulk_write(requests, ordered=False, session=session)
+            planned = [result['op'] for result in results]
+            if (written.matched_count < planned.count('update')
+                    or written.deleted_count < planned.count('delete')):
+                raise LookupError('One or more events were not found')
+        if tombstones:
+            db.app_calendarevent_tombstone.bulk_write(
+                [t for _, t in tombstones], ordered=False, session=session
+            )
+    
+    try:
+        with db.client.start_session() as session:
+            session.with_transaction(run_batch)
+    except LookupError as e:
+        return {'applied': False, 'results': outcome['results'], 'error': str(e)}
+    except (BulkWriteError, OperationFailure) as e:
+        # Code 20 (IllegalOperation): standalone servers have no transactions
+        if getattr(e, 'code', None) == 20:
+            error = 'Atomic batches need MongoDB transactions (replica set or sharded cluster)'
+        else:
+            error = f'Batch aborted: {e}'
+        results = [
+            {'id': op.get('id'), 'op': op['op'], 'status': 'aborted'}
+            for op in operations
+        ]
+        return {'applied': False, 'results': results, 'error': error}
+    
+    return {'applied': True, 'results': outcome['results']}
+
+@timed()
+def upsert_calendar_events_by_uid(events):
+    """Insert or replace a batch of events keyed by their iCalendar UID
+    
+    Events exported from this app carry a UID built from their ObjectId and
+    are matched back to the original document. Returns the number of
+    events inserted and updated.
+    """
+    # The last copy of a repeated UID wins, as it would with sequential writes
+    events = list({event['uid']: event for event in events}.values())
+    if not events:
+        return {'inserted': 0, 'updated': 0}
+    
+    db = get_mongodb_db()
+    _ensure_indexes(db, 'app_calendarevent', CALENDAR_EVENT_INDEXES)
+    
+    first_version = _next_event_version(db, len(events)) - len(events) + 1
+    now = _utcnow()
+    
+    requests = []
+    for index, event in enumerate(events):
+        event = normalize_event_dates(dict(event))
+        event.update({'version': first_version + index, 'updated_at': now})
+        
+        local = LOCAL_UID_PATTERN.match(event['uid'])
+        if local:
+            event.pop('uid')
+            query = {'_id': ObjectId(local.group(1))}
+        else:
+            query = {'uid': event['uid']}
+        requests.append(UpdateOne(query, {'$set': event}, upsert=True))
+    
+    result = db.app_calendarevent.bulk_write(requests, ordered=False)
+    return {'inserted': result.upserted_count, 'updated': result.matched_count}
+
+def iter_calendar_events_from_mongodb(batch_size=500):
+    """Yield every calendar event from a cursor without loading them all"""
+    db = get_mongodb_db()
+    cursor = db.app_calendarevent.find().sort('_id', 1).batch_size(batch_size)
+    try:
+        for event in cursor:
+            event['_id'] = str(event['_id'])
+            yield event
+    finally:
+        cursor.close()
 
+@timed()
+def search_calendar_events_in_mongodb(query, skip=0, limit=20):
+    """Search events through the text index, best matches first"""
+    db = get_mongodb_db()
+    _ensure_indexes(db, 'app_calendarevent', CALENDAR_EVENT_INDEXES)
+    
+    # One $text query yields both the page and the total
+    pipeline = [
+        {'$match': {'$text': {'$search': query}}},
+        {'$addFields': {'score': {'$meta': 'textScore'}}},
+        {'$facet': {
+            'results': [
+                {'$sort': {'score': -1, 'start_date': 1}},
+                {'$skip': skip},
+                {'$limit': limit},
+                {'$project': {
+                    'title': 1,
+                    'description': 1,
+                    'location': 1,
+                    'start_date': 1,
+                    'start_time': 1,
+                    'priority': 1,
+                    'score': 1,
+                }},
+            ],
+            'total': [{'$count': 'count'}],
+        }},
+    ]
+    found = next(db.app_calendarevent.aggregate(pipeline, allowDiskUse=True))
+    
+    results = []
+    for event in found['results']:
+        results.append({
+            'id': str(event['_id']),
+            'title': event.get('title', ''),
+            'description': event.get('description', ''),
+            'location': event.get('location', ''),
+            'start_date': event.get('start_date'),
+            'start_time': event.get('start_time'),
+            'priority': event.get('priority', 'medium'),
+            'score': round(event['score'], 4),
+        })
+    
+    total = found['total'][0]['count'] if found['total'] else 0
+    return {'total': total, 'results': results}
 
+@timed()
+def get_calendar_day_summaries_from_mongodb(start_date, end_date):
+    """Get per-day event counts and each day's top-priority event
+    
+    Runs one aggregation over the start_date index for the inclusive range
+    and returns a dict keyed by ISO date string. Days without events are
+    left out.
+    """
+    db = get_mongodb_db()
+    _ensure_indexes(db, 'app_calendarevent', CALENDAR_EVENT_INDEXES)
+    
+    pipeline = [
+        {'$match': {'start_date': {'$gte': start_date.isoformat(), '$lte': end_date.isoformat()}}},
+        # The top event is the smallest (rank, start time, ...) document, so
+        # no sort stage is needed: $group keeps one candidate per day
+        {'$group': {
+            '_id': '$start_date',
+            'count': {'$sum': 1},
+            'top': {'$min': {
+                # Rank high before medium before low; events without a priority count as medium
+                'rank': {'$switch': {
+                    'branches': [
+                        {'case': {'$eq': [{'$ifNull': ['$priority', 'medium']}, 'high']}, 'then': 0},
+                        {'case': {'$eq': [{'$ifNull': ['$priority', 'medium']}, 'medium']}, 'then': 1},
+                    ],
+                    'default': 2,
+                }},
+                # All-day events (no start_time) sort first within a priority
+                'start_time': {'$ifNull': ['$start_time', '']},
+                'id': {'$toString': '$_id'},
+                'title': '$title',
+                'all_day': {'$ifNull': ['$all_day', False]},
+                'priority': {'$ifNull': ['$priority', 'medium']},
+            }},
+        }},
+    ]
+    
+    summaries = {}
+    for day in db.app_calendarevent.aggregate(pipeline):
+        top = day['top']
+        summaries[day['_id']] = {'count': day['count'], 'top': {
+            'id': top['id'],
+            'title': top.get('title'),
+            'start_time': top['start_time'] or None,
+            'all_day': top['all_day'],
+            'priority': top['priority'],
+        }}
+    return summaries
 
+@timed()
+def get_calendar_change_version():
+    """Get the latest issued calendar change version"""
+    db = get_mongodb_db()
+    counter = db.app_counters.find_one({'_id': EVENT_VERSION_COUNTER}) or {}
+    return counter.get('seq', 0)
 
+@timed()
+def seed_calendar_change_version():
+    """Make the change version at least 1 and return it
 
+    A cursor of 0 asks for a full snapshot, so followers of the feed start
+    from a seeded version even before anything versioned has been written.
+    """
+    db = get_mongodb_db()
+    counter = db.app_counters.find_one_and_update(
+        {'_id': EVENT_VERSION_COUNTER},
+        {'$max': {'seq': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter['seq']
+
+def iter_upcoming_reminder_events_from_mongodb(from_date, batch_size=1000):
+    """Yield events with a reminder starting on or after `from_date`"""
+    db = get_mongodb_db()
+    _ensure_indexes(db, 'app_calendarevent', CALENDAR_EVENT_INDEXES)
+    cursor = db.app_calendarevent.find(
+        {'reminder': True, 'start_date': {'$gte': from_date.isoformat()}}
+    ).batch_size(batch_size)
+    try:
+        for event in cursor:
+            event['_id'] = str(event['_id'])
+            yield event
+    finally:
+        cursor.close()
+
+@timed()
+def get_calendar_events_between_from_mongodb(start_date, end_date):
+    """Get events starting in the inclusive date range, sorted by start
+    
+    The filter and sort are both served by the start date/time index.
+    """
+    db = get_mongodb_db()
+    _ensure_indexes(db, 'app_calendarevent', CALENDAR_EVENT_INDEXES)
+    
+    cursor = db.app_calendarevent.find({
+        'start_date': {'$gte': start_date.isoformat(), '$lte': end_date.isoformat()},
+    }).sort([('start_date', 1), ('start_time', 1)])
+    
+    events = list(cursor)
+    for event in events:
+        event['_id'] = str(event['_id'])
+    return events
 
+@timed()
+def get_calendar_events_by_priority_from_mongodb(priority, start_date, end_date):
+    """Get events with a priority starting in the inclusive date range, sorted by start
+    
+    The filter and sort are both served by the priority/start index.
+    """
+    db = get_mongodb_db()
+    _ensure_indexes(db, 'app_calendarevent', CALENDAR_EVENT_INDEXES)
+    
+    # Events saved without a priority are shown as medium
+    priority_filter = {'$in': ['medium', None]} if priority == 'medium' else priority
+    cursor = db.app_calendarevent.find({
+        'priority': priority_filter,
+        'start_date': {'$gte': start_date.isoformat(), '$lte': end_date.isoformat()},
+    }).sort([('start_date', 1), ('start_time', 1)])
+    
+    events = list(cursor)
+    for event in events:
+        event['_id'] = str(event['_id'])
+    return events
+
+@timed()
+def get_quotes_from_mongodb():
+    """Get quotes from MongoDB"""
+    db = get_mongodb_db()
+    quotes = list(db.app_quote.find())
+    # Convert ObjectId to string for JSON serialization
+    for quote in quotes:
+        quote['_id'] = str(quote['_id'])
+    return quotes
+
+@timed()
+def get_random_quote_from_mongodb():
+    """Get one random quote from MongoDB without reading the whole collection"""
+    db = get_mongodb_db()
+    for quote in db.app_quote.aggregate([{'$sample': {'size': 1}}]):
+        quote['_id'] = str(quote['_id'])
+        return quote
+    return None
+
+@timed()
+def save_quote_to_mongodb(text, author):
+    """Save a quote to MongoDB"""
+    db = get_mongodb_db()
+    result = db.app_quote.insert_one({
+        'text': text,
+        'author': author
+    })
+    return str(result.inserted_id)
+
+@timed()
+def save_quotes_to_mongodb(quotes):
+    """Save several quotes to MongoDB in one round trip"""
+    db = get_mongodb_db()
+    result = db.app_quote.insert_many([dict(quote) for quote in quotes])
+    return [str(quote_id) for quote_id in result.inserted_ids]
+
+@timed()
+def get_user_preferences_from_mongodb():
+    """Get user preferences from MongoDB, or None if none were saved"""
+    db = get_mongodb_db()
+    pref = db.app_userpreference.find_one()
+    if pref:
+        pref['_id'] = str(pref['_id'])
+    return pref
+
+@timed()
+def save_user_preferences_to_mongodb(preferences):
+    """Save user preferences to MongoDB"""
+    db = get_mongodb_db()
+    # Update the first one or insert if none exists
+    result = db.app_userpreference.update_one(
+        {}, 
+        {'$set': preferences},
+        upsert=True
+    )
+    return result.acknowledged
+
+@timed()
+def begin_flight_in_mongodb(key, owner, ttl_seconds):
+    """Claim the single-flight for `key`, or return the flight another owner holds
+
+    Returns the flight document ({'owner', 'done', 'value'}); the caller holds
+    it when 'owner' matches. A flight past `expires_at` is taken over, since the
+    TTL monitor only removes expired documents about once a minute. Returns
+    None if the flight vanished between the claim and the read.
+    """
+    db = get_mongodb_db()
+    now = _utcnow()
+    flight = {
+        'owner': owner,
+        'done': False,
+        'value': None,
+        'expires_at': now + datetime.timedelta(seconds=ttl_seconds),
+    }
+    try:
+        db.app_flights.insert_one({'_id': key, **flight})
+        return flight
+    except DuplicateKeyError:
+        pass
+    # The previous owner finished long ago or died; take its place
+    taken = db.app_flights.find_one_and_update(
+        {'_id': key, 'expires_at': {'$lte': now}},
+        {'$set': flight},
+        return_document=ReturnDocument.AFTER
+    )
+    return taken or db.app_flights.find_one({'_id': key})
+
+@timed()
+def finish_flight_in_mongodb(key, owner, value=None, keep_seconds=0):
+    """Publish a flight's result for `keep_seconds`, or release it when that is 0"""
+    db = get_mongodb_db()
+    if keep_seconds <= 0:
+        db.app_flights.delete_one({'_id': key, 'owner': owner})
+        return
+    db.app_flights.update_one(
+        {'_id': key, 'owner': owner},
+        {'$set': {
+            'done': True,
+            'value': value,
+            'expires_at': _utcnow() + datetime.timedelta(seconds=keep_seconds),
+        }}
+    )
+
+@timed()
+def get_flight_from_mongodb(key):
+    """Return the unexpired flight for `key`, or None"""
+    db = get_mongodb_db()
+    return db.app_flights.find_one({'_id': key, 'expires_at': {'$gt': _utcnow()}})
+
+@timed()
+def get_cache_entry_from_mongodb(key):
+    """Return (data, expires at as a Unix time) for an unexpired app_cache entry, or None"""
+    db = get_mongodb_db()
+    entry = db.app_cache.find_one({'_id': key, 'expires_at': {'$gt': _utcnow()}})
+    if entry is None:
+        return None
+    # Dates come back naive unless the client is tz_aware; both are UTC
+    expires_at = entry['expires_at'].replace(tzinfo=datetime.timezone.utc)
+    return bytes(entry['data']), expires_at.timestamp()
+
+@timed()
+def save_cache_entry_to_mongodb(key, data, ttl_seconds):
+    """Store an app_cache entry; the TTL index removes it after it expires"""
+    db = get_mongodb_db()
+    db.app_cache.replace_one(
+        {'_id': key},
+        {'data': data, 'expires_at': _utcnow() + datetime.timedelta(seconds=ttl_seconds)},
+        upsert=True
+    )
+
+@timed()
+def delete_cache_entry_from_mongodb(key):
+    db = get_mongodb_db()
+    db.app_cache.delete_one({'_id': key})
+
+@timed()
+def take_tokens_in_mongodb(key, cost, rate, capacity, floor=0):
+    """Refill and draw from the token bucket `key` in one atomic update
+
+    The arithmetic runs on the server (an update pipeline, MongoDB 4.2+), so
+    concurrent workers never spend the same tokens. Returns whether `cost`
+    tokens were taken; they are only taken if `floor` tokens remain.
+    """
+    db = get_mongodb_db()
+    now = _utcnow()
+    elapsed = {'$max': [0, {'$divide': [{'$subtract': [now, {'$ifNull': ['$updated_at', now]}]}, 1000]}]}
+    refilled = {'$min': [capacity, {'$add': [{'$ifNull': ['$tokens', capacity]}, {'$multiply': [elapsed, rate]}]}]}
+    bucket = db.app_quota.find_one_and_update(
+        {'_id': key},
+        [
+            {'$set': {'tokens': refilled, 'updated_at': now}},
+            {'$set': {'granted': {'$gte': [{'$subtract': ['$tokens', cost]}, floor]}}},
+            {'$set': {'tokens': {'$cond': ['$granted', {'$subtract': ['$tokens', cost]}, '$tokens']}}},
+        ],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return bucket['granted']
+
+@timed()
+def set_tokens_in_mongodb(key, tokens):
+    db = get_mongodb_db()
+    db.app_quota.update_one({'_id': key}, {'$set': {'tokens': tokens, 'updated_at': _utcnow()}}, upsert=True)
@@ -0,0 +1,202 @@
+"""On-demand and continuous profiling of views
+
+With PROFILING_ENABLED on, a staff user (or a client sending
+`X-Profile-Token: <PROFILING_TOKEN>`) can profile one request by adding
+`?profile=cprofile` or `?profile=sample`, or the `X-Profile` header:
+
+- `cprofile` runs the view under cProfile and writes `<name>.pstats`, plus
+  a `<name>.collapsed` file of sampled stacks
+- `sample` only samples the handling thread's stack every
+  PROFILING_SAMPLE_INTERVAL_MS, which adds little overhead
+
+Files go to PROFILING_DIR and are listed in the X-Profile-Files response
+header; only the newest PROFILING_MAX_FILES profiles are kept there. With
+`profile_report=1` the response is replaced by a text report. Collapsed
+files hold one `frame;frame;frame count` line per stack, the input format
+of flamegraph.pl and speedscope.
+
+PROFILING_CONTINUOUS samples every thread at a low rate in the background
+and writes a collapsed file every PROFILING_CONTINUOUS_PERIOD_SECONDS.
+"""
+import collections
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+PROFILE_MODES = ('cprofile', 'sample')
+PROFILE_SUFFIXES = ('.collapsed', '.pstats')
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+def collapse_stack(frame):
+    """The stack ending at `frame` as `outermost;...;innermost`"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class StackSampler:
+    """Count the stacks of some (or all other) threads from a background thread"""
+
+    def __init__(self, interval, thread_ids=None):
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            stacks = [collapse_stack(frame) for thread_id, frame in frames.items()
+                      if thread_id != own and (self.thread_ids is None or thread_id in self.thread_ids)]
+            with self._lock:
+                self.counts.update(stacks)
+
+    def take(self):
+        """Return the counts so far and start counting from zero"""
+        with self._lock:
+            counts, self.counts = self.counts, collections.Counter()
+        return counts
+
+def format_collapsed(counts):
+    return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as output:
+        output.write(content)
+
+def _prune(directory):
+    """Remove the oldest profiles beyond PROFILING_MAX_FILES"""
+    try:
+        with os.scandir(directory) as entries:
+            profiles = [(entry.stat().st_mtime, entry.path) for entry in entries
+                        if entry.name.endswith(PROFILE_SUFFIXES)]
+    except OSError:
+        return
+    profiles.sort()
+    for _, path in profiles[:max(0, len(profiles) - settings.PROFILING_MAX_FILES)]:
+        try:
+            os.remove(path)
+        except OSError:
+            # Another process pruned it first
+            pass
+
+def _profile_name(label):
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{os.getpid()}-{threading.get_ident()}"
+
+class ProfilingMiddleware:
+    """Profile single requests on demand; see the module docstring"""
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def _requested_mode(self, request):
+        mode = request.GET.get('profile') or request.headers.get('X-Profile')
+        if mode not in PROFILE_MODES:
+            return None
+        token = settings.PROFILING_TOKEN
+        sent = request.headers.get('X-Profile-Token', '')
+        if token and hmac.compare_digest(sent.encode(), token.encode()):
+            return mode
+        user = getattr(request, 'user', None)
+        return mode if user is not None and user.is_staff else None
+
+    def __call__(self, request):
+        mode = self._requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        sampler = StackSampler(settings.PROFILING_SAMPLE_INTERVAL_MS / 1000,
+                               thread_ids={threading.get_ident()}).start()
+        profiler = cProfile.Profile() if mode == 'cprofile' else None
+        try:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        finally:
+            sampler.stop()
+
+        match = getattr(request, 'resolver_match', None)
+        base = os.path.join(settings.PROFILING_DIR, _profile_name(
+            match.url_name if match and match.url_name else 'unresolved'))
+        counts = sampler.take()
+        files = [base + '.collapsed']
+        _write(files[0], format_collapsed(counts))
+        report = io.StringIO()
+        if profiler is not None:
+            files.append(base + '.pstats')
+            profiler.dump_stats(files[1])
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(40)
+        else:
+            report.write(format_collapsed(counts))
+        _prune(settings.PROFILING_DIR)
+
+        if request.GET.get('profile_report'):
+            response = HttpResponse(report.getvalue(), content_type='text/plain; charset=utf-8')
+        response['X-Profile-Files'] = ', '.join(os.path.basename(path) for path in files)
+        return response
+
+_continuous = None
+_continuous_lock = threading.Lock()
+
+def start_continuous_profiling():
+    """Start the low-rate background sampler for this process (idempotent)"""
+    global _continuous
+    with _continuous_lock:
+        if _continuous is not None and _continuous[0] == os.getpid():
+            return
+        sampler = StackSampler(settings.PROFILING_CONTINUOUS_INTERVAL_MS / 1000).start()
+        _continuous = (os.getpid(), sampler)
+
+    def write_periodically():
+        while not sampler._stopped.wait(settings.PROFILING_CONTINUOUS_PERIOD_SECONDS):
+            counts = sampler.take()
+            if counts:
+                try:
+                    _write(os.path.join(settings.PROFILING_DIR, _profile_name('continuous') + '.collapsed'),
+                           format_collapsed(counts))
+                    _prune(settings.PROFILING_DIR)
+                except OSError:
+                    pass
+    threading.Thread(target=write_periodically, name='profile-writer', daemon=True).start()
+
+def _restart_continuous_in_child():
+    # Threads do not survive a fork; a pre-forked worker samples itself
+    global _continuous
+    if _continuous is not None:
+        _continuous = None
+        start_continuous_profiling()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_continuous_in_child)
@@ -0,0 +1,162 @@
+"""Per-request MongoDB query accounting and a slow-command log
+
+A pymongo command listener (installed at startup while
+MONGODB_QUERY_ACCOUNTING is on) attributes every command to the request
+being handled by QueryAccountingMiddleware, and:
+- logs commands slower than MONGODB_SLOW_MS with the shape of their filter,
+  e.g. `find vsm_db.app_calendarevent filter={"start_date": {"$gte": "?"}}`;
+  values are never logged
+- counts the operations and database time of each request, reported in
+  X-MongoDB-* response headers when DEBUG is on
+- feeds the per-command and per-request histograms in app.utils.metrics
+
+Only clients created after the listener is installed are monitored.
+"""
+import contextvars
+import json
+import logging
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from pymongo import monitoring
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Connection management traffic, not work done on behalf of the caller
+MONITORING_COMMANDS = {
+    'hello', 'ismaster', 'isMaster', 'ping', 'buildInfo', 'endSessions',
+    'saslStart', 'saslContinue', 'authenticate', 'getnonce', 'killCursors',
+}
+
+# The command field holding the filter (or pipeline) of each command
+_FILTER_FIELDS = {
+    'find': 'filter', 'count': 'query', 'distinct': 'query', 'findAndModify': 'query',
+    'aggregate': 'pipeline', 'update': 'updates', 'delete': 'deletes',
+}
+
+def query_shape(value):
+    """The structure of a filter with every value replaced by '?'"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(item, (dict, list, tuple)) for item in value):
+            return [query_shape(item) for item in value]  # e.g. $or clauses, pipeline stages
+        return ['?'] if value else []  # e.g. the values of $in
+    return '?'
+
+def _dumps(value):
+    return json.dumps(value, default=str)
+
+def describe_command(command_name, database_name, command):
+    """One-line description of a command, without any of its values"""
+    collection = command.get(command_name)
+    parts = [command_name, f'{database_name}.{collection}' if isinstance(collection, str) else database_name]
+    field = _FILTER_FIELDS.get(command_name)
+    if field in ('updates', 'deletes'):
+        statements = command.get(field) or []
+        if statements:
+            parts.append(f"q={_dumps(query_shape(statements[0].get('q', {})))}")
+            if len(statements) > 1:
+                parts.append(f'({len(statements)} statements)')
+    elif field and field in command:
+        parts.append(f'{field}={_dumps(query_shape(command[field]))}')
+    if 'sort' in command:
+        parts.append(f"sort={_dumps(command['sort'])}")
+    return ' '.join(parts)
+
+class QueryStats:
+    """MongoDB work done on behalf of one request"""
+
+    __slots__ = ('request', 'ops', 'seconds', 'slow')
+
+    def __init__(self, request=None):
+        self.request = request
+        self.ops = 0
+        self.seconds = 0.0
+        self.slow = 0
+
+    @property
+    def view(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return match.url_name if match and match.url_name else 'unresolved'
+
+# Stats of the request being handled in this context, or None
+_current = contextvars.ContextVar('mongodb_query_stats', default=None)
+
+def current_query_stats():
+    return _current.get()
+
+class _QueryListener(monitoring.CommandListener):
+    def __init__(self):
+        # (connection, request id) -> (command, stats) for commands in progress
+        self._pending = {}
+
+    def started(self, event):
+        if event.command_name in MONITORING_COMMANDS:
+            return
+        self._pending[(event.connection_id, event.request_id)] = (event.command, _current.get())
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        command, stats = pending
+        seconds = event.duration_micros / 1e6
+        collection = command.get(event.command_name)
+        collection = collection if isinstance(collection, str) else ''
+        slow = seconds * 1000 >= settings.MONGODB_SLOW_MS
+
+        if stats is not None:
+            stats.ops += 1
+            stats.seconds += seconds
+            stats.slow += slow
+        if settings.METRICS_ENABLED:
+            metrics.MONGODB_COMMAND_LATENCY.observe(seconds, event.command_name, collection)
+            if slow:
+                metrics.MONGODB_SLOW_COMMANDS.inc(event.command_name, collection)
+        if slow:
+            logger.warning(
+                'Slow MongoDB command (%.1f ms, view %s): %s',
+                seconds * 1000, stats.view if stats is not None else '-',
+                describe_command(event.command_name, event.database_name, command))
+
+_listener = None
+
+def install_query_listener():
+    """Register the command listener with pymongo (once per process)"""
+    global _listener
+    if _listener is None:
+        _listener = _QueryListener()
+        monitoring.register(_listener)
+
+class QueryAccountingMiddleware:
+    """Attribute MongoDB commands to the current request and report the totals"""
+
+    def __init__(self, get_response):
+        if not settings.MONGODB_QUERY_ACCOUNTING:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats(request)
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        if settings.METRICS_ENABLED:
+            metrics.REQUEST_MONGODB_OPERATIONS.observe(stats.ops, stats.view)
+            metrics.REQUEST_MONGODB_SECONDS.observe(stats.seconds, stats.view)
+        if settings.DEBUG:
+            response['X-MongoDB-Operations'] = str(stats.ops)
+            response['X-MongoDB-Time'] = f'{stats.seconds * 1000:.1f}ms'
+            if stats.slow:
+                response['X-MongoDB-Slow-Operations'] = str(stats.slow)
+        return response
@@ -0,0 +1,85 @@
+"""Request budgets for the upstream APIs, shared by every worker process
+
+Each provider ('openweather', 'newsapi': the part of the API name before
+the dot) has a daily quota in UPSTREAM_DAILY_QUOTAS. The quota is spent
+through a token bucket kept in the coordination store and updated atomically,
+so all workers draw on one budget. The bucket refills evenly over the day
+and holds at most UPSTREAM_QUOTA_BURST_FRACTION of the daily quota, which
+spreads spend across the day instead of exhausting it at the morning peak.
+
+The last UPSTREAM_QUOTA_RESERVE_FRACTION of the bucket is kept for
+background refreshes (code run inside `with background():`, such as the
+startup warm-up); on-demand fetches are refused before they can spend it,
+so a peak of page renders cannot starve the refreshes that keep the caches
+warm. A refused call raises upstream.QuotaExceeded, which the widgets treat
+like any failed fetch, so the cached or last-good snapshot data is served
+instead.
+
+After a 429 response the bucket is emptied for the Retry-After period, so
+no worker keeps calling an API that is already refusing requests. When the
+storage backend is unavailable, requests are allowed.
+"""
+import contextlib
+import contextvars
+import logging
+from django.conf import settings
+from app.utils.storage import get_coordination_store
+
+logger = logging.getLogger(__name__)
+
+_background = contextvars.ContextVar('quota_background', default=False)
+
+@contextlib.contextmanager
+def background():
+    """Let upstream calls in the block spend the reserved part of the budget"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+def _bucket(api):
+    """(storage key, refill rate per second, capacity), or None if unlimited"""
+    provider = api.split('.', 1)[0]
+    daily = settings.UPSTREAM_DAILY_QUOTAS.get(provider, 0)
+    if not settings.UPSTREAM_QUOTA_ENABLED or daily <= 0:
+        return None
+    capacity = max(1.0, daily * settings.UPSTREAM_QUOTA_BURST_FRACTION)
+    return f'quota:{provider}', daily / 86400, capacity
+
+def acquire(api, cost=1):
+    """Take `cost` requests from the API's budget; returns whether it may be called"""
+    bucket = _bucket(api)
+    if bucket is None:
+        return True
+    key, rate, capacity = bucket
+    floor = 0 if _background.get() else capacity * settings.UPSTREAM_QUOTA_RESERVE_FRACTION
+    try:
+        granted = get_coordination_store().take_tokens(key, cost, rate, capacity, floor)
+    except Exception:
+        logger.warning("Could not check the %s request budget; allowing the call", key, exc_info=True)
+        return True
+    if not granted:
+        logger.info("Request budget for %s is spent; not calling %s", key, api)
+    return granted
+
+def throttle(api, retry_after=None):
+    """Spend nothing on the API's provider until `retry_after` seconds have passed
+
+    `retry_after` is a Retry-After header value; when it is missing or is an
+    HTTP date, UPSTREAM_THROTTLE_SECONDS is used.
+    """
+    bucket = _bucket(api)
+    if bucket is None:
+        return
+    key, rate, _ = bucket
+    try:
+        seconds = float(retry_after)
+    except (TypeError, ValueError):
+        seconds = settings.UPSTREAM_THROTTLE_SECONDS
+    logger.warning("%s answered 429; pausing %s for %.0f s", api, key, seconds)
+    try:
+        # A negative balance refills to zero after `seconds`
+        get_coordination_store().set_tokens(key, -seconds * rate)
+    except Exception:
+        logger.warning("Could not pause %s", key, exc_info=True)
@@ -0,0 +1,254 @@
+"""Reminder scheduling for calendar events flagged with `reminder`
+
+Pending reminders live in a min-heap keyed by due time, so scheduling or
+cancelling one is O(log n) and the daemon only wakes when the next reminder
+is due. After an initial indexed load the daemon follows the calendar change
+feed, so saves, updates and deletes reach it without rescanning the
+collection. Due reminders are handed to the sinks listed in REMINDER_SINKS.
+"""
+import datetime
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from django.conf import settings
+from django.utils.module_loading import import_string
+from app.utils.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+def reminder_due_at(event, lead=None):
+    """Return when the reminder for an event is due, or None if it has none
+
+    Timed events are reminded `lead` before they start; all-day events at
+    REMINDER_ALL_DAY_TIME on the day minus the same lead.
+    """
+    if not event.get('reminder') or not event.get('start_date'):
+        return None
+    if lead is None:
+        lead = datetime.timedelta(minutes=settings.REMINDER_LEAD_MINUTES)
+
+    try:
+        start_date = datetime.date.fromisoformat(event['start_date'])
+        if event.get('all_day') or not event.get('start_time'):
+            start_time = datetime.time.fromisoformat(settings.REMINDER_ALL_DAY_TIME)
+        else:
+            start_time = datetime.time.fromisoformat(event['start_time'])
+    except (TypeError, ValueError):
+        return None
+    return datetime.datetime.combine(start_date, start_time) - lead
+
+class ReminderSink:
+    """Receives reminders when they become due"""
+
+    def deliver(self, reminder):
+        raise NotImplementedError
+
+class LogSink(ReminderSink):
+    """Write due reminders to the application log"""
+
+    def deliver(self, reminder):
+        logger.info(
+            "Reminder: %s at %s %s",
+            reminder['title'], reminder['start_date'], reminder['start_time'] or 'all day'
+        )
+
+class QueueSink(ReminderSink):
+    """Collect due reminders in a queue (useful for tests and local consumers)"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def deliver(self, reminder):
+        self.queue.put(reminder)
+
+class ReminderScheduler:
+    """Min-heap of pending reminders with O(log n) schedule and O(1) cancel
+
+    Cancelled or rescheduled entries are marked dead and skipped when they
+    reach the top of the heap; the heap is rebuilt once dead entries make up
+    more than half of it, so memory stays proportional to live reminders.
+    """
+
+    def __init__(self, sinks, clock=time.time):
+        self.sinks = sinks
+        self.clock = clock
+        self._heap = []  # [due timestamp, sequence, event_id, payload]
+        self._entries = {}  # event_id -> live heap entry
+        self._fired = {}  # event_id -> due timestamp already delivered
+        self._counter = itertools.count()
+        self._dead = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Drop every pending reminder, remembering which ones were already sent"""
+        with self._lock:
+            self._heap = []
+            self._entries = {}
+            self._dead = 0
+
+    def schedule(self, event):
+        """Add, move or drop the reminder for an event document"""
+        event_id = str(event['_id'])
+        due_at = reminder_due_at(event)
+        with self._lock:
+            self._cancel_unlocked(event_id)
+            if due_at is None:
+                return
+
+            due = due_at.timestamp()
+            grace = settings.REMINDER_GRACE_MINUTES * 60
+            if due < self.clock() - grace or self._fired.get(event_id) == due:
+                # Too late to be useful, or this exact reminder was already sent
+                return
+
+            entry = [due, next(self._counter), event_id, {
+                'event_id': event_id,
+                'title': event.get('title', ''),
+                'start_date': event['start_date'],
+                'start_time': None if event.get('all_day') else event.get('start_time'),
+                'location': event.get('location', ''),
+                'due_at': due_at.isoformat(),
+            }]
+            self._entries[event_id] = entry
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                # The new reminder is due before anything else we were waiting for
+                self._wakeup.notify()
+
+    def cancel(self, event_id):
+        with self._lock:
+            self._cancel_unlocked(str(event_id))
+
+    def _cancel_unlocked(self, event_id):
+        entry = self._entries.pop(event_id, None)
+        if entry is None:
+            return
+        entry[2] = None
+        self._dead += 1
+        if self._dead > len(self._heap) // 2:
+            self._heap = [e for e in self._heap if e[2] is not None]
+            heapq.heapify(self._heap)
+            self._dead = 0
+
+    def _pop_due_unlocked(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if entry[2] is None:
+                self._dead -= 1
+                continue
+            del self._entries[entry[2]]
+            self._fired[entry[2]] = entry[0]
+            due.append(entry[3])
+        return due
+
+    def seconds_until_next(self):
+        """Seconds until the next live reminder is due, or None if none are pending"""
+        with self._lock:
+            while self._heap and self._heap[0][2] is None:
+                heapq.heappop(self._heap)
+                self._dead -= 1
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - self.clock())
+
+    def deliver_due(self):
+        """Send every reminder that is due now to the sinks; returns how many"""
+        with self._lock:
+            due = self._pop_due_unlocked(self.clock())
+            # Forget delivered reminders once they are outside the grace window
+            horizon = self.clock() - settings.REMINDER_GRACE_MINUTES * 60
+            if len(self._fired) > 1000:
+                self._fired = {k: v for k, v in self._fired.items() if v >= horizon}
+
+        for reminder in due:
+            for sink in self.sinks:
+                try:
+                    sink.deliver(reminder)
+                except Exception:
+                    logger.exception("Reminder sink %s failed", type(sink).__name__)
+        return len(due)
+
+    def wait(self, timeout):
+        """Sleep until `timeout` passes or an earlier reminder is scheduled"""
+        with self._wakeup:
+            self._wakeup.wait(timeout)
+
+    def wake(self):
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+def get_reminder_sinks():
+    """Instantiate the sinks listed in the REMINDER_SINKS setting"""
+    return [import_string(path)() for path in settings.REMINDER_SINKS]
+
+class ReminderDaemon:
+    """Keeps a ReminderScheduler in step with event storage and delivers reminders"""
+
+    def __init__(self, scheduler=None):
+        # An empty scheduler is falsy (it has a length), so test for None
+        self.scheduler = scheduler if scheduler is not None else ReminderScheduler(get_reminder_sinks())
+        self.version = 0
+        self._stop = threading.Event()
+
+    def load(self):
+        """Load upcoming reminders through the reminder index"""
+        storage = get_storage()
+        # Read the cursor first; anything written during the load is replayed.
+        # On a fresh install (or with only unversioned legacy events) the
+        # version is still 0, which would make every sync a full snapshot.
+        self.version = storage.seed_change_version()
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        for event in storage.iter_upcoming_reminders(yesterday):
+            self.scheduler.schedule(event)
+        logger.info("Loaded %d pending reminders", len(self.scheduler))
+
+    def sync(self):
+        """Apply calendar changes made since the last sync"""
+        storage = get_storage()
+        after = None
+        while True:
+            changes = storage.get_changes(self.version, settings.CALENDAR_SYNC_PAGE_SIZE, after)
+            if changes['reset'] and after is None:
+                # Our cursor predates compacted tombstones; start over, but
+                # keep track of what was sent so nothing is delivered twice
+                self.scheduler.clear()
+            after = changes.get('after')
+            for event in changes['events']:
+                self.scheduler.schedule(event)
+            for event_id in changes['deleted']:
+                self.scheduler.cancel(event_id)
+            self.version = changes['version']
+            if not changes['has_more']:
+                return
+
+    def run(self):
+        """Deliver reminders until stop() is called"""
+        self.load()
+        poll_interval = settings.REMINDER_POLL_SECONDS
+        next_sync = time.monotonic() + poll_interval
+
+        while not self._stop.is_set():
+            self.scheduler.deliver_due()
+
+            if time.monotonic() >= next_sync:
+                try:
+                    self.sync()
+                except Exception:
+                    logger.exception("Failed to sync reminder changes")
+                next_sync = time.monotonic() + poll_interval
+
+            until_due = self.scheduler.seconds_until_next()
+            until_sync = max(0.0, next_sync - time.monotonic())
+            self.scheduler.wait(until_sync if until_due is None else min(until_due, until_sync))
+
+    def stop(self):
+        self._stop.set()
+        self.scheduler.wake()
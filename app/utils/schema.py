@@ -0,0 +1,180 @@
+"""Declared MongoDB schema: indexes and JSON-schema validators per collection
+
+ensure_schema() makes the database match the declaration without dropping
+anything: missing collections, validators and indexes are created, and
+indexes that exist but differ from the declaration (or are not declared at
+all) are reported as drift for an operator to resolve.
+"""
+import logging
+import threading
+import pymongo
+from django.conf import settings
+from app.utils import mongodb
+
+logger = logging.getLogger(__name__)
+
+# Options that change what an index does; anything else (v, ns, background) is ignored
+_INDEX_OPTIONS = ('unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds', 'weights')
+
+_DATE_PATTERN = r'^\d{4}-\d{2}-\d{2}$'
+_TIME_PATTERN = r'^\d{2}:\d{2}(:\d{2}(\.\d+)?)?$'
+
+CALENDAR_EVENT_VALIDATOR = {
+    '$jsonSchema': {
+        'bsonType': 'object',
+        'required': ['title', 'start_date'],
+        'properties': {
+            'title': {'bsonType': 'string'},
+            'description': {'bsonType': ['string', 'null']},
+            'start_date': {'bsonType': 'string', 'pattern': _DATE_PATTERN},
+            'end_date': {'bsonType': ['string', 'null'], 'pattern': _DATE_PATTERN},
+            'start_time': {'bsonType': ['string', 'null'], 'pattern': _TIME_PATTERN},
+            'end_time': {'bsonType': ['string', 'null'], 'pattern': _TIME_PATTERN},
+            'all_day': {'bsonType': 'bool'},
+            'location': {'bsonType': ['string', 'null']},
+            'priority': {'enum': ['high', 'medium', 'low', None]},
+            'reminder': {'bsonType': 'bool'},
+            'uid': {'bsonType': 'string'},
+            'version': {'bsonType': ['int', 'long']},
+            'updated_at': {'bsonType': 'date'},
+        },
+    }
+}
+
+QUOTE_VALIDATOR = {
+    '$jsonSchema': {
+        'bsonType': 'object',
+        'required': ['text', 'author'],
+        'properties': {
+            'text': {'bsonType': 'string'},
+            'author': {'bsonType': 'string'},
+        },
+    }
+}
+
+USER_PREFERENCE_VALIDATOR = {
+    '$jsonSchema': {
+        'bsonType': 'object',
+        'properties': {
+            'location': {'bsonType': 'string'},
+            'news_category': {'bsonType': 'string'},
+        },
+    }
+}
+
+QUOTE_INDEXES = [
+    # Equality lookups on the quote text (e.g. de-duplicating imports)
+    pymongo.IndexModel([('text', pymongo.HASHED)], name='text_hashed'),
+]
+
+# Shared cache entries and single-flight claims; MongoDB removes them once
+# `expires_at` has passed
+CACHE_INDEXES = [
+    pymongo.IndexModel([('expires_at', pymongo.ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0),
+]
+
+# collection name -> (indexes, validator)
+COLLECTIONS = {
+    'app_calendarevent': (mongodb.CALENDAR_EVENT_INDEXES, CALENDAR_EVENT_VALIDATOR),
+    'app_calendarevent_tombstone': (mongodb.CALENDAR_TOMBSTONE_INDEXES, None),
+    'app_counters': ([], None),
+    'app_quote': (QUOTE_INDEXES, QUOTE_VALIDATOR),
+    'app_userpreference': ([], USER_PREFERENCE_VALIDATOR),
+    'app_cache': (CACHE_INDEXES, None),
+    'app_flights': (CACHE_INDEXES, None),
+    'app_quota': ([], None),
+}
+
+def _index_signature(document):
+    """Comparable form of an index, whether declared or read back from the server"""
+    key = list(document['key'].items())
+    if any(direction == pymongo.TEXT for _, direction in key) or key[0][0] == '_fts':
+        # The server stores text indexes as _fts/_ftsx; compare the weights instead
+        key = 'text'
+    options = {name: document[name] for name in _INDEX_OPTIONS if name in document}
+    if key == 'text':
+        options['weights'] = dict(sorted(options.get('weights', {}).items()))
+    return key, options
+
+def index_drift(collection, declared):
+    """Compare declared IndexModels with what exists on the collection
+
+    Returns (missing IndexModels, [names that differ], [names not declared]).
+    """
+    existing = {info['name']: info for info in collection.list_indexes()}
+    missing, changed = [], []
+    for index in declared:
+        name = index.document['name']
+        if name not in existing:
+            missing.append(index)
+        elif _index_signature(existing[name]) != _index_signature(index.document):
+            changed.append(name)
+    names = {index.document['name'] for index in declared} | {'_id_'}
+    extra = [name for name in existing if name not in names]
+    return missing, changed, extra
+
+def validator_options(validator):
+    """Options for create_collection or collMod that install a validator"""
+    return {
+        'validator': validator,
+        'validationLevel': settings.MONGODB_VALIDATION_LEVEL,
+        'validationAction': settings.MONGODB_VALIDATION_ACTION,
+    }
+
+def ensure_schema(db=None, dry_run=False):
+    """Bring collections, validators and indexes in line with COLLECTIONS
+
+    Safe to run repeatedly: it only creates what is missing and never drops
+    an index. Index builds on MongoDB 4.2+ only lock the collection briefly
+    at the start and end, so reads and writes continue meanwhile.
+
+    Returns a report per collection with the actions taken (or, with
+    `dry_run`, the actions that would be taken) and any drift found.
+    """
+    db = db if db is not None else mongodb.get_mongodb_db()
+    current = {info['name']: info.get('options', {}) for info in db.list_collections()}
+    report = []
+
+    for name, (indexes, validator) in COLLECTIONS.items():
+        entry = {'collection': name, 'actions': [], 'changed': [], 'extra': []}
+        report.append(entry)
+
+        if name not in current:
+            entry['actions'].append('create collection')
+            if not dry_run:
+                db.create_collection(name, **(validator_options(validator) if validator else {}))
+        elif validator and any(
+            current[name].get(option) != value for option, value in validator_options(validator).items()
+        ):
+            entry['actions'].append('update validator')
+            if not dry_run:
+                db.command('collMod', name, **validator_options(validator))
+
+        missing, entry['changed'], entry['extra'] = index_drift(db[name], indexes)
+        for index in missing:
+            entry['actions'].append(f"create index {index.document['name']}")
+        if missing and not dry_run:
+            db[name].create_indexes(missing)
+
+        if not dry_run:
+            # Lazy index checks elsewhere in the process can be skipped now
+            mongodb._ensured_indexes.add(name)
+
+    return report
+
+def ensure_schema_in_background():
+    """Run ensure_schema() without delaying startup; failures are only logged"""
+    def run():
+        try:
+            for entry in ensure_schema():
+                for action in entry['actions']:
+                    logger.info("Schema %s: %s", entry['collection'], action)
+                if entry['changed'] or entry['extra']:
+                    logger.warning(
+                        "Schema drift on %s: changed %s, undeclared %s",
+                        entry['collection'], entry['changed'], entry['extra']
+                    )
+        except Exception:
+            logger.exception("Failed to ensure MongoDB schema")
+
+    threading.Thread(target=run, name='ensure-schema', daemon=True).start()
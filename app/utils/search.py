@@ -0,0 +1,175 @@
+"""Ranked full-text search over calendar events
+
+The backend is chosen with the CALENDAR_SEARCH_BACKEND setting (a dotted
+path). StorageSearchBackend uses the index of the configured event store
+(the MongoDB text index or SQLite FTS5); MongoSearchBackend always queries
+MongoDB; the InvertedIndexSearchBackend keeps an in-process inverted index
+over the event store, kept current through its change feed.
+"""
+import math
+import re
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Same relative weights as the MongoDB text index
+FIELD_WEIGHTS = {'title': 10, 'location': 5, 'description': 1}
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+class InvertedIndex:
+    """Thread-safe inverted index with weighted tf-idf ranking"""
+
+    def __init__(self, field_weights=None):
+        self.field_weights = field_weights or FIELD_WEIGHTS
+        self._postings = defaultdict(dict)  # term -> {doc_id: weighted term frequency}
+        self._doc_terms = {}  # doc_id -> terms, so documents can be removed
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def add(self, doc_id, fields):
+        """Index (or re-index) a document given a dict of field -> text"""
+        weights = defaultdict(int)
+        for field, weight in self.field_weights.items():
+            for term in tokenize(fields.get(field)):
+                weights[term] += weight
+
+        with self._lock:
+            self._remove_unlocked(doc_id)
+            for term, weight in weights.items():
+                self._postings[term][doc_id] = weight
+            self._doc_terms[doc_id] = tuple(weights)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove_unlocked(doc_id)
+
+    def _remove_unlocked(self, doc_id):
+        for term in self._doc_terms.pop(doc_id, ()):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query, offset=0, limit=20):
+        """Return (total matches, [(doc_id, score), ...]) for a page of results
+
+        Like MongoDB $text, a document matches if it contains any query term.
+        Only the postings of the query terms are read.
+        """
+        terms = set(tokenize(query))
+        scores = defaultdict(float)
+        with self._lock:
+            total_docs = len(self._doc_terms) or 1
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + total_docs / len(postings))
+                for doc_id, weight in postings.items():
+                    scores[doc_id] += (1 + math.log(weight)) * idf
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return len(ranked), ranked[offset:offset + limit]
+
+class SearchBackend:
+    """Interface for event search backends"""
+
+    def search(self, query, page=1, page_size=20):
+        """Return {'total': int, 'results': [event dicts with a 'score']}"""
+        raise NotImplementedError
+
+class StorageSearchBackend(SearchBackend):
+    """Search through the configured storage backend's own index"""
+
+    def search(self, query, page=1, page_size=20):
+        from app.utils.storage import get_storage
+        return get_storage().search_events(query, (page - 1) * page_size, page_size)
+
+class MongoSearchBackend(SearchBackend):
+    """Search the MongoDB event collection through its text index"""
+
+    def search(self, query, page=1, page_size=20):
+        from app.utils.mongodb import search_calendar_events_in_mongodb
+        return search_calendar_events_in_mongodb(query, (page - 1) * page_size, page_size)
+
+class InvertedIndexSearchBackend(SearchBackend):
+    """Search the configured event store with an in-process inverted index
+
+    The index is built from a change-feed snapshot on first use. Before each
+    search it applies the changes made since the version it last saw, so
+    writes from every worker process are picked up and searches never scan
+    the store.
+    """
+
+    def __init__(self):
+        self.index = InvertedIndex()
+        self._events = {}  # doc_id -> result fields
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def _catch_up(self):
+        from app.utils.storage import get_storage
+        storage = get_storage()
+        with self._lock:
+            index, events, version, after = self.index, self._events, self._version, None
+            while True:
+                changes = storage.get_changes(version, settings.CALENDAR_SYNC_PAGE_SIZE, after)
+                if changes['reset'] and after is None:
+                    # First load, or our version predates compacted tombstones:
+                    # rebuild aside so searches keep using the current index
+                    index, events = InvertedIndex(), {}
+                after = changes.get('after')
+                for event in changes['events']:
+                    doc_id = str(event['_id'])
+                    index.add(doc_id, event)
+                    events[doc_id] = _search_fields(doc_id, event)
+                for doc_id in changes['deleted']:
+                    index.remove(doc_id)
+                    events.pop(doc_id, None)
+                version = changes['version']
+                if not changes['has_more']:
+                    self.index, self._events, self._version = index, events, version
+                    return
+
+    def search(self, query, page=1, page_size=20):
+        self._catch_up()
+        events = self._events
+        total, hits = self.index.search(query, (page - 1) * page_size, page_size)
+        results = []
+        for doc_id, score in hits:
+            event = events.get(doc_id)
+            if event is not None:
+                results.append(dict(event, score=round(score, 4)))
+        return {'total': total, 'results': results}
+
+def _search_fields(doc_id, event):
+    """The fields of an event returned in search results"""
+    return {
+        'id': doc_id,
+        'title': event.get('title', ''),
+        'description': event.get('description') or '',
+        'location': event.get('location') or '',
+        'start_date': event.get('start_date'),
+        'start_time': event.get('start_time'),
+        'priority': event.get('priority', 'medium'),
+    }
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_search_backend():
+    """Return the configured search backend (one instance per process)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.CALENDAR_SEARCH_BACKEND)()
+    return _backend
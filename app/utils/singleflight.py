@@ -0,0 +1,113 @@
+"""Coalesce identical fetches that are in flight at the same time
+
+    weather = coalesce(f'weather:{location}', lambda: request_weather(location))
+
+Within a process, a caller that arrives while a fetch for the same key is
+running waits for it and gets its result (or its exception) instead of
+making the same upstream request again.
+
+With SINGLEFLIGHT_SHARED, the thread that runs the fetch also claims the key
+in the storage backend, and other worker processes wait for the result it
+publishes there for SINGLEFLIGHT_RESULT_SECONDS. Shared results must
+therefore be JSON/BSON serializable. A claim expires after
+SINGLEFLIGHT_TIMEOUT_SECONDS, so a worker that dies mid-fetch holds the
+others back for at most that long. When the fetch raises, or the storage
+backend is unavailable, waiting processes fetch for themselves.
+"""
+import logging
+import threading
+import time
+import uuid
+from django.conf import settings
+from app.utils import metrics
+from app.utils.storage import get_coordination_store
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    """One fetch in flight in this process"""
+
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+def _record(key, scope):
+    if settings.METRICS_ENABLED:
+        metrics.COALESCED_FETCHES.inc(key.split(':', 1)[0], scope)
+
+def coalesce(key, fetch):
+    """Return fetch(), sharing one call among concurrent callers with the same key"""
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        _record(key, 'process')
+        if not call.done.wait(settings.SINGLEFLIGHT_TIMEOUT_SECONDS):
+            logger.warning("Gave up waiting for in-flight fetch %s", key)
+            return fetch()
+        if call.error is not None:
+            raise call.error
+        return call.value
+
+    try:
+        call.value = _shared(key, fetch) if settings.SINGLEFLIGHT_SHARED else fetch()
+        return call.value
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call.done.set()
+
+def _shared(key, fetch):
+    """Run fetch() once across processes, coordinating through the coordination store"""
+    store = get_coordination_store()
+    owner = uuid.uuid4().hex
+    try:
+        flight = store.begin_flight(key, owner, settings.SINGLEFLIGHT_TIMEOUT_SECONDS)
+    except Exception:
+        logger.warning("Could not claim fetch %s; fetching without coordination", key, exc_info=True)
+        return fetch()
+
+    if flight is not None and flight['owner'] == owner:
+        try:
+            value = fetch()
+        except BaseException:
+            # Let the waiting processes try for themselves
+            _finish(store, key, owner)
+            raise
+        _finish(store, key, owner, value, settings.SINGLEFLIGHT_RESULT_SECONDS)
+        return value
+
+    # Another process is fetching; wait for the result it publishes
+    _record(key, 'shared')
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_TIMEOUT_SECONDS
+    while flight is not None:
+        if flight['done']:
+            return flight['value']
+        if time.monotonic() >= deadline:
+            break
+        time.sleep(settings.SINGLEFLIGHT_POLL_MS / 1000)
+        try:
+            flight = store.get_flight(key)
+        except Exception:
+            logger.warning("Could not read fetch %s from storage", key, exc_info=True)
+            break
+    return fetch()
+
+def _finish(store, key, owner, value=None, keep_seconds=0):
+    try:
+        store.finish_flight(key, owner, value, keep_seconds)
+    except Exception:
+        # Waiting processes fall back to fetching when the claim expires
+        logger.warning("Could not publish fetch %s", key, exc_info=True)
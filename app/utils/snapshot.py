@@ -0,0 +1,205 @@
+"""Last-good dashboard data on disk, served when the live path fails
+
+    weather = snapshot.serve('weather', fetch_weather, is_failure=lambda w: 'error' in w)
+
+Every successful widget payload is kept in memory and in the JSON file at
+DASHBOARD_SNAPSHOT_PATH, replaced atomically (write a temporary file, then
+rename) and merged with what other worker processes wrote, newest per
+widget. A payload is recorded at most once every
+DASHBOARD_SNAPSHOT_MIN_INTERVAL_SECONDS per widget. Widgets whose data
+depends on a setting pass it as `key` (weather and news pass the location),
+so a snapshot is only served for the same key it was recorded under.
+
+With a `deadline`, a fetch still running after that many seconds is left
+to finish in the background (recording its result when it succeeds) and
+the snapshot is served meanwhile; without a snapshot the fetch is awaited.
+
+When fetching fails (an exception or an `is_failure` result), the snapshot
+is served instead. After a failure the live path is skipped for
+DASHBOARD_RETRY_SECONDS and the snapshot served straight away, so an outage
+costs one timeout per interval rather than one per request. Views can find
+out which widgets were served from the snapshot, and how old they are, with
+`with staleness() as stale:`.
+"""
+import contextlib
+import contextvars
+import datetime
+from concurrent import futures
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_entries = None  # widget -> {'saved_at': epoch seconds, 'data': payload}
+_recorded_at = {}  # widget -> monotonic time of the last record()
+_failing_until = {}  # widget -> monotonic time until which the live path is skipped
+_lock = threading.Lock()
+_executor = None  # runs fetches that have a deadline
+
+# Widgets served from the snapshot in this context: widget -> saved datetime
+_stale = contextvars.ContextVar('stale_widgets', default=None)
+
+def _read_file():
+    try:
+        with open(settings.DASHBOARD_SNAPSHOT_PATH) as snapshot_file:
+            entries = json.load(snapshot_file)
+        return entries if isinstance(entries, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def _loaded():
+    global _entries
+    if _entries is None:
+        _entries = _read_file()
+    return _entries
+
+def _write_file(entries):
+    path = settings.DASHBOARD_SNAPSHOT_PATH
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    # Keep whatever other processes saved more recently
+    merged = dict(entries)
+    for widget, entry in _read_file().items():
+        if widget not in merged or entry.get('saved_at', 0) > merged[widget]['saved_at']:
+            merged[widget] = entry
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as output:
+            json.dump(merged, output, default=str)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return merged
+
+def record(widget, data, encode=None):
+    """Save a good payload for `widget` (throttled per widget)"""
+    global _entries
+    now = time.monotonic()
+    with _lock:
+        if now - _recorded_at.get(widget, float('-inf')) < settings.DASHBOARD_SNAPSHOT_MIN_INTERVAL_SECONDS:
+            return
+        _recorded_at[widget] = now
+        entries = dict(_loaded())
+        entries[widget] = {'saved_at': time.time(), 'data': encode(data) if encode else data}
+        try:
+            _entries = _write_file(entries)
+        except (OSError, TypeError, ValueError) as e:
+            _entries = entries
+            logger.warning("Could not write dashboard snapshot: %s", e)
+
+def load(widget, decode=None):
+    """(data, saved datetime) of the last good payload, or None"""
+    with _lock:
+        entry = _loaded().get(widget)
+    if entry is None:
+        return None
+    data = decode(entry['data']) if decode else entry['data']
+    return data, datetime.datetime.fromtimestamp(entry['saved_at'], datetime.timezone.utc)
+
+def _serve_snapshot(widget, entry, decode):
+    try:
+        snapshot = load(entry, decode)
+    except Exception:
+        logger.exception("Unreadable %s snapshot", entry)
+        return None
+    if snapshot is not None:
+        stale = _stale.get()
+        if stale is not None:
+            stale[widget] = snapshot[1]
+    return snapshot
+
+_FAILED = object()
+
+class _Late(Exception):
+    """A fetch ran past its deadline"""
+
+def _succeeded(entry, result, is_failure, encode):
+    """Record `result` if it is good; returns whether it was"""
+    if is_failure and is_failure(result):
+        return False
+    _failing_until.pop(entry, None)
+    record(entry, result, encode)
+    return True
+
+def _fetch_within(entry, fetch, deadline, is_failure, encode):
+    """fetch() in a worker thread; raises _Late if it runs past `deadline`"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = futures.ThreadPoolExecutor(thread_name_prefix='snapshot-fetch')
+    future = _executor.submit(contextvars.copy_context().run, fetch)
+    done, _ = futures.wait([future], timeout=deadline)
+    if future in done:
+        return future.result()
+
+    def finished(future):
+        if future.exception() is None:
+            _succeeded(entry, future.result(), is_failure, encode)
+    future.add_done_callback(finished)
+    raise _Late(f'no answer within {deadline:g} s')
+
+def serve(widget, fetch, is_failure=None, fallback=None, encode=None, decode=None, key=None, deadline=None):
+    """fetch() if it succeeds, else the last good payload, else `fallback()`
+
+    Without a fallback, a failed result is returned as it is when there is
+    no snapshot; an exception from fetch() is re-raised.
+    """
+    entry = widget if key is None else f'{widget}:{key}'
+    if time.monotonic() < _failing_until.get(entry, 0):
+        snapshot = _serve_snapshot(widget, entry, decode)
+        if snapshot is not None:
+            return snapshot[0]
+
+    with _lock:
+        has_snapshot = entry in _loaded()
+    error = None
+    try:
+        if deadline and has_snapshot:
+            result = _fetch_within(entry, fetch, deadline, is_failure, encode)
+        else:
+            result = fetch()
+    except _Late as e:
+        # Slow rather than failing: keep trying the live path on the next request
+        logger.info("Live %s data is slow (%s); serving the snapshot", entry, e)
+        result, error = _FAILED, e
+    except Exception as e:
+        logger.warning("Live %s data failed: %s", entry, e)
+        result, error = _FAILED, e
+    else:
+        if _succeeded(entry, result, is_failure, encode):
+            return result
+
+    if not isinstance(error, _Late):
+        _failing_until[entry] = time.monotonic() + settings.DASHBOARD_RETRY_SECONDS
+    snapshot = _serve_snapshot(widget, entry, decode)
+    if snapshot is not None:
+        return snapshot[0]
+    if fallback is not None:
+        return fallback()
+    if error is not None:
+        raise error
+    return result
+
+@contextlib.contextmanager
+def staleness():
+    """Collect {widget: saved datetime} for widgets served from the snapshot in the block"""
+    stale = {}
+    token = _stale.set(stale)
+    try:
+        yield stale
+    finally:
+        _stale.reset(token)
+
+def reset_snapshot():
+    """Forget the in-memory snapshot and failure state (the file is kept)"""
+    global _entries
+    with _lock:
+        _entries = None
+        _recorded_at.clear()
+        _failing_until.clear()
@@ -0,0 +1,668 @@
+"""Embedded SQLite storage backend
+
+Stores events, quotes and preferences in a single SQLite file opened in WAL
+mode, for mirrors that should not need a MongoDB server. The event table
+mirrors app.models.CalendarEvent plus the sync metadata (uid, version,
+updated_at) the MongoDB documents carry; fields outside those columns are
+kept in a JSON `extra` column. Every read path used by the views is backed
+by an index, and full-text search uses an FTS5 table kept in step by
+triggers. SQLiteCoordinationStore keeps the state worker processes share
+(single-flight claims, request budgets, the shared cache) in the same file.
+"""
+import datetime
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from bson import ObjectId
+from django.conf import settings
+from app.utils.events import LOCAL_UID_PATTERN, normalize_event_dates
+from app.utils.storage import CoordinationStore, EventStore
+
+logger = logging.getLogger(__name__)
+
+# Columns of the event table that map to document fields
+EVENT_COLUMNS = (
+    'uid', 'title', 'description', 'start_date', 'start_time', 'end_date',
+    'end_time', 'all_day', 'location', 'priority', 'reminder',
+)
+BOOLEAN_COLUMNS = ('all_day', 'reminder')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS event (
+    id TEXT PRIMARY KEY,
+    uid TEXT UNIQUE,
+    title TEXT NOT NULL DEFAULT '',
+    description TEXT,
+    start_date TEXT NOT NULL,
+    start_time TEXT,
+    end_date TEXT,
+    end_time TEXT,
+    all_day INTEGER NOT NULL DEFAULT 0,
+    location TEXT,
+    priority TEXT NOT NULL DEFAULT 'medium',
+    reminder INTEGER NOT NULL DEFAULT 0,
+    extra TEXT,
+    version INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS event_version ON event (version);
+CREATE INDEX IF NOT EXISTS event_start ON event (start_date, start_time);
+CREATE INDEX IF NOT EXISTS event_priority_start ON event (priority, start_date, start_time);
+CREATE INDEX IF NOT EXISTS event_reminder_start ON event (start_date) WHERE reminder = 1;
+
+CREATE TABLE IF NOT EXISTS event_tombstone (
+    id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    deleted_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS event_tombstone_version ON event_tombstone (version);
+CREATE INDEX IF NOT EXISTS event_tombstone_deleted_at ON event_tombstone (deleted_at);
+
+CREATE TABLE IF NOT EXISTS counter (
+    name TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL DEFAULT 0,
+    floor INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO counter (name) VALUES ('calendarevent');
+
+CREATE TABLE IF NOT EXISTS quote (
+    id TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    author TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS preference (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS flight (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    value TEXT,
+    expires_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS token_bucket (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS event_fts USING fts5(
+    title, location, description, content='event', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS event_fts_insert AFTER INSERT ON event BEGIN
+    INSERT INTO event_fts (rowid, title, location, description)
+    VALUES (new.rowid, new.title, new.location, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS event_fts_delete AFTER DELETE ON event BEGIN
+    INSERT INTO event_fts (event_fts, rowid, title, location, description)
+    VALUES ('delete', old.rowid, old.title, old.location, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS event_fts_update AFTER UPDATE ON event BEGIN
+    INSERT INTO event_fts (event_fts, rowid, title, location, description)
+    VALUES ('delete', old.rowid, old.title, old.location, old.description);
+    INSERT INTO event_fts (rowid, title, location, description)
+    VALUES (new.rowid, new.title, new.location, new.description);
+END;
+"""
+
+# Same relative weights as the MongoDB text index (title, location, description)
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+class _AbortBatch(Exception):
+    """Raised inside an atomic batch to roll it back"""
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+def _split_fields(event_data):
+    """Split document fields into table columns and the JSON extra column"""
+    columns, extra = {}, {}
+    for field, value in event_data.items():
+        if field in ('_id', 'id', 'version', 'updated_at'):
+            continue
+        if field in EVENT_COLUMNS:
+            columns[field] = int(bool(value)) if field in BOOLEAN_COLUMNS else value
+        else:
+            extra[field] = value
+    return columns, extra
+
+class _SQLiteDatabase:
+    """Per-thread connections to the database file at EVENT_STORAGE_SQLITE_PATH"""
+
+    def __init__(self, path=None):
+        self.path = str(path or settings.EVENT_STORAGE_SQLITE_PATH)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self):
+        """Return this thread's connection, creating the schema on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; write transactions are opened explicitly
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @contextmanager
+    def _write(self):
+        """Run a block in a write transaction (serialized across processes)"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    @contextmanager
+    def _read(self):
+        """Run a block against one consistent snapshot of the database"""
+        conn = self._connection()
+        conn.execute('BEGIN')
+        try:
+            yield conn
+        finally:
+            conn.execute('COMMIT')
+
+class SQLiteEventStore(_SQLiteDatabase, EventStore):
+    """Event, quote and preference storage in an embedded SQLite database"""
+
+    coordination_backend = 'app.utils.sqlite_store.SQLiteCoordinationStore'
+
+    def _next_version(self, conn, count=1):
+        """Reserve `count` versions inside the current write transaction"""
+        conn.execute("UPDATE counter SET seq = seq + ? WHERE name = 'calendarevent'", (count,))
+        return conn.execute("SELECT seq FROM counter WHERE name = 'calendarevent'").fetchone()[0]
+
+    @staticmethod
+    def _row_to_event(row):
+        event = {'_id': row['id']}
+        for column in EVENT_COLUMNS:
+            value = row[column]
+            if column in BOOLEAN_COLUMNS:
+                value = bool(value)
+            elif column == 'uid' and value is None:
+                continue
+            event[column] = value
+        if row['extra']:
+            event.update(json.loads(row['extra']))
+        event['version'] = row['version']
+        event['updated_at'] = row['updated_at']
+        return event
+
+    def _insert(self, conn, event_id, event_data, version, now):
+        columns, extra = _split_fields(normalize_event_dates(dict(event_data)))
+        columns.update({
+            'id': event_id,
+            'extra': json.dumps(extra) if extra else None,
+            'version': version,
+            'updated_at': now,
+        })
+        names = ', '.join(columns)
+        placeholders = ', '.join('?' for _ in columns)
+        conn.execute(f'INSERT INTO event ({names}) VALUES ({placeholders})', tuple(columns.values()))
+
+    def _update(self, conn, event_id, event_data, version, now):
+        """Update an event's fields; returns False if it does not exist"""
+        row = conn.execute('SELECT extra FROM event WHERE id = ?', (event_id,)).fetchone()
+        if row is None:
+            return False
+        columns, extra = _split_fields(normalize_event_dates(dict(event_data)))
+        if extra:
+            merged = json.loads(row['extra']) if row['extra'] else {}
+            merged.update(extra)
+            columns['extra'] = json.dumps(merged)
+        columns.update({'version': version, 'updated_at': now})
+        assignments = ', '.join(f'{name} = ?' for name in columns)
+        conn.execute(f'UPDATE event SET {assignments} WHERE id = ?', (*columns.values(), event_id))
+        return True
+
+    def _delete(self, conn, event_id, version, now):
+        """Delete an event and leave a tombstone; returns False if it does not exist"""
+        if conn.execute('DELETE FROM event WHERE id = ?', (event_id,)).rowcount == 0:
+            return False
+        conn.execute(
+            'INSERT OR REPLACE INTO event_tombstone (id, version, deleted_at) VALUES (?, ?, ?)',
+            (event_id, version, now)
+        )
+        return True
+
+    # Events
+
+    def list_events(self):
+        rows = self._connection().execute('SELECT * FROM event').fetchall()
+        return [self._row_to_event(row) for row in rows]
+
+    def iter_events(self, batch_size=500):
+        cursor = self._connection().execute('SELECT * FROM event ORDER BY id')
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield self._row_to_event(row)
+        finally:
+            cursor.close()
+
+    def _get_event(self, event_id):
+        row = self._connection().execute('SELECT * FROM event WHERE id = ?', (event_id,)).fetchone()
+        return self._row_to_event(row) if row else None
+
+    def save_event(self, event_data):
+        try:
+            event_id = str(ObjectId())
+            with self._write() as conn:
+                self._insert(conn, event_id, event_data, self._next_version(conn), _utcnow())
+            return event_id
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            logger.warning("Error saving calendar event to SQLite: %s", e)
+            return None
+
+    def _update_event(self, event_id, event_data):
+        try:
+            with self._write() as conn:
+                return self._update(conn, event_id, event_data, self._next_version(conn), _utcnow())
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            logger.warning("Error updating calendar event in SQLite: %s", e)
+            return False
+
+    def _delete_event(self, event_id):
+        with self._write() as conn:
+            return self._delete(conn, event_id, self._next_version(conn), _utcnow())
+
+    def apply_batch(self, operations, atomic=False):
+        results = []
+        try:
+            with self._write() as conn:
+                first_version = self._next_version(conn, len(operations)) - len(operations) + 1
+                now = _utcnow()
+                for index, op in enumerate(operations):
+                    version = first_version + index
+                    # Each item gets a savepoint so one failure only undoes itself
+                    conn.execute('SAVEPOINT batch_item')
+                    try:
+                        if op['op'] == 'create':
+                            event_id = str(ObjectId())
+                            self._insert(conn, event_id, op['data'], version, now)
+                            result = {'id': event_id, 'op': 'create', 'status': 'created'}
+                        elif op['op'] == 'update':
+                            found = self._update(conn, op['id'], op['data'], version, now)
+                            result = {'id': op['id'], 'op': 'update', 'status': 'updated' if found else 'not_found'}
+                        else:
+                            found = self._delete(conn, op['id'], version, now)
+                            result = {'id': op['id'], 'op': 'delete', 'status': 'deleted' if found else 'not_found'}
+                        conn.execute('RELEASE batch_item')
+                    except sqlite3.Error as e:
+                        conn.execute('ROLLBACK TO batch_item')
+                        conn.execute('RELEASE batch_item')
+                        result = {'id': op.get('id'), 'op': op['op'], 'status': 'error', 'error': str(e)}
+                    results.append(result)
+
+                if atomic and any(result['status'] in ('not_found', 'error') for result in results):
+                    # Rolls back the whole transaction
+                    raise _AbortBatch()
+        except _AbortBatch:
+            if any(result['status'] == 'not_found' for result in results):
+                return {'applied': False, 'results': results, 'error': 'One or more events were not found'}
+            return {
+                'applied': False,
+                'results': [{'id': op.get('id'), 'op': op['op'], 'status': 'aborted'} for op in operations],
+                'error': 'Batch aborted: one or more operations failed',
+            }
+        return {'applied': True, 'results': results}
+
+    def upsert_events_by_uid(self, events):
+        # The last copy of a repeated UID wins, as it would with sequential writes
+        events = list({event['uid']: event for event in events}.values())
+        if not events:
+            return {'inserted': 0, 'updated': 0}
+
+        inserted = updated = 0
+        with self._write() as conn:
+            first_version = self._next_version(conn, len(events)) - len(events) + 1
+            now = _utcnow()
+            for index, event in enumerate(events):
+                event = dict(event)
+                version = first_version + index
+
+                local = LOCAL_UID_PATTERN.match(event['uid'])
+                if local:
+                    # Our own export: match the original event by id
+                    event.pop('uid')
+                    event_id = local.group(1)
+                    exists = conn.execute('SELECT 1 FROM event WHERE id = ?', (event_id,)).fetchone()
+                else:
+                    row = conn.execute('SELECT id FROM event WHERE uid = ?', (event['uid'],)).fetchone()
+                    event_id = row['id'] if row else str(ObjectId())
+                    exists = row is not None
+
+                if exists:
+                    self._update(conn, event_id, event, version, now)
+                    updated += 1
+                else:
+                    self._insert(conn, event_id, event, version, now)
+                    inserted += 1
+        return {'inserted': inserted, 'updated': updated}
+
+    def get_changes(self, since, limit=500, after=None):
+        # Versions are assigned inside the writing transaction, so a snapshot
+        # never has gaps that a later commit could fill
+        with self._read() as conn:
+            seq, floor = conn.execute(
+                "SELECT seq, floor FROM counter WHERE name = 'calendarevent'"
+            ).fetchone()
+
+            if after is not None or since <= 0 or since < floor:
+                # Later snapshot pages keep the cursor of the first one
+                version = seq if after is None else since
+                rows = conn.execute(
+                    'SELECT * FROM event WHERE id > ? ORDER BY id LIMIT ?', (str(after or ''), limit + 1)
+                ).fetchall()
+                has_more = len(rows) > limit
+                events = [self._row_to_event(row) for row in rows[:limit]]
+                return {
+                    'reset': True,
+                    'version': version,
+                    'events': events,
+                    'deleted': [],
+                    'has_more': has_more,
+                    'after': events[-1]['_id'] if has_more else None,
+                }
+
+            rows = conn.execute(
+                'SELECT * FROM event WHERE version > ? ORDER BY version LIMIT ?', (since, limit + 1)
+            ).fetchall()
+            tombstones = conn.execute(
+                'SELECT id, version FROM event_tombstone WHERE version > ? ORDER BY version LIMIT ?',
+                (since, limit + 1)
+            ).fetchall()
+
+        changes = sorted(
+            [(row['version'], 'event', row) for row in rows]
+            + [(row['version'], 'deleted', row) for row in tombstones],
+            key=lambda change: change[0]
+        )
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        return {
+            'reset': False,
+            'version': changes[-1][0] if has_more else seq,
+            'events': [self._row_to_event(row) for _, kind, row in changes if kind == 'event'],
+            'deleted': [row['id'] for _, kind, row in changes if kind == 'deleted'],
+            'has_more': has_more,
+        }
+
+    def get_change_version(self):
+        row = self._connection().execute("SELECT seq FROM counter WHERE name = 'calendarevent'").fetchone()
+        return row[0]
+
+    def seed_change_version(self):
+        with self._write() as conn:
+            conn.execute("UPDATE counter SET seq = max(seq, 1) WHERE name = 'calendarevent'")
+            return conn.execute("SELECT seq FROM counter WHERE name = 'calendarevent'").fetchone()[0]
+
+    def compact_tombstones(self, older_than):
+        cutoff = older_than.astimezone(datetime.timezone.utc).isoformat()
+        with self._write() as conn:
+            newest = conn.execute(
+                'SELECT max(version) FROM event_tombstone WHERE deleted_at < ?', (cutoff,)
+            ).fetchone()[0]
+            if newest is None:
+                return 0
+            conn.execute(
+                "UPDATE counter SET floor = max(floor, ?) WHERE name = 'calendarevent'", (newest,)
+            )
+            return conn.execute(
+                'DELETE FROM event_tombstone WHERE deleted_at < ? AND version <= ?', (cutoff, newest)
+            ).rowcount
+
+    def events_between(self, start_date, end_date):
+        rows = self._connection().execute(
+            'SELECT * FROM event WHERE start_date BETWEEN ? AND ? ORDER BY start_date, start_time',
+            (start_date.isoformat(), end_date.isoformat())
+        )
+        return [self._row_to_event(row) for row in rows]
+
+    def events_by_priority(self, priority, start_date, end_date):
+        rows = self._connection().execute(
+            'SELECT * FROM event WHERE priority = ? AND start_date BETWEEN ? AND ? '
+            'ORDER BY start_date, start_time',
+            (priority, start_date.isoformat(), end_date.isoformat())
+        )
+        return [self._row_to_event(row) for row in rows]
+
+    def day_summaries(self, start_date, end_date):
+        rows = self._connection().execute(
+            """
+            SELECT start_date, day_count, id, title, start_time, all_day, priority FROM (
+                SELECT *,
+                    COUNT(*) OVER (PARTITION BY start_date) AS day_count,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY start_date
+                        ORDER BY CASE priority WHEN 'high' THEN 0 WHEN 'medium' THEN 1 ELSE 2 END,
+                                 start_time
+                    ) AS position
+                FROM event WHERE start_date BETWEEN ? AND ?
+            ) WHERE position = 1
+            """,
+            (start_date.isoformat(), end_date.isoformat())
+        )
+        return {
+            row['start_date']: {
+                'count': row['day_count'],
+                'top': {
+                    'id': row['id'],
+                    'title': row['title'],
+                    'start_time': row['start_time'],
+                    'all_day': bool(row['all_day']),
+                    'priority': row['priority'],
+                },
+            }
+            for row in rows
+        }
+
+    def iter_upcoming_reminders(self, from_date):
+        cursor = self._connection().execute(
+            'SELECT * FROM event WHERE reminder = 1 AND start_date >= ?', (from_date.isoformat(),)
+        )
+        for row in cursor:
+            yield self._row_to_event(row)
+
+    def search_events(self, query, skip=0, limit=20):
+        # Quote each word so user input is never parsed as FTS5 syntax;
+        # like MongoDB $text, any matching word is enough
+        terms = re.findall(r'\w+', query.lower())
+        if not terms:
+            return {'total': 0, 'results': []}
+        match = ' OR '.join(f'"{term}"' for term in terms)
+
+        conn = self._connection()
+        total = conn.execute('SELECT count(*) FROM event_fts WHERE event_fts MATCH ?', (match,)).fetchone()[0]
+        rows = conn.execute(
+            f"""
+            SELECT event.*, bm25(event_fts, {', '.join(map(str, BM25_WEIGHTS))}) AS rank
+            FROM event_fts JOIN event ON event.rowid = event_fts.rowid
+            WHERE event_fts MATCH ?
+            ORDER BY rank, event.start_date
+            LIMIT ? OFFSET ?
+            """,
+            (match, limit, skip)
+        )
+        results = [{
+            'id': row['id'],
+            'title': row['title'],
+            'description': row['description'] or '',
+            'location': row['location'] or '',
+            'start_date': row['start_date'],
+            'start_time': row['start_time'],
+            'priority': row['priority'],
+            # bm25() is lower for better matches
+            'score': round(-row['rank'], 4),
+        } for row in rows]
+        return {'total': total, 'results': results}
+
+    # Quotes
+
+    def get_quotes(self):
+        rows = self._connection().execute('SELECT id, text, author FROM quote').fetchall()
+        return [{'_id': row['id'], 'text': row['text'], 'author': row['author']} for row in rows]
+
+    def get_random_quote(self):
+        # Seek to a random rowid instead of sorting the whole table
+        row = self._connection().execute(
+            'SELECT id, text, author FROM quote '
+            'WHERE rowid >= (SELECT abs(random()) % max(rowid) + 1 FROM quote) '
+            'ORDER BY rowid LIMIT 1'
+        ).fetchone()
+        if row is None:
+            return None
+        return {'_id': row['id'], 'text': row['text'], 'author': row['author']}
+
+    def save_quotes(self, quotes):
+        ids = [str(ObjectId()) for _ in quotes]
+        with self._write() as conn:
+            conn.executemany(
+                'INSERT INTO quote (id, text, author) VALUES (?, ?, ?)',
+                [(quote_id, quote['text'], quote['author']) for quote_id, quote in zip(ids, quotes)]
+            )
+        return ids
+
+    # Preferences
+
+    def get_preferences(self):
+        row = self._connection().execute('SELECT data FROM preference WHERE id = 1').fetchone()
+        return json.loads(row['data']) if row else None
+
+    def save_preferences(self, preferences):
+        with self._write() as conn:
+            row = conn.execute('SELECT data FROM preference WHERE id = 1').fetchone()
+            merged = json.loads(row['data']) if row else {}
+            merged.update(preferences)
+            conn.execute(
+                'INSERT OR REPLACE INTO preference (id, data) VALUES (1, ?)', (json.dumps(merged),)
+            )
+        return True
+
+    # Health
+
+    def ping(self):
+        self._connection().execute('SELECT 1').fetchone()
+
+class SQLiteCoordinationStore(_SQLiteDatabase, CoordinationStore):
+    """Single-flight claims, request budgets and the shared cache in the SQLite file"""
+
+    @staticmethod
+    def _row_to_flight(row):
+        return {
+            'owner': row['owner'],
+            'done': bool(row['done']),
+            'value': json.loads(row['value']) if row['value'] is not None else None,
+        }
+
+    def begin_flight(self, key, owner, ttl_seconds):
+        now = time.time()
+        with self._write() as conn:
+            row = conn.execute('SELECT * FROM flight WHERE key = ?', (key,)).fetchone()
+            if row is not None and row['expires_at'] > now:
+                return self._row_to_flight(row)
+            # Expired claims are only cleared here, so sweep them while holding the lock
+            conn.execute('DELETE FROM flight WHERE expires_at <= ?', (now,))
+            conn.execute(
+                'INSERT INTO flight (key, owner, done, value, expires_at) VALUES (?, ?, 0, NULL, ?)',
+                (key, owner, now + ttl_seconds)
+            )
+        return {'owner': owner, 'done': False, 'value': None}
+
+    def finish_flight(self, key, owner, value=None, keep_seconds=0):
+        with self._write() as conn:
+            if keep_seconds <= 0:
+                conn.execute('DELETE FROM flight WHERE key = ? AND owner = ?', (key, owner))
+                return
+            conn.execute(
+                'UPDATE flight SET done = 1, value = ?, expires_at = ? WHERE key = ? AND owner = ?',
+                (json.dumps(value), time.time() + keep_seconds, key, owner)
+            )
+
+    def get_flight(self, key):
+        row = self._connection().execute(
+            'SELECT * FROM flight WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return self._row_to_flight(row) if row else None
+
+    # Request budgets
+
+    def take_tokens(self, key, cost, rate, capacity, floor=0):
+        now = time.time()
+        with self._write() as conn:
+            row = conn.execute('SELECT tokens, updated_at FROM token_bucket WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else \
+                min(capacity, row['tokens'] + max(0.0, now - row['updated_at']) * rate)
+            granted = tokens - cost >= floor
+            if granted:
+                tokens -= cost
+            conn.execute(
+                'INSERT OR REPLACE INTO token_bucket (key, tokens, updated_at) VALUES (?, ?, ?)',
+                (key, tokens, now)
+            )
+        return granted
+
+    def set_tokens(self, key, tokens):
+        with self._write() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO token_bucket (key, tokens, updated_at) VALUES (?, ?, ?)',
+                (key, tokens, time.time())
+            )
+
+    # Shared cache
+
+    def cache_get(self, key):
+        row = self._connection().execute(
+            'SELECT data, expires_at FROM cache WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return (bytes(row['data']), row['expires_at']) if row else None
+
+    def cache_set(self, key, data, ttl_seconds):
+        now = time.time()
+        with self._write() as conn:
+            # Nothing else removes expired entries
+            conn.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (key, data, expires_at) VALUES (?, ?, ?)',
+                (key, data, now + ttl_seconds)
+            )
+
+    def cache_delete(self, key):
+        with self._write() as conn:
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
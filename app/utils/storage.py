@@ -0,0 +1,348 @@
+"""Pluggable storage for events, quotes and preferences
+
+EVENT_STORAGE_BACKEND selects the implementation by dotted path:
+MongoEventStore (the default, backed by app.utils.mongodb) or
+app.utils.sqlite_store.SQLiteEventStore, an embedded engine for
+single-device mirrors that do not run a MongoDB server.
+
+The state worker processes coordinate through (single-flight claims,
+request budgets, the shared cache) has its own CoordinationStore interface,
+returned by get_coordination_store(). It uses the event backend's
+companion store unless COORDINATION_STORAGE_BACKEND names another one.
+
+Events are plain dicts shaped like the MongoDB documents: a string `_id`,
+ISO date/time strings and a `version` from the calendar change feed.
+"""
+import abc
+import threading
+from bson import ObjectId
+from django.conf import settings
+from django.utils.module_loading import import_string
+from app.utils import mongodb
+
+def is_valid_event_id(event_id):
+    """Whether `event_id` has the form of an event id (a 24-digit hex ObjectId)"""
+    return ObjectId.is_valid(str(event_id))
+
+class EventStore(abc.ABC):
+    """Interface every storage backend implements
+
+    get_event, update_event and delete_event check the id, so every backend
+    treats a malformed id as a missing event; backends implement the
+    underscored versions, which are only called with valid ids.
+    """
+
+    # Dotted path of the CoordinationStore that goes with this backend
+    coordination_backend = None
+
+    # Events
+
+    @abc.abstractmethod
+    def list_events(self):
+        """Return every event"""
+
+    @abc.abstractmethod
+    def iter_events(self, batch_size=500):
+        """Yield every event without loading them all at once"""
+
+    def get_event(self, event_id):
+        """Return one event, or None if it does not exist"""
+        if not is_valid_event_id(event_id):
+            return None
+        return self._get_event(str(event_id))
+
+    @abc.abstractmethod
+    def _get_event(self, event_id):
+        """get_event for a valid id"""
+
+    @abc.abstractmethod
+    def save_event(self, event_data):
+        """Insert an event and return its id, or None on failure"""
+
+    def update_event(self, event_id, event_data):
+        """Update an event's fields; returns whether it existed"""
+        if not is_valid_event_id(event_id):
+            return False
+        return self._update_event(str(event_id), event_data)
+
+    @abc.abstractmethod
+    def _update_event(self, event_id, event_data):
+        """update_event for a valid id"""
+
+    def delete_event(self, event_id):
+        """Delete an event, leaving a tombstone; returns whether it existed"""
+        if not is_valid_event_id(event_id):
+            return False
+        return self._delete_event(str(event_id))
+
+    @abc.abstractmethod
+    def _delete_event(self, event_id):
+        """delete_event for a valid id"""
+
+    @abc.abstractmethod
+    def apply_batch(self, operations, atomic=False):
+        """Apply validated create/update/delete operations
+
+        Returns {'applied': bool, 'results': [...]} plus 'error' when rejected.
+        """
+
+    @abc.abstractmethod
+    def upsert_events_by_uid(self, events):
+        """Insert or replace events keyed by iCalendar UID; returns counts"""
+
+    @abc.abstractmethod
+    def get_changes(self, since, limit=500, after=None):
+        """Return events and tombstones changed after version `since`
+
+        Snapshots (`reset`) are paged by event id: while `has_more` is set,
+        call again with the returned `version` and `after`.
+        """
+
+    @abc.abstractmethod
+    def get_change_version(self):
+        """Return the latest issued change version"""
+
+    @abc.abstractmethod
+    def seed_change_version(self):
+        """Make the change version at least 1 and return it (0 means "send a snapshot")"""
+
+    @abc.abstractmethod
+    def compact_tombstones(self, older_than):
+        """Remove tombstones older than `older_than`; returns how many"""
+
+    @abc.abstractmethod
+    def events_between(self, start_date, end_date):
+        """Events starting in a date range, sorted by start"""
+
+    @abc.abstractmethod
+    def events_by_priority(self, priority, start_date, end_date):
+        """Events of one priority in a date range, sorted by start"""
+
+    @abc.abstractmethod
+    def day_summaries(self, start_date, end_date):
+        """Per-day {'count', 'top'} keyed by ISO date for a date range"""
+
+    @abc.abstractmethod
+    def iter_upcoming_reminders(self, from_date):
+        """Yield events with a reminder starting on or after `from_date`"""
+
+    @abc.abstractmethod
+    def search_events(self, query, skip=0, limit=20):
+        """Ranked full-text search; returns {'total', 'results'}"""
+
+    # Quotes
+
+    @abc.abstractmethod
+    def get_quotes(self):
+        """Return every quote"""
+
+    @abc.abstractmethod
+    def get_random_quote(self):
+        """Return one random quote, or None if there are none"""
+
+    @abc.abstractmethod
+    def save_quotes(self, quotes):
+        """Insert a list of {'text', 'author'} dicts; returns their ids"""
+
+    # Preferences
+
+    @abc.abstractmethod
+    def get_preferences(self):
+        """Return the saved preferences, or None if none were saved"""
+
+    @abc.abstractmethod
+    def save_preferences(self, preferences):
+        """Merge the given fields into the saved preferences"""
+
+    # Health
+
+    @abc.abstractmethod
+    def ping(self):
+        """Make one cheap round trip to the backend; raises if it is unavailable"""
+
+class CoordinationStore(abc.ABC):
+    """Short-lived state shared by the worker processes
+
+    Single-flight claims, request budgets and the shared cache.
+
+    Kept apart from EventStore so it can live in a different backend from
+    the events (see COORDINATION_STORAGE_BACKEND).
+    """
+
+    # Single-flight
+
+    @abc.abstractmethod
+    def begin_flight(self, key, owner, ttl_seconds):
+        """Claim the single-flight for `key` for `ttl_seconds`
+
+        Returns the current flight ({'owner', 'done', 'value'}): the caller
+        holds it when 'owner' is theirs. An expired flight is taken over.
+        Returns None if the flight disappeared while it was being read.
+        """
+
+    @abc.abstractmethod
+    def finish_flight(self, key, owner, value=None, keep_seconds=0):
+        """Publish the result of a held flight for `keep_seconds`; 0 releases it"""
+
+    @abc.abstractmethod
+    def get_flight(self, key):
+        """Return the unexpired flight for `key`, or None"""
+
+    # Request budgets
+
+    @abc.abstractmethod
+    def take_tokens(self, key, cost, rate, capacity, floor=0):
+        """Atomically take `cost` tokens from the bucket `key` if `floor` would remain
+
+        The bucket first refills at `rate` tokens per second up to `capacity`;
+        a new bucket starts full. Returns whether the tokens were taken.
+        """
+
+    @abc.abstractmethod
+    def set_tokens(self, key, tokens):
+        """Set the bucket's balance, which may be negative, as of now"""
+
+    # Shared cache
+
+    @abc.abstractmethod
+    def cache_get(self, key):
+        """Return (data, expires at as a Unix time) for an unexpired entry, or None"""
+
+    @abc.abstractmethod
+    def cache_set(self, key, data, ttl_seconds):
+        """Store bytes under `key` for `ttl_seconds`"""
+
+    @abc.abstractmethod
+    def cache_delete(self, key):
+        """Remove the entry for `key`, if any"""
+
+class MongoEventStore(EventStore):
+    """Storage backed by the MongoDB helpers in app.utils.mongodb"""
+
+    coordination_backend = 'app.utils.storage.MongoCoordinationStore'
+
+    def list_events(self):
+        return mongodb.get_calendar_events_from_mongodb()
+
+    def iter_events(self, batch_size=500):
+        return mongodb.iter_calendar_events_from_mongodb(batch_size)
+
+    def _get_event(self, event_id):
+        return mongodb.get_calendar_event_by_id(event_id)
+
+    def save_event(self, event_data):
+        return mongodb.save_calendar_event_to_mongodb(event_data)
+
+    def _update_event(self, event_id, event_data):
+        return mongodb.update_calendar_event_in_mongodb(event_id, event_data)
+
+    def _delete_event(self, event_id):
+        return mongodb.delete_calendar_event_from_mongodb(event_id)
+
+    def apply_batch(self, operations, atomic=False):
+        return mongodb.apply_calendar_event_batch(operations, atomic)
+
+    def upsert_events_by_uid(self, events):
+        return mongodb.upsert_calendar_events_by_uid(events)
+
+    def get_changes(self, since, limit=500, after=None):
+        return mongodb.get_calendar_changes_from_mongodb(since, limit, after)
+
+    def get_change_version(self):
+        return mongodb.get_calendar_change_version()
+
+    def seed_change_version(self):
+        return mongodb.seed_calendar_change_version()
+
+    def compact_tombstones(self, older_than):
+        return mongodb.compact_calendar_tombstones(older_than)
+
+    def events_between(self, start_date, end_date):
+        return mongodb.get_calendar_events_between_from_mongodb(start_date, end_date)
+
+    def events_by_priority(self, priority, start_date, end_date):
+        return mongodb.get_calendar_events_by_priority_from_mongodb(priority, start_date, end_date)
+
+    def day_summaries(self, start_date, end_date):
+        return mongodb.get_calendar_day_summaries_from_mongodb(start_date, end_date)
+
+    def iter_upcoming_reminders(self, from_date):
+        return mongodb.iter_upcoming_reminder_events_from_mongodb(from_date)
+
+    def search_events(self, query, skip=0, limit=20):
+        return mongodb.search_calendar_events_in_mongodb(query, skip, limit)
+
+    def get_quotes(self):
+        return mongodb.get_quotes_from_mongodb()
+
+    def get_random_quote(self):
+        return mongodb.get_random_quote_from_mongodb()
+
+    def save_quotes(self, quotes):
+        return mongodb.save_quotes_to_mongodb(quotes)
+
+    def get_preferences(self):
+        return mongodb.get_user_preferences_from_mongodb()
+
+    def save_preferences(self, preferences):
+        return mongodb.save_user_preferences_to_mongodb(preferences)
+
+    def ping(self):
+        mongodb.ping_mongodb()
+
+class MongoCoordinationStore(CoordinationStore):
+    """Coordination state in the app_flights, app_quota and app_cache collections"""
+
+    def begin_flight(self, key, owner, ttl_seconds):
+        return mongodb.begin_flight_in_mongodb(key, owner, ttl_seconds)
+
+    def finish_flight(self, key, owner, value=None, keep_seconds=0):
+        mongodb.finish_flight_in_mongodb(key, owner, value, keep_seconds)
+
+    def get_flight(self, key):
+        return mongodb.get_flight_from_mongodb(key)
+
+    def take_tokens(self, key, cost, rate, capacity, floor=0):
+        return mongodb.take_tokens_in_mongodb(key, cost, rate, capacity, floor)
+
+    def set_tokens(self, key, tokens):
+        mongodb.set_tokens_in_mongodb(key, tokens)
+
+    def cache_get(self, key):
+        return mongodb.get_cache_entry_from_mongodb(key)
+
+    def cache_set(self, key, data, ttl_seconds):
+        mongodb.save_cache_entry_to_mongodb(key, data, ttl_seconds)
+
+    def cache_delete(self, key):
+        mongodb.delete_cache_entry_from_mongodb(key)
+
+_storage = None
+_coordination = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Return the configured storage backend (one instance per process)"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = import_string(settings.EVENT_STORAGE_BACKEND)()
+    return _storage
+
+def get_coordination_store():
+    """Return the configured coordination store (one instance per process)"""
+    global _coordination
+    if _coordination is None:
+        path = settings.COORDINATION_STORAGE_BACKEND or get_storage().coordination_backend
+        with _storage_lock:
+            if _coordination is None:
+                _coordination = import_string(path)()
+    return _coordination
+
+def reset_storage():
+    """Forget the storage instances so the next calls rebuild them"""
+    global _storage, _coordination
+    with _storage_lock:
+        _storage = None
+        _coordination = None
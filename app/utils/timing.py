@@ -0,0 +1,200 @@
+"""Lightweight spans for timing dashboard widgets and database helpers
+
+    @timed('weather')
+    def get_weather(): ...
+
+    with span('render'):
+        ...
+
+Spans are measured inside a request handled by ServerTimingMiddleware while
+REQUEST_TIMING_ENABLED is on, and whenever a span observer (the metrics
+exporter) is registered. The middleware reports them in a
+`Server-Timing` response header and folds them into per-span histograms kept
+in this process (see get_span_histograms). When timing is disabled the
+middleware removes itself at startup and a span costs one context variable
+lookup.
+"""
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+# Histogram bucket upper bounds in milliseconds
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Spans of the request being handled in this context, or None when not timing
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+# Callables given (span name, seconds) for every span, e.g. the metrics exporter
+_observers = []
+
+def add_span_observer(observer):
+    """Have `observer(name, seconds)` called for every span, in or out of a request"""
+    if observer not in _observers:
+        _observers.append(observer)
+
+def _finish(spans, name, seconds):
+    if spans is not None:
+        spans.append((name, seconds))
+    for observer in _observers:
+        observer(name, seconds)
+
+class _Span:
+    __slots__ = ('name', 'spans', 'started')
+
+    def __init__(self, name, spans):
+        self.name = name
+        self.spans = spans
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _finish(self.spans, self.name, time.perf_counter() - self.started)
+        return False
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def span(name):
+    """Context manager timing a block as `name` within the current request"""
+    spans = _request_spans.get()
+    if spans is None and not _observers:
+        return _NO_SPAN
+    return _Span(name, spans)
+
+def timed(name=None):
+    """Decorator timing every call of a function as a span
+
+    The default name is `<module>.<function>`, e.g. `mongodb.get_quotes_from_mongodb`.
+    """
+    def decorator(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            spans = _request_spans.get()
+            if spans is None and not _observers:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _finish(spans, span_name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+class Histogram:
+    """Fixed-bucket latency histogram (milliseconds)"""
+
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, milliseconds):
+        self.counts[bisect.bisect_left(BUCKETS_MS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return BUCKETS_MS[index] if index < len(BUCKETS_MS) else float('inf')
+        return float('inf')
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum_ms': round(self.total, 3),
+            'buckets': dict(zip([*BUCKETS_MS, float('inf')], self.counts)),
+            'p50_ms': self.quantile(0.50),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+        }
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+def observe(name, milliseconds):
+    """Add one measurement to the in-process histogram for `name`"""
+    with _histograms_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(milliseconds)
+
+def get_span_histograms():
+    """Snapshot of every span histogram recorded by this process"""
+    with _histograms_lock:
+        return {name: histogram.snapshot() for name, histogram in _histograms.items()}
+
+def reset_span_histograms():
+    with _histograms_lock:
+        _histograms.clear()
+
+def _header_token(name):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+
+class ServerTimingMiddleware:
+    """Time each request's spans and report them in a Server-Timing header
+
+    Repeated spans (e.g. several MongoDB helpers of the same name) are summed
+    into one entry whose description gives the call count. The whole request
+    is reported as `total`, and recorded in the histograms as `view.<name>`.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        spans = []
+        token = _request_spans.set(spans)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_spans.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        durations, calls = {}, {}
+        for name, seconds in spans:
+            durations[name] = durations.get(name, 0.0) + seconds * 1000
+            calls[name] = calls.get(name, 0) + 1
+
+        entries = []
+        for name, milliseconds in durations.items():
+            observe(name, milliseconds)
+            entry = f'{_header_token(name)};dur={milliseconds:.1f}'
+            if calls[name] > 1:
+                entry += f';desc="{calls[name]} calls"'
+            entries.append(entry)
+        entries.append(f'total;dur={total_ms:.1f}')
+
+        match = getattr(request, 'resolver_match', None)
+        observe(f"view.{match.url_name if match and match.url_name else 'unresolved'}", total_ms)
+
+        response['Server-Timing'] = ', '.join(entries)
+        return response
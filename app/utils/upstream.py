@@ -0,0 +1,51 @@
+"""Calls to the third-party APIs behind the dashboard widgets
+
+Every request goes through get(), which times it as a span and records it in
+the upstream metrics under a short API name such as 'openweather.weather'.
+It is also charged to the provider's request budget (see app.utils.quota).
+API keys travel in the query string, so they are redacted from the messages
+of the exceptions get() raises.
+"""
+import re
+import time
+import requests
+from django.conf import settings
+from app.utils import metrics, quota
+from app.utils.timing import span
+
+class QuotaExceeded(requests.RequestException):
+    """The provider's request budget is spent, so the API was not called"""
+
+# Query parameters that carry API keys
+_SECRET_PARAMETERS = re.compile(r'((?:appid|apikey|api_key)=)[^&\s\'"]+', re.IGNORECASE)
+
+def redact(text):
+    """Hide API keys in a URL, or in a message that contains one"""
+    return _SECRET_PARAMETERS.sub(r'\1REDACTED', text)
+
+def get(api, url, timeout=10):
+    """requests.get() with quota, latency and status accounting; exceptions propagate
+
+    Raises QuotaExceeded instead of calling the API when its budget is spent.
+    """
+    status = 'error'
+    started = time.perf_counter()
+    try:
+        if not quota.acquire(api):
+            status = 'throttled'
+            raise QuotaExceeded(f'Request budget for {api} is spent')
+        try:
+            with span(f'upstream.{api}'):
+                response = requests.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            # Same exception type, without the URL (and its key) in the message
+            # or in the chained urllib3 errors
+            raise type(e)(redact(str(e))) from None
+        status = str(response.status_code)
+        if response.status_code == 429:
+            quota.throttle(api, response.headers.get('Retry-After'))
+        return response
+    finally:
+        if settings.METRICS_ENABLED:
+            metrics.UPSTREAM_REQUESTS.inc(api, status)
+            metrics.UPSTREAM_LATENCY.observe(time.perf_counter() - started, api)
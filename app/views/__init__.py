@@ -0,0 +1,6 @@
+"""Views, one module per feature
+
+Modules are imported by app.urls. Heavy optional integrations (the Google
+client libraries) are imported inside the functions that use them, so they
+cost nothing at worker start; see the import_report command.
+"""
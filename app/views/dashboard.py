@@ -0,0 +1,560 @@
+"""Dashboard pages and the widgets they are built from"""
+import datetime
+import logging
+import os
+import random
+from datetime import timedelta
+from django.conf import settings
+from django.shortcuts import render
+from app.utils import singleflight, snapshot, upstream
+from app.utils.cache import TTLCache
+from app.utils.events import Event, event_from_document
+from app.utils.storage import get_storage
+from app.utils.timing import span, timed
+
+logger = logging.getLogger(__name__)
+
+# Widget data is shared by every request for a while instead of being
+# fetched again each time (see the *_CACHE_SECONDS settings); upstream data
+# is shared with the other worker processes too
+_preferences_cache = TTLCache('preferences', 'PREFERENCES_CACHE_SECONDS', maxsize=1)
+_weather_cache = TTLCache('weather', 'WEATHER_CACHE_SECONDS', shared=True)
+_news_cache = TTLCache('news', 'NEWS_CACHE_SECONDS', shared=True)
+_quote_cache = TTLCache('quote', 'QUOTE_CACHE_SECONDS', maxsize=1)
+
+def index(request):
+    # Get all the data for the dashboard, noting widgets served from the snapshot
+    with snapshot.staleness() as stale:
+        weather_data = get_weather()
+        news_data = get_news()  # This will now get news specific to the location
+        datetime_data = get_datetime()
+        quote_data = get_quote()
+        calendar_data = get_calendar_events()
+    
+    # Ensure news is a list
+    if not isinstance(news_data, list):
+        news_data = get_default_news()
+    
+    context = {
+        'weather': weather_data,
+        'news': news_data,
+        'datetime': datetime_data,
+        'quote': quote_data,
+        'calendar': calendar_data,
+        'stale': stale,
+    }
+    with span('render'):
+        return render(request, 'app/index.html', context)
+
+def calendar_view(request):
+    """View for displaying calendar events"""
+    # Get all the data for the dashboard, noting widgets served from the snapshot
+    with snapshot.staleness() as stale:
+        weather_data = get_weather()
+        news_data = get_news()
+        datetime_data = get_datetime()
+        quote_data = get_quote()
+        
+        # Get calendar events
+        calendar_data = get_calendar_events()
+    logger.debug("Dashboard calendar has %d events", len(calendar_data['events']))
+    
+    # Ensure news is a list
+    if not isinstance(news_data, list):
+        news_data = get_default_news()
+    
+    context = {
+        'weather': weather_data,
+        'news': news_data,
+        'datetime': datetime_data,
+        'quote': quote_data,
+        'calendar': calendar_data,
+        'stale': stale,
+    }
+    with span('render'):
+        return render(request, 'app/calendar.html', context)
+
+def get_preferences():
+    """The saved preferences, creating the defaults on first use"""
+    preferences = _preferences_cache.get('preferences')
+    if preferences is None:
+        storage = get_storage()
+        preferences = storage.get_preferences()
+        if not preferences:
+            # Create default preference if none exists
+            preferences = {"location": "New York", "news_category": "general"}
+            storage.save_preferences(preferences)
+            logger.info("Created default user preference with location: New York")
+        _preferences_cache.set('preferences', preferences)
+    return preferences
+
+def forget_preferences():
+    """Drop this process's cached preferences after they were changed
+
+    Other workers keep theirs for up to PREFERENCES_CACHE_SECONDS.
+    """
+    _preferences_cache.delete('preferences')
+
+@timed('weather')
+def get_weather():
+    """Current weather and forecast, from the snapshot while the API is failing or slow"""
+    try:
+        location = get_preferences().get('location', 'New York')
+    except Exception as e:
+        logger.warning("Weather API error: %s", e)
+        return get_default_weather_data("Unknown")
+    return snapshot.serve('weather', lambda: _fetch_weather(location), is_failure=lambda weather: 'error' in weather,
+                          key=location, deadline=settings.DASHBOARD_LIVE_DEADLINE_SECONDS)
+
+def _fetch_weather(location):
+    weather = _weather_cache.get(location)
+    if weather is not None:
+        return weather
+
+    def load():
+        weather = _request_weather(location)
+        # Only good data is cached, so a failing API is retried on the next request
+        if 'error' not in weather:
+            _weather_cache.set(location, weather)
+        return weather
+
+    # Concurrent requests for one location share a single set of API calls
+    return singleflight.coalesce(f'weather:{location}', load)
+
+def _request_weather(location):
+    """Current weather and forecast from the OpenWeather API"""
+    try:
+        logger.debug("Getting weather for location: %s", location)
+        
+        api_key = os.environ.get('OPENWEATHER_API_KEY')
+        
+        # Check if API key is available
+        if not api_key:
+            logger.warning("No OpenWeather API key found in environment variables")
+            return get_default_weather_data(location)
+        
+        # Get current weather data
+        current_url = f"{settings.OPENWEATHER_API_BASE}/data/2.5/weather?q={location}&appid={api_key}&units=metric"
+        
+        current_response = upstream.get('openweather.weather', current_url)
+        
+        # Check if the response is successful
+        if current_response.status_code != 200:
+            logger.warning("Weather API error for location %r: HTTP %s", location, current_response.status_code)
+            logger.debug("Weather API response: %.500s", current_response.text)
+            return get_default_weather_data(location)
+        
+        # Parse the response
+        current_data = current_response.json()
+        
+        
+        # Verify that the response contains the expected data
+        if 'coord' not in current_data:
+            logger.warning("Missing 'coord' in weather API response for %r", location)
+            return get_default_weather_data(location)
+        
+        # Get coordinates for forecast
+        lat = current_data['coord']['lat']
+        lon = current_data['coord']['lon']
+        
+        # Get forecast data using OneCall API
+        forecast_url = f"{settings.OPENWEATHER_API_BASE}/data/2.5/onecall?lat={lat}&lon={lon}&exclude=minutely,hourly&appid={api_key}&units=metric"
+        forecast_response = upstream.get('openweather.onecall', forecast_url)
+        
+        # Check if forecast response is successful
+        if forecast_response.status_code != 200:
+            logger.warning("Forecast API error: HTTP %s", forecast_response.status_code)
+            logger.debug("Forecast API response: %.500s", forecast_response.text)
+            
+            # Create empty forecast if API fails
+            forecast_data = {'daily': []}
+        else:
+            forecast_data = forecast_response.json()
+        
+        # Current weather
+        current = {
+            'temp': round(current_data['main']['temp']),
+            'feels_like': round(current_data['main']['feels_like']),
+            'humidity': current_data['main']['humidity'],
+            'wind_speed': round(current_data['wind']['speed']),
+            'wind_direction': get_wind_direction(current_data['wind']['deg']),
+            'condition': current_data['weather'][0]['main'],
+            'description': current_data['weather'][0]['description'],
+            'icon': current_data['weather'][0]['icon'],
+            'pressure': current_data['main']['pressure'],
+            'visibility': current_data.get('visibility', 0) / 1000,  # Convert to km
+            'rain': current_data.get('rain', {}).get('1h', 0),  # Rain in last hour, if available
+            'clouds': current_data['clouds']['all'],  # Cloud coverage percentage
+            'sunrise': datetime.datetime.fromtimestamp(current_data['sys']['sunrise']).strftime('%H:%M'),
+            'sunset': datetime.datetime.fromtimestamp(current_data['sys']['sunset']).strftime('%H:%M'),
+        }
+        
+        # 10-day forecast (actually 8 days including today, as that's the max from the free API)
+        forecast = []
+        daily_data = forecast_data.get('daily', [])
+        
+        if not daily_data and 'list' in forecast_data:
+            # Handle case where we might get a different format
+            daily_data = forecast_data['list']
+        
+        for i in range(min(10, len(daily_data))):
+            day_data = daily_data[i]
+            
+            # Handle different API response formats
+            if 'temp' in day_data and isinstance(day_data['temp'], dict):
+                # OneCall API format
+                temp_max = round(day_data['temp']['max'])
+                temp_min = round(day_data['temp']['min'])
+            elif 'main' in day_data:
+                # 5-day forecast API format
+                temp_max = round(day_data['main']['temp_max'])
+                temp_min = round(day_data['main']['temp_min'])
+            else:
+                # Default values if format is unknown
+                temp_max = 0
+                temp_min = 0
+            
+            # Get timestamp
+            timestamp = day_data.get('dt')
+            date_str = datetime.datetime.fromtimestamp(timestamp).strftime('%a, %b %d')
+            
+            # Get weather condition
+            weather = day_data.get('weather', [{}])[0]
+            
+            day = {
+                'date': date_str,
+                'temp_max': temp_max,
+                'temp_min': temp_min,
+                'condition': weather.get('main', 'Unknown'),
+                'description': weather.get('description', 'No description available'),
+                'icon': weather.get('icon', '01d'),
+                'humidity': day_data.get('humidity', 0),
+                'wind_speed': round(day_data.get('wind_speed', 0)),
+                'wind_direction': get_wind_direction(day_data.get('wind_deg', 0)),
+                'rain': day_data.get('rain', 0),  # Rain in mm, if available
+                'clouds': day_data.get('clouds', 0),  # Cloud coverage percentage
+                'pop': int(day_data.get('pop', 0) * 100),  # Probability of precipitation (%)
+            }
+            forecast.append(day)
+        
+        weather = {
+            'current': current, 
+            'forecast': forecast, 
+            'location': current_data['name'],
+            'country': current_data['sys']['country']
+        }
+        return weather
+    except KeyError as e:
+        logger.warning("Weather API response is missing %s", e)
+        return get_default_weather_data("Unknown")
+    except Exception as e:
+        logger.warning("Weather API error: %s", e)
+        return get_default_weather_data("Unknown")
+
+def get_default_weather_data(location):
+    """Return default weather data when API fails"""
+    return {
+        'error': "Could not fetch weather data",
+        'current': {
+            'temp': 20,
+            'feels_like': 20,
+            'humidity': 50,
+            'wind_speed': 5,
+            'wind_direction': 'N/A',
+            'condition': 'Clouds',
+            'description': 'Weather data unavailable',
+            'icon': '01d',  # Default icon
+            'pressure': 1013,
+            'visibility': 10,
+            'rain': 0,
+            'clouds': 0,
+            'sunrise': '06:00',
+            'sunset': '18:00',
+        },
+        'forecast': [
+            {
+                'date': 'Today',
+                'temp_max': 22,
+                'temp_min': 18,
+                'condition': 'Clouds',
+                'description': 'Weather data unavailable',
+                'icon': '01d',
+                'humidity': 50,
+                'wind_speed': 5,
+                'wind_direction': 'N',
+                'rain': 0,
+                'clouds': 0,
+                'pop': 0,
+            }
+        ],
+        'location': location,
+        'country': 'N/A'
+    }
+
+def get_wind_direction(degrees):
+    """Convert wind direction in degrees to cardinal direction"""
+    directions = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
+    index = round(degrees / (360 / len(directions))) % len(directions)
+    return directions[index]
+
+@timed('news')
+def get_news():
+    """Headlines for the location, from the snapshot while the API is failing or slow"""
+    try:
+        location = get_preferences().get('location', 'New York')
+    except Exception as e:
+        logger.warning("News API error: %s", e)
+        return get_default_news()
+    return snapshot.serve('news', lambda: _fetch_news(location), is_failure=lambda articles: articles is None,
+                          fallback=get_default_news, key=location,
+                          deadline=settings.DASHBOARD_LIVE_DEADLINE_SECONDS)
+
+def _fetch_news(location):
+    """Articles for the location, or None if none could be fetched"""
+    articles = _news_cache.get(location)
+    if articles is not None:
+        return articles
+
+    def load():
+        articles = _request_news(location)
+        if articles is not None:
+            _news_cache.set(location, articles)
+        return articles
+
+    # Concurrent requests for one location share a single set of API calls
+    return singleflight.coalesce(f'news:{location}', load)
+
+def _request_news(location):
+    """Articles from the News API, or None if it could not provide any"""
+    try:
+        logger.debug("Getting news for location: %s", location)
+            
+        api_key = os.environ.get('NEWS_API_KEY')
+        
+        # Check if API key is available
+        if not api_key:
+            logger.warning("No News API key found in environment variables")
+            return None
+            
+        
+        # Try to get news by exact location name first
+        url = f"{settings.NEWS_API_BASE}/v2/everything?q=\"{location}\"&sortBy=publishedAt&language=en&apiKey={api_key}"
+        
+        response = upstream.get('newsapi.everything', url)
+        
+        
+        if response.status_code != 200:
+            logger.warning("News API error: HTTP %s", response.status_code)
+            logger.debug("API response: %.500s", response.text)
+            return None
+            
+        data = response.json()
+        
+        logger.debug("News API found %s results for %r", data.get('totalResults', 0), location)
+        
+        # If no articles found with exact location, try without quotes
+        if data.get('totalResults', 0) == 0:
+            logger.debug("No news found for exact location %r, trying broader search", location)
+            
+            # Try with location without quotes (broader search)
+            url = f"{settings.NEWS_API_BASE}/v2/everything?q={location}&sortBy=publishedAt&language=en&apiKey={api_key}"
+            response = upstream.get('newsapi.everything', url)
+            
+            if response.status_code != 200:
+                logger.warning("Broader location news API error: HTTP %s", response.status_code)
+                return None
+                
+            data = response.json()
+            logger.debug("News API found %s results in a broader search", data.get('totalResults', 0))
+            
+            # If still no articles, try with top headlines
+            if data.get('totalResults', 0) == 0:
+                logger.debug("No location-specific news found, trying top headlines")
+                url = f"{settings.NEWS_API_BASE}/v2/top-headlines?country=us&apiKey={api_key}"
+                response = upstream.get('newsapi.top_headlines', url)
+                
+                if response.status_code != 200:
+                    logger.warning("Top headlines API error: HTTP %s", response.status_code)
+                    return None
+                    
+                data = response.json()
+                logger.debug("News API found %s top headlines", data.get('totalResults', 0))
+        
+        articles = []
+        for article in data.get('articles', [])[:5]:  # Get top 5 headlines
+            # Skip articles without required fields
+            if not article.get('title') or not article.get('source', {}).get('name'):
+                continue
+                
+            # Ensure URL is present
+            if not article.get('url'):
+                continue
+                
+            # Clean up description
+            description = article.get('description', '')
+            if description:
+                # Limit description length
+                description = description[:150] + '...' if len(description) > 150 else description
+            
+            articles.append({
+                'title': article['title'],
+                'source': article['source']['name'],
+                'url': article['url'],
+                'publishedAt': article.get('publishedAt', ''),
+                'description': description
+            })
+        
+        # If we still have no articles, return default news
+        if not articles:
+            logger.warning("No valid articles found in News API response")
+            return None
+            
+        return articles
+    except Exception as e:
+        logger.warning("News API error: %s", e)
+        return None
+
+def get_default_news():
+    """Return default news when API fails"""
+    return [
+        {
+            'title': 'Unable to fetch news for your location',
+            'source': 'System Message',
+            'url': 'https://newsapi.org',
+            'publishedAt': datetime.datetime.now().strftime('%Y-%m-%d'),
+            'description': 'We could not retrieve location-specific news at this time. Please try updating your location or check back later.'
+        },
+        {
+            'title': 'How to get the most from your smart mirror',
+            'source': 'User Guide',
+            'url': 'https://example.com/smart-mirror-guide',
+            'publishedAt': datetime.datetime.now().strftime('%Y-%m-%d'),
+            'description': 'Explore all the features of your virtual smart mirror including weather forecasts, calendar integration, and personalized settings.'
+        }
+    ]
+
+def get_datetime():
+    now = datetime.datetime.now()
+    return {
+        'date': now.strftime('%A, %B %d, %Y'),
+        'time': now.strftime('%H:%M')
+    }
+
+def get_fallback_quote():
+    return {
+        "text": "The best way to predict the future is to invent it.",
+        "author": "Alan Kay"
+    }
+
+@timed('quote')
+def get_quote():
+    """Get a random quote from storage"""
+    return snapshot.serve('quote', _fetch_quote, is_failure=lambda quote: quote is None,
+                          fallback=get_fallback_quote)
+
+def _fetch_quote():
+    try:
+        # The same quote is shown for QUOTE_CACHE_SECONDS
+        quote = _quote_cache.get('quote')
+        if quote is not None:
+            return quote
+
+        # Pick one quote in the database rather than loading them all
+        storage = get_storage()
+        quote = storage.get_random_quote()
+        
+        # If no quotes found, add default quotes
+        if not quote:
+            default_quotes = [
+                {"text": "Be yourself; everyone else is already taken.", "author": "Oscar Wilde"},
+                {"text": "The only way to do great work is to love what you do.", "author": "Steve Jobs"},
+                {"text": "Life is what happens when you're busy making other plans.", "author": "John Lennon"},
+                {"text": "The future belongs to those who believe in the beauty of their dreams.", "author": "Eleanor Roosevelt"},
+                {"text": "Stay hungry, stay foolish.", "author": "Stewart Brand"}
+            ]
+            
+            # Insert default quotes into storage
+            storage.save_quotes(default_quotes)
+            quote = random.choice(default_quotes)
+            
+        _quote_cache.set('quote', quote)
+        return quote
+    except Exception as e:
+        logger.warning("Error getting quote from storage: %s", e)
+        return None
+
+@timed('calendar')
+def get_calendar_events():
+    """Get upcoming calendar events from storage"""
+    return snapshot.serve(
+        'calendar', _fetch_calendar_events,
+        is_failure=lambda calendar_data: calendar_data is None,
+        fallback=lambda: {'events': []},
+        # Events are kept in the snapshot as storage documents
+        encode=lambda calendar_data: {'events': [
+            dict(event.as_document(), _id=event.id, version=event.version) for event in calendar_data['events']
+        ]},
+        decode=lambda data: {'events': [event_from_document(doc) for doc in data['events']]},
+    )
+
+def _fetch_calendar_events():
+    try:
+        # Get today's date
+        today = datetime.date.today()
+        first_day = today - timedelta(days=1)
+        next_month = today + timedelta(days=30)
+        
+        # Only the events in the window are read, through the start date index
+        docs = get_storage().events_between(first_day, next_month)
+        
+        # Dates are parsed once per event version, not on every request
+        events = []
+        for doc in docs:
+            try:
+                events.append(event_from_document(doc))
+            except (KeyError, ValueError, TypeError) as e:
+                logger.warning("Skipping event %s with invalid dates: %s", doc.get('_id'), e)
+        
+        # Sort events by date, all-day events first, then by time
+        events.sort(key=lambda event: event.sort_key)
+        
+        return {'events': events}
+    except Exception:
+        logger.exception("Error fetching calendar events")
+        return None
+
+@timed('calendar')
+def get_calendar_events_by_priority(priority, days=30):
+    """Get upcoming calendar events filtered by priority
+
+    Storage errors are raised, so callers can tell an outage from an empty agenda.
+    """
+    today = datetime.date.today()
+    
+    # Filtered and sorted by (start date, start time) in the database
+    docs = get_storage().events_by_priority(
+        priority,
+        today - timedelta(days=1),
+        today + timedelta(days=days)
+    )
+    
+    events = []
+    for doc in docs:
+        try:
+            events.append(event_from_document(doc))
+        except (KeyError, ValueError, TypeError) as e:
+            logger.warning("Skipping event %s with invalid dates: %s", doc.get('_id'), e)
+    
+    return {'events': events}
+
+def format_event_date(event):
+    """Format the event date for display"""
+    if not isinstance(event, Event):
+        event = Event.from_model(event)
+    return event.long_date
+
+def format_event_time(event):
+    """Format the event time for display"""
+    if not isinstance(event, Event):
+        event = Event.from_model(event)
+    return event.time_range
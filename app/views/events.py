@@ -0,0 +1,384 @@
+"""Calendar event APIs: editing, batches, .ics import/export, agenda, grid, search and sync"""
+import calendar
+import datetime
+import json
+import logging
+from datetime import timedelta
+from bson import ObjectId
+from django.conf import settings
+from django.contrib import messages
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.views.decorators.http import require_POST
+from app.utils.ics import iter_ics_batches, iter_ics_calendar
+from app.utils.search import get_search_backend
+from app.utils.storage import get_storage
+from app.views.dashboard import get_calendar_events_by_priority
+
+logger = logging.getLogger(__name__)
+
+# Fields a client may set on a calendar event through the JSON APIs
+EVENT_FIELDS = {
+    'title': str,
+    'description': str,
+    'start_date': str,
+    'start_time': (str, type(None)),
+    'end_date': (str, type(None)),
+    'end_time': (str, type(None)),
+    'all_day': bool,
+    'location': str,
+    'priority': str,
+    'reminder': bool,
+}
+EVENT_PRIORITIES = ('low', 'medium', 'high')
+BATCH_OPERATIONS = ('create', 'update', 'delete')
+
+# Add these new views for event management
+def get_event(request, event_id):
+    """API endpoint to get event details"""
+    try:
+        event = get_storage().get_event(event_id)
+        if not event:
+            return JsonResponse({'error': 'Event not found'}, status=404)
+            
+        # Stored strings are returned as they are, so the edit form gets back
+        # what it saved
+        return JsonResponse({
+            'id': event['_id'],
+            'title': event['title'],
+            'description': event.get('description', ''),
+            'start_date': event['start_date'],
+            'start_time': event.get('start_time', None),
+            'end_date': event.get('end_date', None),
+            'end_time': event.get('end_time', None),
+            'all_day': event.get('all_day', False),
+            'location': event.get('location', ''),
+            'priority': event.get('priority', 'medium'),
+            'reminder': event.get('reminder', False),
+        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@require_POST
+def save_event(request):
+    """Save a new event or update an existing one"""
+    try:
+        event_id = request.POST.get('event_id', '')
+        redirect_to = request.POST.get('redirect_to', 'index')
+        
+        logger.debug("Saving event with ID %r (empty means new event)", event_id)
+        
+        # Collect event data from form
+        event_data = {
+            'title': request.POST.get('title'),
+            'description': request.POST.get('description', ''),
+            'start_date': request.POST.get('start_date'),
+            'all_day': 'all_day' in request.POST,
+            'location': request.POST.get('location', ''),
+            'priority': request.POST.get('priority', 'medium'),
+            'reminder': 'reminder' in request.POST,
+        }
+        
+        # Handle time fields if not all-day event
+        if not event_data['all_day']:
+            event_data['start_time'] = request.POST.get('start_time') or None
+            event_data['end_date'] = request.POST.get('end_date') or None
+            event_data['end_time'] = request.POST.get('end_time') or None
+        else:
+            event_data['start_time'] = None
+            event_data['end_time'] = None
+        
+        
+        if event_id and event_id.strip():  # Check if event_id is not empty
+            # Validate ObjectId format
+            if not ObjectId.is_valid(event_id):
+                error_msg = f'Invalid event ID format: {event_id}'
+                logger.warning("Invalid event ID format: %r", event_id)
+                messages.error(request, error_msg)
+                return redirect(redirect_to)
+                
+            # Update existing event
+            success = get_storage().update_event(event_id, event_data)
+            logger.debug("Updated event %s: %s", event_id, success)
+            if success:
+                messages.success(request, 'Event updated successfully')
+            else:
+                messages.error(request, 'Failed to update event')
+        else:
+            # Create new event
+            new_id = get_storage().save_event(event_data)
+            logger.debug("Created event %s", new_id)
+            if new_id:
+                messages.success(request, 'Event added successfully')
+            else:
+                messages.error(request, 'Failed to add event')
+    except Exception as e:
+        error_msg = f'Error saving event: {str(e)}'
+        logger.exception("Error saving event")
+        messages.error(request, error_msg)
+    
+    # Redirect to the appropriate page
+    if redirect_to == 'calendar':
+        return redirect('/calendar-events/')
+    return redirect('/')
+
+@require_POST
+def delete_event(request, event_id):
+    """Delete an event"""
+    try:
+        success = get_storage().delete_event(event_id)
+        if success:
+            return JsonResponse({'success': True})
+        else:
+            return JsonResponse({'success': False, 'error': 'Event not found'}, status=404)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+def validate_event_operation(op):
+    """Return a list of problems with one batch operation (empty if valid)"""
+    if not isinstance(op, dict):
+        return ['Operation must be an object']
+    if op.get('op') not in BATCH_OPERATIONS:
+        return [f"op must be one of {', '.join(BATCH_OPERATIONS)}"]
+    
+    errors = []
+    if op['op'] != 'create' and not ObjectId.is_valid(str(op.get('id', ''))):
+        errors.append(f"Invalid event ID format: {op.get('id')}")
+    if op['op'] == 'delete':
+        return errors
+    
+    data = op.get('data')
+    if not isinstance(data, dict) or not data:
+        return errors + ['data must be a non-empty object']
+    if op['op'] == 'create':
+        for field in ('title', 'start_date'):
+            if not data.get(field):
+                errors.append(f'{field} is required')
+    
+    for field, value in data.items():
+        if field not in EVENT_FIELDS:
+            errors.append(f'Unknown field: {field}')
+        elif not isinstance(value, EVENT_FIELDS[field]):
+            errors.append(f'Invalid type for {field}')
+        elif field.endswith('_date') and value:
+            try:
+                datetime.date.fromisoformat(value)
+            except ValueError:
+                errors.append(f'{field} must be an ISO date (YYYY-MM-DD)')
+        elif field.endswith('_time') and value:
+            try:
+                datetime.time.fromisoformat(value)
+            except ValueError:
+                errors.append(f'{field} must be an ISO time (HH:MM)')
+        elif field == 'priority' and value not in EVENT_PRIORITIES:
+            errors.append(f"priority must be one of {', '.join(EVENT_PRIORITIES)}")
+    return errors
+
+@require_POST
+def batch_events(request):
+    """Create, update and delete many events in one request
+    
+    Expects a JSON body like {"operations": [{"op": "create", "data": {...}},
+    {"op": "update", "id": "...", "data": {...}}, {"op": "delete", "id": "..."}],
+    "atomic": false}. The whole payload is validated before anything is written.
+    """
+    try:
+        payload = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Request body must be JSON'}, status=400)
+    
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return JsonResponse({'error': 'operations must be a non-empty list'}, status=400)
+    if len(operations) > settings.CALENDAR_BATCH_MAX_OPERATIONS:
+        return JsonResponse({
+            'error': f'At most {settings.CALENDAR_BATCH_MAX_OPERATIONS} operations per batch'
+        }, status=400)
+    
+    atomic = payload.get('atomic', settings.CALENDAR_BATCH_ATOMIC)
+    if not isinstance(atomic, bool):
+        return JsonResponse({'error': 'atomic must be a boolean'}, status=400)
+    
+    # Validate everything up front so a bad item never leaves a half-applied batch
+    errors = {}
+    seen = set()
+    for index, op in enumerate(operations):
+        problems = validate_event_operation(op)
+        if not problems and op['op'] != 'create':
+            # Two operations on one event would race inside the unordered bulk write
+            if op['id'] in seen:
+                problems = ['id appears more than once in the batch']
+            seen.add(op['id'])
+        if problems:
+            errors[index] = problems
+    if errors:
+        return JsonResponse({'error': 'Invalid operations', 'errors': errors}, status=400)
+    
+    try:
+        outcome = get_storage().apply_batch(operations, atomic=atomic)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse(outcome, status=200 if outcome['applied'] else 409)
+
+def export_calendar_ics(request):
+    """Stream every calendar event as an iCalendar file"""
+    response = StreamingHttpResponse(
+        iter_ics_calendar(get_storage().iter_events()),
+        content_type='text/calendar; charset=utf-8'
+    )
+    response['Content-Disposition'] = 'attachment; filename="calendar.ics"'
+    return response
+
+@require_POST
+def import_calendar_ics(request):
+    """Import an uploaded .ics file, upserting events by UID"""
+    ics_file = request.FILES.get('file')
+    if not ics_file:
+        return JsonResponse({'error': 'Missing .ics file upload'}, status=400)
+    
+    inserted = updated = 0
+    try:
+        # Uploaded files are iterated line by line (large ones live on disk)
+        for batch in iter_ics_batches(ics_file, settings.CALENDAR_IMPORT_BATCH_SIZE):
+            counts = get_storage().upsert_events_by_uid(batch)
+            inserted += counts['inserted']
+            updated += counts['updated']
+    except Exception as e:
+        return JsonResponse({
+            'error': str(e),
+            'inserted': inserted,
+            'updated': updated,
+        }, status=500)
+    
+    return JsonResponse({'inserted': inserted, 'updated': updated})
+
+def get_priority_agenda(request):
+    """API endpoint listing upcoming events of one priority in start order"""
+    priority = request.GET.get('priority', 'high')
+    if priority not in EVENT_PRIORITIES:
+        return JsonResponse({
+            'error': f"priority must be one of {', '.join(EVENT_PRIORITIES)}"
+        }, status=400)
+    
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        return JsonResponse({'error': 'days must be an integer'}, status=400)
+    days = max(0, min(days, settings.CALENDAR_AGENDA_MAX_DAYS))
+    
+    try:
+        calendar_data = get_calendar_events_by_priority(priority, days)
+    except Exception:
+        logger.exception("Error fetching calendar events by priority")
+        return JsonResponse({'error': 'Calendar storage is unavailable'}, status=503)
+    return JsonResponse({
+        'priority': priority,
+        'days': days,
+        'events': [event.as_display_dict() for event in calendar_data['events']],
+    })
+
+def get_calendar_grid(request):
+    """API endpoint returning a month or week grid of per-day event summaries
+    
+    ?view=month&year=YYYY&month=M returns full weeks covering the month;
+    ?view=week&date=YYYY-MM-DD returns the week containing that date.
+    Counts come from a single database aggregation for the whole range.
+    """
+    view = request.GET.get('view', 'month')
+    today = datetime.date.today()
+    month_calendar = calendar.Calendar(firstweekday=settings.CALENDAR_FIRST_WEEKDAY)
+    
+    try:
+        if view == 'month':
+            year = int(request.GET.get('year', today.year))
+            month = int(request.GET.get('month', today.month))
+            weeks = month_calendar.monthdatescalendar(year, month)
+        elif view == 'week':
+            day = datetime.date.fromisoformat(request.GET.get('date', today.isoformat()))
+            offset = (day.weekday() - settings.CALENDAR_FIRST_WEEKDAY) % 7
+            week_start = day - timedelta(days=offset)
+            weeks = [[week_start + timedelta(days=i) for i in range(7)]]
+            month = None
+        else:
+            return JsonResponse({'error': 'view must be month or week'}, status=400)
+    except (ValueError, OverflowError) as e:
+        # Weeks running past date.min or date.max overflow
+        return JsonResponse({'error': f'Invalid date: {e}'}, status=400)
+    
+    try:
+        summaries = get_storage().day_summaries(weeks[0][0], weeks[-1][-1])
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    
+    grid = []
+    for week in weeks:
+        row = []
+        for day in week:
+            summary = summaries.get(day.isoformat(), {})
+            row.append({
+                'date': day.isoformat(),
+                'in_month': month is None or day.month == month,
+                'is_today': day == today,
+                'count': summary.get('count', 0),
+                'top_event': summary.get('top'),
+            })
+        grid.append(row)
+    
+    return JsonResponse({
+        'view': view,
+        'start': weeks[0][0].isoformat(),
+        'end': weeks[-1][-1].isoformat(),
+        'weeks': grid,
+    })
+
+def search_events(request):
+    """API endpoint for ranked, paginated full-text search over events"""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'Missing search query'}, status=400)
+    
+    try:
+        page = int(request.GET.get('page', 1))
+        page_size = int(request.GET.get('page_size', 20))
+    except ValueError:
+        return JsonResponse({'error': 'page and page_size must be integers'}, status=400)
+    
+    if page < 1 or page_size < 1:
+        return JsonResponse({'error': 'page and page_size must be positive'}, status=400)
+    page_size = min(page_size, settings.CALENDAR_SEARCH_MAX_PAGE_SIZE)
+    
+    try:
+        found = get_search_backend().search(query, page, page_size)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({
+        'query': query,
+        'page': page,
+        'page_size': page_size,
+        'total': found['total'],
+        'results': found['results'],
+    })
+
+def get_event_changes(request):
+    """API endpoint returning calendar changes since a client's last sync"""
+    try:
+        since = int(request.GET.get('since', 0))
+        limit = int(request.GET.get('limit', settings.CALENDAR_SYNC_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'since and limit must be integers'}, status=400)
+    
+    if since < 0 or limit <= 0:
+        return JsonResponse({'error': 'since must be >= 0 and limit > 0'}, status=400)
+    
+    # Continues a paged snapshot from the last event id of the previous page
+    after = request.GET.get('after') or None
+    if after is not None and not ObjectId.is_valid(after):
+        return JsonResponse({'error': 'after must be an event id'}, status=400)
+    
+    try:
+        limit = min(limit, settings.CALENDAR_SYNC_PAGE_SIZE)
+        return JsonResponse(get_storage().get_changes(since, limit, after))
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
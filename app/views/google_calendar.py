@@ -0,0 +1,93 @@
+"""Events from Google Calendar, read with a service account"""
+import datetime
+import logging
+import os
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+def get_google_calendar_events():
+    """Get events from Google Calendar API"""
+    try:
+        # Path to your service account credentials JSON file
+        SERVICE_ACCOUNT_FILE = os.path.join(settings.BASE_DIR, 'credentials.json')
+        
+        # Check if credentials file exists
+        if not os.path.exists(SERVICE_ACCOUNT_FILE):
+            return []
+            
+        # The Google client libraries are slow to import, so only load them when used
+        from google.oauth2 import service_account
+        from googleapiclient.discovery import build
+
+        # Set up credentials
+        SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
+        credentials = service_account.Credentials.from_service_account_file(
+            SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+            
+        # Build the service
+        service = build('calendar', 'v3', credentials=credentials)
+        
+        # Get calendar ID from environment or use primary
+        calendar_id = os.environ.get('GOOGLE_CALENDAR_ID', 'primary')
+        
+        # Call the Calendar API
+        now = datetime.datetime.utcnow().isoformat() + 'Z'  # 'Z' indicates UTC time
+        events_result = service.events().list(
+            calendarId=calendar_id,
+            timeMin=now,
+            maxResults=10,
+            singleEvents=True,
+            orderBy='startTime'
+        ).execute()
+        
+        google_events = events_result.get('items', [])
+        
+        # Format events for display
+        formatted_events = []
+        today = datetime.date.today()
+        tomorrow = today + datetime.timedelta(days=1)
+        
+        for event in google_events:
+            start = event['start'].get('dateTime', event['start'].get('date'))
+            
+            # Parse the date/time
+            if 'T' in start:  # This is a dateTime
+                start_dt = datetime.datetime.fromisoformat(start.replace('Z', '+00:00'))
+                event_date = start_dt.date()
+                event_time = start_dt.time()
+                all_day = False
+            else:  # This is a date (all-day event)
+                event_date = datetime.date.fromisoformat(start)
+                event_time = None
+                all_day = True
+            
+            # Format date string
+            if event_date == today:
+                date_str = "Today"
+            elif event_date == tomorrow:
+                date_str = "Tomorrow"
+            else:
+                date_str = event_date.strftime('%B %d')
+            
+            # Format time string
+            if all_day:
+                time_str = "All day"
+            elif event_time:
+                time_str = event_time.strftime('%I:%M %p')
+            else:
+                time_str = None
+            
+            formatted_events.append({
+                'title': event.get('summary', 'Untitled Event'),
+                'date': date_str,
+                'time': time_str,
+                'description': event.get('description', ''),
+                'is_today': event_date == today,
+                'sort_date': event_date,  # For sorting
+            })
+        
+        return formatted_events
+    except Exception as e:
+        logger.warning("Error fetching Google Calendar events: %s", e)
+    return []
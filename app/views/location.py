@@ -0,0 +1,145 @@
+"""Choosing the dashboard location"""
+import logging
+import math
+import os
+import requests
+from django.conf import settings
+from django.contrib import messages
+from django.http import JsonResponse
+from django.shortcuts import redirect
+from django.views.decorators.http import require_POST
+from app.utils import singleflight, upstream
+from app.utils.cache import TTLCache
+from app.utils.storage import get_storage
+from app.views.dashboard import forget_preferences
+
+logger = logging.getLogger(__name__)
+
+# Place names for coordinates rarely change, so every worker shares them for a day
+_geocoding_cache = TTLCache('geocoding', 'GEOCODING_CACHE_SECONDS', shared=True)
+
+# Coordinates are rounded to about 1 km before lookup, so nearby positions
+# share one cache entry and one API call
+COORDINATE_DECIMALS = 2
+
+def _parse_coordinate(value, limit):
+    """A finite float within +/-limit, rounded to COORDINATE_DECIMALS, or None"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(number) or abs(number) > limit:
+        return None
+    return round(number, COORDINATE_DECIMALS)
+
+@require_POST
+def update_location(request):
+    """Update the user's preferred location"""
+    location = request.POST.get('location')
+    if location:
+        # Verify the location is valid by checking with the weather API
+        api_key = os.environ.get('OPENWEATHER_API_KEY')
+        url = f"{settings.OPENWEATHER_API_BASE}/data/2.5/weather?q={location}&appid={api_key}&units=metric"
+        
+        try:
+            response = upstream.get('openweather.weather', url)
+            
+            
+            if response.status_code == 200:
+                data = response.json()
+                
+                if 'coord' in data:
+                    # Location is valid, update preferences in storage
+                    if get_storage().save_preferences({'location': location}):
+                        forget_preferences()
+                        logger.info("Updated location to %s", location)
+                        messages.success(request, f'Location updated to {location}')
+                    else:
+                        logger.error("Failed to save location preference")
+                        messages.error(request, f'Failed to save location preference')
+                else:
+                    # Response is OK but missing expected data
+                    logger.warning("Missing 'coord' in location API response for %r", location)
+                    messages.error(request, f'Invalid location data received for "{location}"')
+            else:
+                # Location not found or invalid response
+                try:
+                    data = response.json()
+                    error_msg = data.get('message', 'Unknown error')
+                except:
+                    error_msg = f"HTTP {response.status_code}"
+                
+                logger.info("Location %r not found: %s", location, error_msg)
+                messages.error(request, f'Location "{location}" not found. Error: {error_msg}')
+        except requests.exceptions.Timeout:
+            logger.warning("Timeout when checking location %r", location)
+            messages.error(request, f'Request timed out when checking location "{location}"')
+        except requests.exceptions.RequestException as e:
+            logger.warning("Request error when checking location %r: %s", location, e)
+            messages.error(request, f'Network error when checking location "{location}"')
+        except Exception as e:
+            logger.exception("Error updating location to %r", location)
+            messages.error(request, f'Error updating location: {str(e)}')
+    else:
+        messages.error(request, 'Please enter a valid location')
+        
+    return redirect('index')
+
+def get_location_by_coords(request):
+    """Get location name from coordinates using reverse geocoding"""
+    try:
+        lat = request.GET.get('lat')
+        lon = request.GET.get('lon')
+        
+        if not lat or not lon:
+            return JsonResponse({'error': 'Missing coordinates'}, status=400)
+        
+        lat, lon = _parse_coordinate(lat, 90), _parse_coordinate(lon, 180)
+        if lat is None or lon is None:
+            return JsonResponse({'error': 'lat and lon must be numbers within range'}, status=400)
+        
+        key = f'{lat:.{COORDINATE_DECIMALS}f},{lon:.{COORDINATE_DECIMALS}f}'
+        result = _geocoding_cache.get(key)
+        if result is None:
+            # Concurrent lookups of the same coordinates share one API call
+            result = singleflight.coalesce(f'geocoding:{key}', lambda: _reverse_geocode(key, lat, lon))
+        return JsonResponse(result['data'], status=result['status'])
+    except upstream.QuotaExceeded:
+        return JsonResponse({'error': 'Location lookup is temporarily unavailable'}, status=503)
+    except Exception:
+        logger.exception("Error in reverse geocoding")
+        return JsonResponse({'error': 'Could not look up the location'}, status=500)
+
+def _reverse_geocode(key, lat, lon):
+    """Look up a location name; returns {'status', 'data'} for the JSON response"""
+    api_key = os.environ.get('OPENWEATHER_API_KEY')
+    
+    logger.debug("Reverse geocoding for coordinates: %s, %s", lat, lon)
+    
+    # Use OpenWeatherMap's reverse geocoding API
+    url = f"{settings.OPENWEATHER_GEO_API_BASE}/geo/1.0/reverse?lat={lat}&lon={lon}&limit=1&appid={api_key}"
+    response = upstream.get('openweather.geocoding', url)
+    
+    # Check if the response is successful
+    if response.status_code != 200:
+        logger.warning("Reverse geocoding API error: HTTP %s", response.status_code)
+        logger.debug("API response: %.500s", response.text)
+        return {'status': 500, 'data': {'error': f'API returned status code {response.status_code}'}}
+        
+    data = response.json()
+    
+    # Check if data is valid and contains location information
+    if not data or len(data) == 0:
+        logger.info("Empty response from reverse geocoding API")
+        return {'status': 404, 'data': {'error': 'Location not found'}}
+        
+    location = data[0].get('name')
+    if not location:
+        logger.debug("No location name in reverse geocoding response, using state or country")
+        # Try to use the state or country name if city name is not available
+        location = data[0].get('state', data[0].get('country', 'Unknown location'))
+        
+    logger.debug("Location found: %s", location)
+    result = {'status': 200, 'data': {'location': location}}
+    _geocoding_cache.set(key, result)
+    return result
@@ -0,0 +1,21 @@
+"""Operational endpoints"""
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.cache import never_cache
+from app.utils.health import readiness
+from app.utils.metrics import render_metrics
+
+def metrics(request):
+    """Prometheus scrape endpoint, aggregated over every worker process"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@never_cache
+def healthz(request):
+    """Liveness probe: the process is up; touches nothing else"""
+    return JsonResponse({'status': 'ok'})
+
+@never_cache
+def readyz(request):
+    """Readiness probe: warmed up and the storage backend answers (cached pings)"""
+    ready, checks = readiness()
+    return JsonResponse({'status': 'ready' if ready else 'unavailable', 'checks': checks},
+                        status=200 if ready else 503)
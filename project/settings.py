@@ -33,11 +33,17 @@ INSTALLED_APPS = [
 
 # Add the MIDDLEWARE setting
 MIDDLEWARE = [
+    # First, so the Server-Timing total covers the other middleware too
+    'app.utils.timing.ServerTimingMiddleware',
+    'app.utils.metrics.MetricsMiddleware',
+    'app.utils.query_log.QueryAccountingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # After authentication, so it can tell whether the user is staff
+    'app.utils.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -81,6 +87,152 @@ MONGODB_NAME = os.environ.get('MONGODB_NAME', 'vsm_db')
 MONGODB_USERNAME = os.environ.get('MONGODB_USERNAME', '')
 MONGODB_PASSWORD = os.environ.get('MONGODB_PASSWORD', '')
 MONGODB_AUTH_SOURCE = os.environ.get('MONGODB_AUTH_SOURCE', 'admin')
+# Create missing collections, validators and indexes when the app starts
+# (the same work as the ensure_schema command, run in the background)
+MONGODB_ENSURE_SCHEMA_ON_STARTUP = os.environ.get('MONGODB_ENSURE_SCHEMA_ON_STARTUP', 'False') == 'True'
+# 'moderate' leaves existing documents that break the validator editable
+MONGODB_VALIDATION_LEVEL = os.environ.get('MONGODB_VALIDATION_LEVEL', 'moderate')
+MONGODB_VALIDATION_ACTION = os.environ.get('MONGODB_VALIDATION_ACTION', 'error')
+# How long a command waits for a reachable server before failing
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000))
+# Count MongoDB commands and database time per request (X-MongoDB-* headers
+# when DEBUG is on) and log commands slower than MONGODB_SLOW_MS
+MONGODB_QUERY_ACCOUNTING = os.environ.get('MONGODB_QUERY_ACCOUNTING', 'True') == 'True'
+MONGODB_SLOW_MS = int(os.environ.get('MONGODB_SLOW_MS', 100))
+
+# Per-request span timing: adds a Server-Timing header to every response and
+# keeps per-span latency histograms (no overhead when off)
+REQUEST_TIMING_ENABLED = os.environ.get('REQUEST_TIMING_ENABLED', 'False') == 'True'
+
+# Prometheus metrics served at /metrics
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+# Shared directory for aggregating metrics across the workers of a
+# pre-forking server (one per host; empty it when the server starts)
+METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR') or None
+# How often each worker writes its metrics to that directory
+METRICS_FLUSH_SECONDS = int(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+
+# On-demand profiling of single requests with ?profile=cprofile|sample
+# (staff users, or clients sending X-Profile-Token: PROFILING_TOKEN)
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+PROFILING_DIR = os.environ.get('PROFILING_DIR', str(BASE_DIR / 'profiles'))
+PROFILING_SAMPLE_INTERVAL_MS = int(os.environ.get('PROFILING_SAMPLE_INTERVAL_MS', 5))
+# Older profile files in PROFILING_DIR are deleted beyond this many
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', 200))
+# Low-rate background sampling of every thread, written to PROFILING_DIR periodically
+PROFILING_CONTINUOUS = os.environ.get('PROFILING_CONTINUOUS', 'False') == 'True'
+PROFILING_CONTINUOUS_INTERVAL_MS = int(os.environ.get('PROFILING_CONTINUOUS_INTERVAL_MS', 100))
+PROFILING_CONTINUOUS_PERIOD_SECONDS = int(os.environ.get('PROFILING_CONTINUOUS_PERIOD_SECONDS', 60))
+
+# Upstream API locations (overridden to point at local fakes when benchmarking)
+OPENWEATHER_API_BASE = os.environ.get('OPENWEATHER_API_BASE', 'https://api.openweathermap.org')
+OPENWEATHER_GEO_API_BASE = os.environ.get('OPENWEATHER_GEO_API_BASE', 'http://api.openweathermap.org')
+NEWS_API_BASE = os.environ.get('NEWS_API_BASE', 'https://newsapi.org')
+
+# Storage for events, quotes and preferences:
+# 'app.utils.storage.MongoEventStore' or 'app.utils.sqlite_store.SQLiteEventStore'
+EVENT_STORAGE_BACKEND = os.environ.get('EVENT_STORAGE_BACKEND', 'app.utils.storage.MongoEventStore')
+# Database file used by the SQLite backend
+EVENT_STORAGE_SQLITE_PATH = os.environ.get('EVENT_STORAGE_SQLITE_PATH', str(BASE_DIR / 'events.sqlite3'))
+# Storage for single-flight claims, request budgets and the shared cache
+# (a CoordinationStore); empty uses the event backend's companion store
+COORDINATION_STORAGE_BACKEND = os.environ.get('COORDINATION_STORAGE_BACKEND') or None
+
+# Dashboard widget caches, in seconds (0 disables a cache). Preferences are
+# cached per process, so other workers see a changed location after at most
+# PREFERENCES_CACHE_SECONDS; keep it short
+PREFERENCES_CACHE_SECONDS = int(os.environ.get('PREFERENCES_CACHE_SECONDS', 2))
+WEATHER_CACHE_SECONDS = int(os.environ.get('WEATHER_CACHE_SECONDS', 600))
+NEWS_CACHE_SECONDS = int(os.environ.get('NEWS_CACHE_SECONDS', 900))
+QUOTE_CACHE_SECONDS = int(os.environ.get('QUOTE_CACHE_SECONDS', 60))
+GEOCODING_CACHE_SECONDS = int(os.environ.get('GEOCODING_CACHE_SECONDS', 86400))
+# Weather, news and geocoding results are also kept in the storage backend so
+# every worker process shares them (see app.utils.cache)
+SHARED_CACHE_ENABLED = os.environ.get('SHARED_CACHE_ENABLED', 'True') == 'True'
+
+# Last successful widget data, shown with an "offline" note when the live
+# path fails (see app.utils.snapshot)
+DASHBOARD_SNAPSHOT_PATH = os.environ.get('DASHBOARD_SNAPSHOT_PATH', str(BASE_DIR / 'dashboard_snapshot.json'))
+# Each widget's snapshot is rewritten at most this often
+DASHBOARD_SNAPSHOT_MIN_INTERVAL_SECONDS = int(os.environ.get('DASHBOARD_SNAPSHOT_MIN_INTERVAL_SECONDS', 30))
+# After a failure the live path is retried only after this long
+DASHBOARD_RETRY_SECONDS = int(os.environ.get('DASHBOARD_RETRY_SECONDS', 30))
+# Weather and news answers slower than this are replaced by the snapshot
+# (the fetch finishes in the background); 0 waits as long as the API takes
+DASHBOARD_LIVE_DEADLINE_SECONDS = float(os.environ.get('DASHBOARD_LIVE_DEADLINE_SECONDS', 2))
+
+# Daily request quotas per upstream provider (0 = unlimited). Calls draw on a
+# token bucket in the storage backend shared by all workers (see app.utils.quota)
+UPSTREAM_QUOTA_ENABLED = os.environ.get('UPSTREAM_QUOTA_ENABLED', 'True') == 'True'
+UPSTREAM_DAILY_QUOTAS = {
+    'openweather': int(os.environ.get('OPENWEATHER_DAILY_QUOTA', 1000)),
+    'newsapi': int(os.environ.get('NEWSAPI_DAILY_QUOTA', 100)),
+}
+# Most of the daily quota that may be spent at once
+UPSTREAM_QUOTA_BURST_FRACTION = float(os.environ.get('UPSTREAM_QUOTA_BURST_FRACTION', 0.05))
+# Part of that burst kept for background refreshes
+UPSTREAM_QUOTA_RESERVE_FRACTION = float(os.environ.get('UPSTREAM_QUOTA_RESERVE_FRACTION', 0.25))
+# Pause after a 429 response that has no usable Retry-After header
+UPSTREAM_THROTTLE_SECONDS = int(os.environ.get('UPSTREAM_THROTTLE_SECONDS', 60))
+
+# Identical upstream fetches running at the same time share one request
+# (see app.utils.singleflight); with SINGLEFLIGHT_SHARED, worker processes
+# coordinate through the storage backend as well
+SINGLEFLIGHT_SHARED = os.environ.get('SINGLEFLIGHT_SHARED', 'True') == 'True'
+# Longest a fetch may hold its claim before another process takes over
+SINGLEFLIGHT_TIMEOUT_SECONDS = float(os.environ.get('SINGLEFLIGHT_TIMEOUT_SECONDS', 15))
+# How long a finished result stays readable for processes that were waiting
+SINGLEFLIGHT_RESULT_SECONDS = float(os.environ.get('SINGLEFLIGHT_RESULT_SECONDS', 5))
+SINGLEFLIGHT_POLL_MS = int(os.environ.get('SINGLEFLIGHT_POLL_MS', 50))
+
+# Open connections and fill the caches in the background when a server
+# process starts (otherwise the first /readyz probe starts the warm-up);
+# other manage.py commands never warm up
+WARMUP_ON_STARTUP = os.environ.get('WARMUP_ON_STARTUP', 'False') == 'True'
+# /readyz pings the storage backend at most this often
+HEALTH_CHECK_MAX_AGE_SECONDS = float(os.environ.get('HEALTH_CHECK_MAX_AGE_SECONDS', 5))
+
+# Parsed events kept in memory, keyed by event id and version
+EVENT_CACHE_SIZE = int(os.environ.get('EVENT_CACHE_SIZE', 10000))
+
+# Calendar delta sync settings
+# Changes newer than this are re-sent on the next poll in case an earlier
+# version is still being written
+CALENDAR_SYNC_SETTLE_SECONDS = int(os.environ.get('CALENDAR_SYNC_SETTLE_SECONDS', 5))
+CALENDAR_SYNC_PAGE_SIZE = int(os.environ.get('CALENDAR_SYNC_PAGE_SIZE', 500))
+# Tombstones of deleted events are kept this long before compaction
+CALENDAR_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('CALENDAR_TOMBSTONE_RETENTION_DAYS', 30))
+
+# Batch event mutation settings
+CALENDAR_BATCH_MAX_OPERATIONS = int(os.environ.get('CALENDAR_BATCH_MAX_OPERATIONS', 1000))
+# Default atomicity when a batch does not say; atomic batches need a replica set
+CALENDAR_BATCH_ATOMIC = os.environ.get('CALENDAR_BATCH_ATOMIC', 'False') == 'True'
+# Events written per bulk upsert when importing .ics files
+CALENDAR_IMPORT_BATCH_SIZE = int(os.environ.get('CALENDAR_IMPORT_BATCH_SIZE', 500))
+
+# Event search backend: StorageSearchBackend uses the event store's index,
+# InvertedIndexSearchBackend keeps an in-process index that follows the change feed
+CALENDAR_SEARCH_BACKEND = os.environ.get('CALENDAR_SEARCH_BACKEND', 'app.utils.search.StorageSearchBackend')
+CALENDAR_SEARCH_MAX_PAGE_SIZE = 100
+
+# Longest look-ahead allowed for the priority agenda endpoint
+CALENDAR_AGENDA_MAX_DAYS = 366
+
+# First day of the week in calendar grids (0 = Monday, 6 = Sunday)
+CALENDAR_FIRST_WEEKDAY = int(os.environ.get('CALENDAR_FIRST_WEEKDAY', 0))
+
+# Reminder daemon settings (see the run_reminders command)
+REMINDER_LEAD_MINUTES = int(os.environ.get('REMINDER_LEAD_MINUTES', 15))
+# All-day events are reminded relative to this time on their day
+REMINDER_ALL_DAY_TIME = os.environ.get('REMINDER_ALL_DAY_TIME', '09:00')
+# Reminders missed by less than this (e.g. during a restart) are still sent
+REMINDER_GRACE_MINUTES = int(os.environ.get('REMINDER_GRACE_MINUTES', 10))
+# How often the daemon reads the calendar change feed
+REMINDER_POLL_SECONDS = int(os.environ.get('REMINDER_POLL_SECONDS', 30))
+REMINDER_SINKS = [
+    'app.utils.reminders.LogSink',
+]
 
 
 # Password validation
@@ -102,7 +254,34 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
-# Internationalization
+# Logging: records are written to stderr by a background thread so request
+# threads never block on log I/O. LOG_FORMAT is 'text' or 'json'; repeats of
+# the same message at WARNING and below are sampled 1 in LOG_SAMPLE_RATE.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+LOG_SAMPLE_RATE = int(os.environ.get('LOG_SAMPLE_RATE', 1))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+        'json': {'()': 'app.utils.log.JsonFormatter'},
+    },
+    'filters': {
+        'sampling': {'()': 'app.utils.log.SamplingFilter', 'rate': LOG_SAMPLE_RATE},
+    },
+    'handlers': {
+        'background': {
+            'class': 'app.utils.log.BackgroundStreamHandler',
+            'formatter': LOG_FORMAT,
+            'filters': ['sampling'],
+        },
+    },
+    'loggers': {
+        'app': {'handlers': ['background'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
 LANGUAGE_CODE = 'en-us'